@@ -0,0 +1,112 @@
+# AsyncEchoServer.py
+
+# asyncio engine for MultiConnEchoServer.py, selected with:   --engine asyncio
+# Example commands to run this engine: python3 MultiConnEchoServer.py 127.0.0.1 65432 --engine asyncio
+
+# It has the same echo semantics as the selectors engine (accept(), serve() and start_listen_connections()),
+#   but the event loop, the non-blocking sockets and the output buffers are handled by asyncio:
+#   - each connection gets an EchoProtocol, whose data_received() writes the received bytes back to its transport
+#   - the transport buffers what could not be sent yet; once that buffer passes high_water bytes, asyncio calls
+#     pause_writing(), and the protocol stops reading from the client socket with transport.pause_reading()
+#   - once the buffer drains below low_water bytes, asyncio calls resume_writing(), and reading resumes
+# This way a client that sends faster than it reads cannot make the server buffer without bound
+# With --framed, received bytes go through a FrameParser (see EchoFraming.py), and the complete messages found in
+#   one data_received() call are written back together with transport.writelines()
+# With --tls, asyncio does the handshakes, and connection_made() is only called once a handshake is complete
+
+import asyncio
+
+from EchoStats import log, message_log
+from EchoBuffer import HIGH_WATER, LOW_WATER
+from EchoFraming import FrameParser, encode_frame
+from EchoCounters import (ACCEPTS, CLOSES, BYTES_IN, BYTES_OUT, READ_PAUSES, READ_RESUMES, FRAMES, TLS_HANDSHAKES,
+                          TLS_RESUMED)
+
+class EchoProtocol(asyncio.Protocol):
+    def __init__(self, counters, high_water, low_water, framed=False):
+        self.counters = counters
+        self.high_water = high_water
+        self.low_water = low_water
+        # parser is only used in framed mode
+        self.parser = FrameParser() if framed else None
+        self.transport = None
+        self.addr = None
+
+    # Called once the connection established by a client socket is accepted
+    def connection_made(self, transport):
+        self.transport = transport
+        self.addr = transport.get_extra_info('peername')
+        # Backpressure: pause_writing() is called above high_water buffered bytes, resume_writing() below low_water
+        transport.set_write_buffer_limits(high=self.high_water, low=self.low_water)
+        self.counters[ACCEPTS] += 1
+        log.info('Server accepts connection from %s', self.addr)
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None:
+            self.counters[TLS_HANDSHAKES] += 1
+            if ssl_object.session_reused:
+                self.counters[TLS_RESUMED] += 1
+
+    # Called with the bytes received from the client socket, which are echoed back right away
+    # transport.write() sends what it can immediately and buffers the rest until the client socket is writable
+    def data_received(self, data):
+        self.counters[BYTES_IN] += len(data)
+        if self.parser is not None:
+            self.echo_frames(data)
+            return
+        self.transport.write(data)
+        self.counters[BYTES_OUT] += len(data)
+        if message_log.enabled and message_log.sample():
+            log.debug('Server echos message: %r to %s', data, self.addr)
+
+    # Framed mode: echo every complete message received so far, all of them with one writelines() call
+    # A message larger than EchoFraming.MAX_FRAME_SIZE closes the connection
+    def echo_frames(self, data):
+        self.parser.feed(data)
+        try:
+            payloads = self.parser.frames()
+        except ValueError:
+            self.transport.close()
+            return
+        frames = [encode_frame(payload) for payload in payloads]
+        self.transport.writelines(frames)
+        for payload, frame in zip(payloads, frames):
+            self.counters[BYTES_OUT] += len(frame)
+            self.counters[FRAMES] += 1
+            if message_log.enabled and message_log.sample():
+                log.debug('Server echos message: %r to %s', payload, self.addr)
+
+    # Called when the client socket closed its side of the connection
+    # Returning None makes the transport close the connection once the buffered bytes are sent
+    def eof_received(self):
+        return None
+
+    def connection_lost(self, exc):
+        self.counters[CLOSES] += 1
+        log.info('Server closes connection to %s', self.addr)
+
+    # The write buffer is above high_water bytes: stop reading until the client socket catches up
+    def pause_writing(self):
+        self.counters[READ_PAUSES] += 1
+        self.transport.pause_reading()
+
+    # The write buffer drained below low_water bytes: resume reading
+    def resume_writing(self):
+        self.counters[READ_RESUMES] += 1
+        self.transport.resume_reading()
+
+# Serve connections accepted by serverSocket (already bound and listening) until cancelled
+# ssl_context, if not None, is the SSLContext of the TLS connections (see EchoTls.py)
+async def serve_forever(serverSocket, counters, high_water, low_water, framed, ssl_context=None):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: EchoProtocol(counters, high_water, low_water, framed), sock=serverSocket,
+                                      ssl=ssl_context)
+    async with server:
+        await server.serve_forever()
+
+# asyncio counterpart of start_listen_connections() in MultiConnEchoServer.py
+# Keeps running until an user keyboard input interrupts this program
+def start_async_server(serverSocket, counters, high_water=HIGH_WATER, low_water=LOW_WATER, framed=False, ssl_context=None):
+    try:
+        asyncio.run(serve_forever(serverSocket, counters, high_water, low_water, framed, ssl_context))
+    except KeyboardInterrupt:
+        print('Caught user keyboard interrupt, exiting')
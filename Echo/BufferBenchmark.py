@@ -0,0 +1,84 @@
+# BufferBenchmark.py
+
+# Example commands to run this program: python3 BufferBenchmark.py
+# Example commands to run this program with custom backlog sizes (in KB): python3 BufferBenchmark.py --backlogs 64 1024 65536 262144
+
+# Compares the per-byte cost of the two ways of buffering output for a slow peer:
+#   - bytes: the previous data.outb handling, with   outb += recv_data   and   outb = outb[sent:]
+#   - EchoBuffer: the ring buffer (bytearray + recv_into + memoryview) used by MultiConnEchoServer.py (see EchoBuffer.py)
+# For each backlog size, the buffer is first filled with that many bytes (the data queued for a slow peer),
+#   then each step receives one chunk and sends one chunk, so the backlog stays the same size
+# A flat "ns/byte" column as the backlog grows means that the cost does not depend on how much is queued
+
+import time
+import argparse
+
+from EchoBuffer import EchoBuffer
+
+# Stand-in for a socket, which receives and sends at most chunk_size bytes per call, like a slow peer would
+class SlowPeer:
+    def __init__(self, chunk_size):
+        self.chunk = b'x' * chunk_size
+
+    def recv(self, num_bytes):
+        return self.chunk[:num_bytes]
+
+    def recv_into(self, buffer, num_bytes):
+        num_bytes = min(num_bytes, len(self.chunk))
+        buffer[:num_bytes] = self.chunk[:num_bytes]
+        return num_bytes
+
+    def send(self, data):
+        return min(len(data), len(self.chunk))
+
+# Time num_steps receive/send steps with a backlog of backlog bytes, buffered in a bytes object
+# Returns the number of nanoseconds spent per byte moved through the buffer
+def bench_bytes(backlog, chunk_size, num_steps):
+    peer = SlowPeer(chunk_size)
+    outb = b'x' * backlog
+
+    start = time.perf_counter_ns()
+    for i in range(num_steps):
+        outb += peer.recv(chunk_size)
+        sent = peer.send(outb)
+        outb = outb[sent:]
+    elapsed = time.perf_counter_ns() - start
+    return elapsed / (num_steps * chunk_size)
+
+# Same as bench_bytes(), but buffered in an EchoBuffer
+def bench_echo_buffer(backlog, chunk_size, num_steps):
+    peer = SlowPeer(chunk_size)
+    outb = EchoBuffer()
+    outb.write(b'x' * backlog)
+    # Growing the buffer to hold the backlog is part of building the backlog, not of the steps being timed
+    outb.reserve(chunk_size)
+
+    start = time.perf_counter_ns()
+    for i in range(num_steps):
+        outb.recv_into(peer, chunk_size)
+        sent = peer.send(outb.readable())
+        outb.consume(sent)
+    elapsed = time.perf_counter_ns() - start
+    return elapsed / (num_steps * chunk_size)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-byte cost of output buffering as the backlog grows')
+    parser.add_argument('--backlogs', type=int, nargs='+', default=[64, 1024, 16384, 65536, 262144],
+                        help='backlog sizes to measure, in KB (default: 64KB up to 256MB)')
+    parser.add_argument('--chunk-size', type=int, default=65536,
+                        help='number of bytes received and sent per step (default: 65536)')
+    parser.add_argument('--steps', type=int, default=200, help='number of steps timed per backlog size (default: 200)')
+    # The bytes version copies the whole backlog on every step, so it is skipped for the largest backlogs by default
+    parser.add_argument('--bytes-max', type=int, default=65536,
+                        help='largest backlog (in KB) measured with the bytes version (default: 65536)')
+    args = parser.parse_args()
+
+    print(f'{"backlog":>12} {"bytes ns/byte":>15} {"EchoBuffer ns/byte":>20}')
+    for backlog_kb in args.backlogs:
+        backlog = backlog_kb * 1024
+        if backlog_kb <= args.bytes_max:
+            bytes_cost = f'{bench_bytes(backlog, args.chunk_size, args.steps):15.3f}'
+        else:
+            bytes_cost = f'{"skipped":>15}'
+        buffer_cost = bench_echo_buffer(backlog, args.chunk_size, args.steps)
+        print(f'{backlog_kb:>10}KB {bytes_cost} {buffer_cost:20.3f}')
@@ -0,0 +1,117 @@
+# ConnectBenchmark.py
+
+# Example commands to run this program: python3 ConnectBenchmark.py
+# Example commands to run this program with a bigger storm: python3 ConnectBenchmark.py --connections 10000 --accept-batches 1 64 256
+
+# Connection storm benchmark of the selectors engine of MultiConnEchoServer.py
+# For each --accept-batch value, a server is started in its own process, then all the client sockets connect at once
+#   (like thousands of clients reconnecting after a network failure), and each one sends a single byte
+# A connection counts as absorbed once that byte is echoed back, which means the server accepted it and served it
+# The accepts per wakeup of the server socket are read from its stats socket (see setup_stats_socket())
+
+import json
+import time
+import socket
+import argparse
+import resource
+import selectors
+
+from EngineBenchmark import start_server, stop_server
+from LatencyHistogram import LatencyHistogram
+
+# Connect num_conns client sockets to (host, port) all at once, and wait up to timeout seconds for every one of them
+#   to have its byte echoed back
+def run_storm(host, port, num_conns, timeout=10):
+    selector = selectors.DefaultSelector()
+    latency = LatencyHistogram()
+    # Every client socket stays open until the end, like clients that reconnected to stay connected
+    socks = []
+    start = time.perf_counter()
+    for i in range(num_conns):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        socks.append(sock)
+        sock.connect_ex((host, port))
+        # The byte is sent once the socket is connected: often right away (the handshake of a local connection
+        #   usually completes during connect_ex()), otherwise once the socket is writable
+        try:
+            sock.send(b'x')
+            selector.register(sock, selectors.EVENT_READ, data=None)
+        except OSError:
+            selector.register(sock, selectors.EVENT_WRITE, data=None)
+    connect_seconds = time.perf_counter() - start
+
+    pending = num_conns
+    errors = 0
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for key, mask in selector.select(timeout=0.1):
+            sock = key.fileobj
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error:
+                        raise OSError(error, 'connect failed')
+                    sock.send(b'x')
+                    selector.modify(sock, selectors.EVENT_READ, data=None)
+                    continue
+                if not sock.recv(1):
+                    raise ConnectionError('closed by the server')
+                latency.record(int((time.perf_counter() - start) * 1e6))
+            except OSError:
+                errors += 1
+            selector.unregister(sock)
+            pending -= 1
+    elapsed = time.perf_counter() - start
+
+    for sock in socks:
+        sock.close()
+    selector.close()
+    return {
+        'connections': num_conns,
+        'absorbed': latency.total,
+        'errors': errors,
+        'unanswered': pending,
+        'connect_seconds': round(connect_seconds, 3),
+        'seconds': round(elapsed, 3),
+        'absorbed_at_ms': {name: round(value / 1000, 1) for name, value in latency.summary().items() if name != 'count'},
+    }
+
+# Return the statistics served by a server on its stats socket
+def read_stats(host, stats_port):
+    with socket.create_connection((host, stats_port), timeout=5) as sock:
+        answer = b''
+        while chunk := sock.recv(65536):
+            answer += chunk
+    return json.loads(answer)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Connection storm benchmark of MultiConnEchoServer.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the servers bind to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65432, help='port number the servers bind to (default: 65432)')
+    parser.add_argument('--connections', type=int, default=10000, help='number of client sockets connecting at once (default: 10000)')
+    parser.add_argument('--accept-batches', type=int, nargs='+', default=[1, 64],
+                        help='--accept-batch values to compare (default: 1 64)')
+    args, server_args = parser.parse_known_args()
+
+    # Every client socket is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections + 16 > hard:
+        parser.error(f'--connections is too high for the limit of {hard} open files')
+
+    print(f'{"batch":>6} {"absorbed":>9} {"errors":>7} {"seconds":>8} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8} {"accepts/wakeup":>15}')
+    for accept_batch in args.accept_batches:
+        # Any unknown option is passed on to the servers, e.g. --backlog 1024
+        server = start_server(args.host, args.port, 'selectors',
+                              ['--accept-batch', str(accept_batch), '--log-level', 'warning',
+                               '--stats-port', str(args.port + 1)] + server_args)
+        try:
+            results = run_storm(args.host, args.port, args.connections)
+            loop = read_stats(args.host, args.port + 1)['loop']
+        finally:
+            stop_server(server)
+
+        absorbed_at = results['absorbed_at_ms']
+        print(f'{accept_batch:>6} {results["absorbed"]:>9} {results["errors"] + results["unanswered"]:>7} {results["seconds"]:>8} '
+              f'{absorbed_at["p50"]:>8} {absorbed_at["p99"]:>8} {absorbed_at["max"]:>8} {loop["accepts_per_wakeup"]["mean"]:>15}')
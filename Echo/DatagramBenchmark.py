@@ -0,0 +1,85 @@
+# DatagramBenchmark.py
+
+# Example commands to run this program: python3 DatagramBenchmark.py
+# Example commands to run this program with more load: python3 DatagramBenchmark.py --clients 100 --pipeline 16 --duration 10
+# Example commands to run this program at a fixed rate: python3 DatagramBenchmark.py --rate 20000
+
+# Side by side benchmark of the UDP echo server (UdpEchoServer.py) and the TCP echo server (MultiConnEchoServer.py)
+# Both servers are started in their own process and loaded with the same number of clients (client sockets or
+#   connections), payload size, pipeline depth and duration, by the load generation modes of UdpEchoClient.py
+#   (see run_udp_benchmark()) and MultiConnEchoClient.py (see run_benchmark())
+# The server output (and the statistics the UDP server writes on exit) is discarded, so that printing to the terminal
+#   does not limit the results
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+
+from EngineBenchmark import start_server, stop_server
+from UdpEchoClient import run_udp_benchmark
+from MultiConnEchoClient import run_benchmark
+
+# Start UdpEchoServer.py on (host, port), and wait until it echoes a datagram
+def start_udp_server(host, port, extra_args):
+    server = subprocess.Popen(
+        [sys.executable, 'UdpEchoServer.py', host, str(port), '--log-level', 'warning', '--stats-file', os.devnull]
+        + extra_args,
+        stdout=subprocess.DEVNULL,
+    )
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.settimeout(0.1)
+        probe.connect((host, port))
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                probe.send(b'ping')
+                probe.recv(16)
+                return server
+            except OSError:
+                # Refused (not bound yet) or timed out
+                time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f'UDP server did not start echoing on {(host, port)}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare UdpEchoServer.py with MultiConnEchoServer.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the servers bind to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65432, help='port number the servers bind to (default: 65432)')
+    parser.add_argument('--clients', type=int, default=50, help='number of client sockets or connections (default: 50)')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes per datagram or request (default: 64)')
+    parser.add_argument('--pipeline', type=int, default=4, help='maximum datagrams or requests in flight per client (default: 4)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='total datagrams or requests per second, 0 for closed loop (default: 0)')
+    parser.add_argument('--duration', type=float, default=5, help='duration of each run in seconds (default: 5)')
+    # Any unknown option is passed on to the UDP server, e.g. --batch 256
+    args, server_args = parser.parse_known_args()
+
+    print(f'{"transport":<10} {"msgs/s":>12} {"MB/s":>10} {"p50 us":>10} {"p99 us":>10} {"p99.9 us":>10} {"loss %":>8}')
+    for transport in ('udp', 'tcp'):
+        if transport == 'udp':
+            server = start_udp_server(args.host, args.port, server_args)
+        else:
+            server = start_server(args.host, args.port, 'selectors', ['--log-level', 'warning'])
+        try:
+            if transport == 'udp':
+                results = run_udp_benchmark(args.host, args.port, args.clients, args.payload_size,
+                                            args.pipeline, args.rate, args.duration)
+                loss = results['loss_pct']
+            else:
+                results = run_benchmark(args.host, args.port, args.clients, args.payload_size,
+                                        args.pipeline, args.rate, args.duration)
+                # TCP retransmits whatever is lost, so losses only show as latency
+                loss = 0
+        finally:
+            if transport == 'udp':
+                server.terminate()
+                server.wait()
+            else:
+                stop_server(server)
+
+        latency = results['latency_us']
+        print(f'{transport:<10} {results["msgs_per_sec"]:>12} {results["mb_per_sec"]:>10} '
+              f'{latency["p50"]:>10} {latency["p99"]:>10} {latency["p99.9"]:>10} {loss:>8}')
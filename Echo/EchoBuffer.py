@@ -0,0 +1,185 @@
+# EchoBuffer.py
+
+# EchoBuffer is the per-connection byte buffer shared by MultiConnEchoServer.py and MultiConnEchoClient.py
+# It replaces the bytes objects previously used for data.outb, where
+#   data.outb += recv_data   and   data.outb = data.outb[sent:]
+#   copied the whole remaining buffer on every receive and on every partial send
+# Instead, EchoBuffer is a ring buffer over one preallocated bytearray:
+#   - new bytes are received straight into its free space with socket.recv_into()
+#   - pending bytes are sent with memoryview slices, so a partial send only moves the start offset forward
+# Pending bytes are never moved while they fit in the bytearray; they are only copied once when the
+#   bytearray has to grow (to at least twice its size), so the cost per byte does not depend on the backlog
+# Most connections are idle most of the time, so the bytearray is only allocated when bytes are about to be written,
+#   and it is released as soon as the buffer is empty again: buffers of POOL_BUFFER_SIZE bytes go back to
+#   buffer_pool to be reused by the next connection that needs one, and bigger ones are freed
+# An idle connection then costs one EchoBuffer object and no storage at all
+
+# Default watermarks (in bytes) for the output buffered per connection by the echo servers:
+#   reading from a client pauses once HIGH_WATER bytes wait to be sent to it,
+#   and resumes once they drain below LOW_WATER bytes
+HIGH_WATER = 256 * 1024
+LOW_WATER = 64 * 1024
+
+# Size (in bytes) of the bytearrays kept in buffer_pool; storage requests up to this size get a whole pooled bytearray
+# The servers receive up to 64KB at a time (RECV_SIZE in MultiConnEchoServer.py and LocalBroker.py), and reserve
+#   that much free space before every receive: twice that size lets a buffer with up to 64KB still pending receive
+#   again without growing out of the pool, which it otherwise would as soon as a single byte was pending
+POOL_BUFFER_SIZE = 128 * 1024
+
+# Default maximum number of bytearrays kept in buffer_pool (so at most 16MB held by buffers not in use)
+POOL_MAX_BUFFERS = 128
+
+# Pool of free bytearrays of the same size, shared by every EchoBuffer of this process
+class BufferPool:
+    def __init__(self, buffer_size=POOL_BUFFER_SIZE, max_buffers=POOL_MAX_BUFFERS):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.free = []
+
+    # Return a bytearray of at least num_bytes bytes: a pooled one if num_bytes fits in buffer_size,
+    #   a new one otherwise
+    def acquire(self, num_bytes):
+        if num_bytes > self.buffer_size:
+            return bytearray(num_bytes)
+        if self.free:
+            return self.free.pop()
+        return bytearray(self.buffer_size)
+
+    # Give back a bytearray that is no longer used; it is kept for reuse if it has the pooled size and there is room
+    # Its content is not cleared, since an EchoBuffer never reads bytes it did not write
+    def release(self, data):
+        if len(data) == self.buffer_size and len(self.free) < self.max_buffers:
+            self.free.append(data)
+
+buffer_pool = BufferPool()
+
+# Storage of every EchoBuffer without pending bytes
+EMPTY = bytearray()
+EMPTY_VIEW = memoryview(EMPTY)
+
+class EchoBuffer:
+    # __slots__ instead of a per-object __dict__, since there is one EchoBuffer per connection
+    __slots__ = ('_data', '_view', '_start', '_size', '_capacity')
+
+    def __init__(self, capacity=4096):
+        # _data is the storage (EMPTY until bytes are written), and _view a memoryview over it used for zero-copy slicing
+        # The _size pending bytes start at _start, and wrap around to the front of _data when they reach its end
+        # _capacity is the minimum size of the storage once it is allocated
+        self._data = EMPTY
+        self._view = EMPTY_VIEW
+        self._start = 0
+        self._size = 0
+        self._capacity = capacity
+
+    # Number of pending bytes in the buffer
+    def __len__(self):
+        return self._size
+
+    # An EchoBuffer is "true" when it has pending bytes, just like a non-empty bytes object
+    def __bool__(self):
+        return self._size > 0
+
+    # Total number of bytes the buffer can currently hold without allocating new storage (0 while it has no storage)
+    def capacity(self):
+        return len(self._data)
+
+    # Return a memoryview of the pending bytes up to the end of the bytearray (no copy is made)
+    # If the pending bytes wrap around, the rest is returned by the next call, after .consume()
+    # The memoryview is only valid until the next call that writes to the buffer
+    def readable(self):
+        end = self._start + self._size
+        if end > len(self._data):
+            end = len(self._data)
+        return self._view[self._start:end]
+
+    # Return the first num_bytes pending bytes (at most len(self) bytes)
+    # This is a memoryview (no copy) when they do not wrap around, and a bytes copy otherwise
+    def peek(self, num_bytes):
+        first = self.readable()
+        if num_bytes <= len(first):
+            return first[:num_bytes]
+        rest = min(num_bytes, self._size) - len(first)
+        return first.tobytes() + self._view[0:rest].tobytes()
+
+    # Discard the first num_bytes pending bytes, usually after they have been sent
+    def consume(self, num_bytes):
+        self._size -= num_bytes
+        if self._size == 0:
+            # Once everything is consumed, the storage is not needed anymore
+            self._release()
+        else:
+            self._start = (self._start + num_bytes) % len(self._data)
+
+    # Give the storage back to buffer_pool, once there are no pending bytes left
+    def _release(self):
+        if self._data is not EMPTY:
+            buffer_pool.release(self._data)
+            self._data = EMPTY
+            self._view = EMPTY_VIEW
+        self._start = 0
+
+    # Make sure there are at least num_bytes bytes of free space in the buffer
+    def reserve(self, num_bytes):
+        if len(self._data) - self._size >= num_bytes:
+            return
+
+        # No storage yet: get one from buffer_pool
+        if self._data is EMPTY:
+            self._data = buffer_pool.acquire(max(self._capacity, num_bytes))
+            self._view = memoryview(self._data)
+            return
+
+        # Not enough room: allocate a bigger bytearray (at least twice as big) and copy the pending bytes over,
+        #   unwrapped, to its front
+        new_data = buffer_pool.acquire(max(2 * len(self._data), self._size + num_bytes))
+        first = self.readable()
+        new_data[0:len(first)] = first
+        new_data[len(first):self._size] = self._view[0:self._size - len(first)]
+        buffer_pool.release(self._data)
+        self._data = new_data
+        self._view = memoryview(self._data)
+        self._start = 0
+
+    # Return a memoryview of the free space right after the pending bytes, up to the end of the bytearray
+    #   or up to the start of the pending bytes if they wrap around
+    def _writable(self):
+        tail = self._start + self._size
+        if tail < len(self._data):
+            return self._view[tail:]
+        tail -= len(self._data)
+        return self._view[tail:self._start]
+
+    # Append a copy of data (bytes, bytearray or memoryview) to the pending bytes
+    def write(self, data):
+        num_bytes = len(data)
+        self.reserve(num_bytes)
+        free = self._writable()
+        if num_bytes <= len(free):
+            free[:num_bytes] = data
+        else:
+            # The data wraps around: fill up to the end of the bytearray, then continue from its front
+            data = memoryview(data)
+            free[:] = data[:len(free)]
+            self._view[0:num_bytes - len(free)] = data[len(free):]
+        self._size += num_bytes
+
+    # Receive up to num_bytes bytes from sock directly into the free space of the buffer
+    # Fewer bytes may be received when the free space wraps around; the rest is received by the next call
+    # Returns the number of bytes received, which is 0 when the peer closed the connection
+    def recv_into(self, sock, num_bytes):
+        self.reserve(num_bytes)
+        free = self._writable()
+        num_bytes = min(num_bytes, len(free))
+        try:
+            received = sock.recv_into(free[:num_bytes], num_bytes)
+        except OSError:
+            # Nothing received (for example only TLS records without application data, see EchoTls.py):
+            #   do not keep the storage just reserved for it
+            if not self._size:
+                self._release()
+            raise
+        self._size += received
+        if not self._size:
+            # Nothing received (the peer closed the connection) into an empty buffer
+            self._release()
+        return received
@@ -1,11 +1,76 @@
 # EchoClient.py
 
+# Example commands to run this program: python3 EchoClient.py
+# Example commands to run this program in bulk mode: python3 EchoClient.py --bulk file.bin
+# *Note: The server side program (EchoServer.py) has to run first, with --bulk for bulk mode
+
+import os
+import time
 import socket
+import struct
+import argparse
+
+# Bulk mode (--bulk FILE, with EchoServer.py --bulk): the file is streamed to the server socket with socket.sendfile(),
+#   which uses the kernel's sendfile() where available, so its bytes go from the page cache to the socket
+#   without ever being copied through this program; --no-sendfile streams it with read() and sendall() instead,
+#   buffer_size bytes at a time, to compare the two
+# The file is preceded by its size as an 8-byte header, and the server answers with the number of bytes it received
+#   (see EchoServer.py)
+BULK_HEADER = struct.Struct('!Q')
+
+# Default number of bytes read and sent per call with --no-sendfile
+BULK_BUFFER_SIZE = 1024 * 1024
+
+# Bulk mode: stream the file at path to clientSocket, then wait for the server to confirm how many bytes it received
+# Returns (bytes sent, bytes received by the server, seconds elapsed)
+def send_bulk(clientSocket, path, use_sendfile=True, buffer_size=BULK_BUFFER_SIZE):
+    size = os.path.getsize(path)
+    print(f'Sending {size} bytes from {path}')
+
+    start = time.perf_counter()
+    clientSocket.sendall(BULK_HEADER.pack(size))
+    with open(path, 'rb') as file:
+        if use_sendfile:
+            sent = clientSocket.sendfile(file, 0, size)
+        else:
+            # User space copy: every chunk is read into a buffer, then copied again into the socket
+            sent = 0
+            view = memoryview(bytearray(buffer_size))
+            while sent < size:
+                count = file.readinto(view)
+                if not count:
+                    break
+                clientSocket.sendall(view[:count])
+                sent += count
+
+    # The server answers once everything arrived, so the elapsed time covers the whole transfer
+    answer = b''
+    while len(answer) < BULK_HEADER.size:
+        chunk = clientSocket.recv(BULK_HEADER.size - len(answer))
+        if not chunk:
+            break
+        answer += chunk
+    elapsed = time.perf_counter() - start
+    confirmed = BULK_HEADER.unpack(answer)[0] if len(answer) == BULK_HEADER.size else 0
+    return sent, confirmed, elapsed
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Echo client')
+    # host is the IP address of the server we will be connecting to
+    parser.add_argument('--host', default='127.0.0.1', help='IP address of the server socket (default: 127.0.0.1)')
+    # port is the port number of the server we will be connecting to
+    parser.add_argument('--port', type=int, default=65432, help='port number of the server socket (default: 65432)')
+    parser.add_argument('--bulk', metavar='FILE', help='stream FILE to EchoServer.py --bulk instead of sending a message')
+    parser.add_argument('--no-sendfile', action='store_true',
+                        help='bulk mode: stream the file with read() and sendall() instead of socket.sendfile()')
+    parser.add_argument('--buffer-size', type=int, default=BULK_BUFFER_SIZE,
+                        help=f'bulk mode with --no-sendfile: bytes read and sent per call (default: {BULK_BUFFER_SIZE})')
+    parser.add_argument('--sndbuf', type=int, default=0,
+                        help='bulk mode: SO_SNDBUF of the socket in bytes, 0 for the system default (default: 0)')
+    return parser.parse_args()
 
-# host is the IP address of the server we will be connecting to
-host = '127.0.0.1' 
-# port is the port number of the server we will be connecting to
-port = 65432
+args = parse_arguments()
 
 # Use "with ... as ..." statement here to handle possible exceptions
 # Also, when using this statement, there is no need to manually close the clientSocket
@@ -13,18 +78,27 @@ port = 65432
 # socket.SOCK_STREAM means that the protocol used is TCP (Transmission Control Protocol)
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as clientSocket:
     print('Client socket created')
+    if args.sndbuf:
+        clientSocket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, args.sndbuf)
     # .connect() establishs connection between the clientSocket and server socket
-    clientSocket.connect((host, port))
+    clientSocket.connect((args.host, args.port))
     print('Connected with server socket')
-    # .sendall() allows the clientSocket to send bytes of data to the connected server socket
-    clientSocket.sendall(b'Hello, world')
-    # .recv(1024) allows the clientSocket to receive up to 1024 bytes of data sent by the connected server socket
-    dataReceived = clientSocket.recv(1024)
+    if args.bulk:
+        sent, confirmed, elapsed = send_bulk(clientSocket, args.bulk, not args.no_sendfile, args.buffer_size)
+    else:
+        # .sendall() allows the clientSocket to send bytes of data to the connected server socket
+        clientSocket.sendall(b'Hello, world')
+        # .recv(1024) allows the clientSocket to receive up to 1024 bytes of data sent by the connected server socket
+        dataReceived = clientSocket.recv(1024)
 
 print('Client socket closed')
 
-# Unlike the script for the server socket, the "with...as..." statement here only executes once,
-#   and upon completion clientSocket will be closed
-# After clientSocket closes, print out the byte data received from connected server socket
-# We still have access to dataReceived since the "with" statement does not create a scope
-print(f'Received from server: {dataReceived!r}')
+if args.bulk:
+    print(f'Sent {sent} bytes, {confirmed} received by the server, in {elapsed:.3f}s: '
+          f'{confirmed / max(elapsed, 1e-9) / 1e6:.1f} MB/s')
+else:
+    # Unlike the script for the server socket, the "with...as..." statement here only executes once,
+    #   and upon completion clientSocket will be closed
+    # After clientSocket closes, print out the byte data received from connected server socket
+    # We still have access to dataReceived since the "with" statement does not create a scope
+    print(f'Received from server: {dataReceived!r}')
@@ -0,0 +1,33 @@
+# EchoCounters.py
+
+# Names of the counters kept by the echo servers, and their index in a counters sequence
+# A counters sequence is anything indexable holding len(COUNTER_NAMES) integers:
+#   - a plain list, in single process mode (see new_counters())
+#   - a slice of shared memory, in worker mode (see start_workers() in MultiConnEchoServer.py),
+#     so that the supervisor process can add up the counters of all its workers
+# Both server engines (MultiConnEchoServer.py and AsyncEchoServer.py) update the same counters
+
+# read_pauses: reading from a connection paused because its buffered output passed the high watermark
+# budget_pauses: reading from a connection paused because the output buffered by all connections passed the memory budget
+# read_resumes: reading from a paused connection resumed
+# send_calls: send() or sendmsg() calls made, to compare with the number of messages echoed
+# frames: messages echoed in framed mode (see EchoFraming.py)
+# timeouts: connections closed by their idle, read or write timeout
+# refused: connections closed right after being accepted, because the maximum number of connections was reached
+# accept_wakeups: times the server socket was ready to accept (selectors engine); accepts / accept_wakeups is the
+#   average number of connections accepted per wakeup (see accept() in MultiConnEchoServer.py)
+# accept_errors: accept() calls that failed for another reason than an empty backlog, for example too many open files
+# tls_handshakes: TLS handshakes completed (see EchoTls.py); tls_resumed: how many of them resumed a session
+# tls_failures: TLS handshakes that failed, for example with a client not speaking TLS
+# budget_closes: connections closed in framed mode because they held an incomplete frame of at least the high watermark
+#   while all connections passed the memory budget (see serve() in MultiConnEchoServer.py)
+COUNTER_NAMES = ('accepts', 'closes', 'bytes_in', 'bytes_out', 'read_pauses', 'budget_pauses', 'read_resumes',
+                 'send_calls', 'frames', 'timeouts', 'refused', 'accept_wakeups', 'accept_errors',
+                 'tls_handshakes', 'tls_resumed', 'tls_failures', 'budget_closes')
+(ACCEPTS, CLOSES, BYTES_IN, BYTES_OUT, READ_PAUSES, BUDGET_PAUSES, READ_RESUMES,
+ SEND_CALLS, FRAMES, TIMEOUTS, REFUSED, ACCEPT_WAKEUPS, ACCEPT_ERRORS,
+ TLS_HANDSHAKES, TLS_RESUMED, TLS_FAILURES, BUDGET_CLOSES) = range(len(COUNTER_NAMES))
+
+# Return a new counters list with every counter at 0
+def new_counters():
+    return [0] * len(COUNTER_NAMES)
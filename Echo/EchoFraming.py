@@ -0,0 +1,144 @@
+# EchoFraming.py
+
+# Length-prefixed message framing, used by MultiConnEchoServer.py and MultiConnEchoClient.py with --framed
+# Each message (frame) is sent as a 4-byte big-endian length followed by that many bytes of payload:
+#   | length (4 bytes) | payload (length bytes) |
+# Without framing, the echo programs only see a stream of bytes, so they cannot tell where a message ends,
+#   and the client has to count bytes to know when all of its messages came back
+#
+# FrameParser extracts complete frames from the bytes received so far, however they were split by the network
+# FrameWriter queues outgoing frames, and sends as many of them as possible with a single socket.sendmsg() call
+#   (scatter/gather), instead of one send() per message
+
+import os
+import ssl
+import struct
+import itertools
+import collections
+
+from EchoBuffer import EchoBuffer
+
+# Header of every frame: the length of its payload
+HEADER = struct.Struct('!I')
+
+# Largest payload accepted by FrameParser, so that a bad length cannot make a connection buffer gigabytes
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Payloads smaller than this are copied together with their header into one buffer when queued,
+#   so that a batch of tiny frames needs one buffer per frame in the sendmsg() call instead of two
+COALESCE_SIZE = 512
+
+# Maximum number of buffers the operating system accepts in one sendmsg() call
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+# Return payload as one frame (header and payload in a single bytes object)
+def encode_frame(payload):
+    return HEADER.pack(len(payload)) + payload
+
+# Incremental frame parser: received bytes are accumulated in an EchoBuffer, and every complete frame is returned
+class FrameParser:
+    __slots__ = ('inb', 'max_frame_size')
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.inb = EchoBuffer()
+        self.max_frame_size = max_frame_size
+
+    # Number of received bytes not yet returned as part of a frame
+    def __len__(self):
+        return len(self.inb)
+
+    # Receive up to num_bytes bytes from sock, see EchoBuffer.recv_into()
+    def recv_into(self, sock, num_bytes):
+        return self.inb.recv_into(sock, num_bytes)
+
+    # Add already received bytes
+    def feed(self, data):
+        self.inb.write(data)
+
+    # Return the payloads (as bytes) of all the complete frames received so far, removing them from the buffer
+    # An incomplete frame at the end stays in the buffer until the rest of it is received
+    # Raises ValueError if a frame is larger than max_frame_size
+    def frames(self):
+        payloads = []
+        inb = self.inb
+        while len(inb) >= HEADER.size:
+            (length,) = HEADER.unpack(inb.peek(HEADER.size))
+            if length > self.max_frame_size:
+                raise ValueError(f'frame of {length} bytes is larger than {self.max_frame_size} bytes')
+            if len(inb) < HEADER.size + length:
+                break
+            inb.consume(HEADER.size)
+            payloads.append(bytes(inb.peek(length)))
+            inb.consume(length)
+        return payloads
+
+# Queue of outgoing frames, sent with scatter/gather socket.sendmsg() calls
+# Queued buffers are never copied again (except tiny frames, see COALESCE_SIZE), so the same immutable
+#   frame can be queued on many connections at once
+class FrameWriter:
+    __slots__ = ('buffers', 'size')
+
+    def __init__(self):
+        # buffers holds the bytes-like objects waiting to be sent, oldest first
+        # Like the storage of an EchoBuffer, it only exists while bytes are waiting (None otherwise), so that
+        #   an idle connection does not keep an empty deque
+        self.buffers = None
+        self.size = 0
+
+    # Number of bytes waiting to be sent
+    def __len__(self):
+        return self.size
+
+    # A FrameWriter is "true" when it has bytes waiting to be sent, just like an EchoBuffer
+    def __bool__(self):
+        return self.size > 0
+
+    # Queue payload as one frame
+    def write_frame(self, payload):
+        if len(payload) < COALESCE_SIZE:
+            self.write(HEADER.pack(len(payload)) + payload)
+        else:
+            self.write(HEADER.pack(len(payload)))
+            self.write(payload)
+
+    # Queue already encoded bytes (for example a frame returned by encode_frame()), without copying them
+    def write(self, data):
+        if data:
+            if self.buffers is None:
+                self.buffers = collections.deque()
+            self.buffers.append(data)
+            self.size += len(data)
+
+    # Send as many queued bytes as sock accepts with one call, and return the number of bytes sent
+    # Only call this while bytes are waiting to be sent
+    # Uses sock.sendmsg() with up to IOV_MAX buffers where available, and a single joined send() otherwise,
+    #   which includes SSL sockets: their records are written by the SSL object, which has no scatter/gather
+    def send(self, sock):
+        buffers = list(itertools.islice(self.buffers, IOV_MAX))
+        if hasattr(sock, 'sendmsg') and not isinstance(sock, ssl.SSLSocket):
+            sent = sock.sendmsg(buffers)
+        else:
+            sent = sock.send(b''.join(buffers))
+        self.consume(sent)
+        return sent
+
+    # Discard the first num_bytes queued bytes, usually after they have been sent
+    def consume(self, num_bytes):
+        self.size -= num_bytes
+        if not self.size:
+            self.buffers = None
+            return
+        buffers = self.buffers
+        while num_bytes:
+            first = buffers[0]
+            if num_bytes < len(first):
+                # Partially sent buffer: keep the rest of it, without copying
+                buffers[0] = memoryview(first)[num_bytes:]
+                break
+            num_bytes -= len(first)
+            buffers.popleft()
@@ -1,13 +1,124 @@
 # EchoServer.py
 
+# Example commands to run this program: python3 EchoServer.py
+# Example commands to run this program in bulk mode: python3 EchoServer.py --bulk
+# Example commands to run this program in bulk mode, storing the file received: python3 EchoServer.py --bulk --output received.bin
+
+import time
+import mmap
 import socket
+import struct
+import argparse
+
+# Bulk mode (--bulk, with EchoClient.py --bulk FILE), used to qualify links and storage:
+#   the client streams a whole file, preceded by its size as an 8-byte header (BULK_HEADER)
+#   the server receives it with large recv_into() calls, straight into a reusable buffer (discarding the bytes),
+#     or straight into a memory-mapped output file (--output), so that no intermediate copy is made
+#   the server then sends back the number of bytes it received (BULK_HEADER again), and both sides report MB/s
+BULK_HEADER = struct.Struct('!Q')
+
+# Default number of bytes received per recv_into() call in bulk mode
+BULK_BUFFER_SIZE = 1024 * 1024
+
+# Echo back everything received on conn, until the client socket closes the connection
+def echo(conn):
+    # Continously receiving and sending data to the client socket,
+    #   until nothing is sent by the client socket
+    while True:
+        # Block and try to receive up to 1024 bytes of data from the connected client socket
+        # This function will remain blocked (cannot proceed to the next line),
+        #   until it receives at least 1 byte from the connected client socket
+        receivedData = conn.recv(1024)
+        # Break from this infinite loop and close this connection
+        #   if conn received the empty bytes object (b'') from the connected client socket
+        if not receivedData:
+            break
+        # Otherwise, conn it will send all of what it received currently
+        #   to the connected client socket, thus resulting the "echo" effect
+        conn.sendall(receivedData)
+
+# Receive exactly num_bytes bytes from conn (fewer only if the client socket closes the connection first)
+def recv_exactly(conn, num_bytes):
+    data = bytearray()
+    while len(data) < num_bytes:
+        chunk = conn.recv(num_bytes - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+# Bulk mode: receive one file from conn, buffer_size bytes per recv_into() call at most
+# output is the path of the file it is written to, or None to discard it
+# Returns the number of bytes received
+def receive_bulk(conn, buffer_size, output=None):
+    header = recv_exactly(conn, BULK_HEADER.size)
+    if len(header) < BULK_HEADER.size:
+        return 0
+    (size,) = BULK_HEADER.unpack(header)
+    print(f'Receiving {size} bytes')
 
-# host is the IP address of this echo server
-# '127.0.0.1' is the standard loopback interface address (localhost)
-host = '127.0.0.1' 
-# port is the port number of this echo server
-# Non-privileged ports are > 1023
-port = 65432
+    start = time.perf_counter()
+    if output is None:
+        # The same buffer is reused by every recv_into() call, so received bytes are never copied again
+        view = memoryview(bytearray(buffer_size))
+        received = 0
+        while received < size:
+            count = conn.recv_into(view, min(buffer_size, size - received))
+            if not count:
+                break
+            received += count
+    else:
+        received = receive_into_file(conn, size, buffer_size, output)
+    elapsed = time.perf_counter() - start
+
+    # Tell the client how many bytes arrived, so that it can report the throughput of the whole transfer
+    conn.sendall(BULK_HEADER.pack(received))
+    print(f'Received {received} bytes in {elapsed:.3f}s: {received / max(elapsed, 1e-9) / 1e6:.1f} MB/s')
+    return received
+
+# Receive size bytes from conn straight into the output file, memory-mapped, buffer_size bytes per recv_into() at most
+# The file is created with its final size up front, so the kernel copies each received chunk into the file's pages
+def receive_into_file(conn, size, buffer_size, output):
+    with open(output, 'w+b') as file:
+        if size == 0:
+            return 0
+        file.truncate(size)
+        received = 0
+        with mmap.mmap(file.fileno(), size) as mapped:
+            view = memoryview(mapped)
+            try:
+                while received < size:
+                    count = conn.recv_into(view[received:received + min(buffer_size, size - received)])
+                    if not count:
+                        break
+                    received += count
+            finally:
+                # The memoryview has to be released before the mmap can be closed
+                view.release()
+            mapped.flush()
+        if received < size:
+            # The client socket closed the connection early: only keep what arrived
+            file.truncate(received)
+    return received
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Echo server')
+    # host is the IP address of this echo server
+    # '127.0.0.1' is the standard loopback interface address (localhost)
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the server socket binds to (default: 127.0.0.1)')
+    # port is the port number of this echo server
+    # Non-privileged ports are > 1023
+    parser.add_argument('--port', type=int, default=65432, help='port number the server socket binds to (default: 65432)')
+    parser.add_argument('--bulk', action='store_true', help='receive one file sent by EchoClient.py --bulk instead of echoing')
+    parser.add_argument('--output', help='bulk mode: file the received bytes are written to, memory-mapped (default: discard them)')
+    parser.add_argument('--buffer-size', type=int, default=BULK_BUFFER_SIZE,
+                        help=f'bulk mode: bytes received per recv_into() call (default: {BULK_BUFFER_SIZE})')
+    parser.add_argument('--rcvbuf', type=int, default=0,
+                        help='bulk mode: SO_RCVBUF of the socket in bytes, 0 for the system default (default: 0)')
+    return parser.parse_args()
+
+args = parse_arguments()
 
 # Use "with ... as ..." statement here to handle possible exceptions
 # Also, when using this statement, there is no need to manually close the serverSocket
@@ -15,32 +126,25 @@ port = 65432
 # socket.SOCK_STREAM means that the protocol used is TCP (Transmission Control Protocol)
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as serverSocket:
     print('Server socket created')
+    if args.rcvbuf:
+        # Set before listening, so that the accepted conn inherits it (and the TCP window scale is chosen accordingly)
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
     # .bind() allows the serverSocket to have host and port as its ip address and port number
-    serverSocket.bind((host, port))
+    serverSocket.bind((args.host, args.port))
     # .listen() enables the serverSocket to be connected with client sockets
     serverSocket.listen()
     print('Waiting for connection established by client socket')
     # .accept() allows the serverSocket to accept the connection initiated by a client socket
-    # conn is a new socket object (a sub socket created by the serverSocket), 
+    # conn is a new socket object (a sub socket created by the serverSocket),
     #   which can be used to send and receive data, to or from the connected client socket
     # address is the address bound to the connected client socket
     (conn, address) = serverSocket.accept()
     # If the new socket object created for the connection with the client socket exists, then:
     with conn:
         print(f'Connected with client socket: {address}')
-        # Continously receiving and sending data to the client socket, 
-        #   until nothing is sent by the client socket
-        while True:
-            # Block and try to receive up to 1024 bytes of data from the connected client socket
-            # This function will remain blocked (cannot proceed to the next line),
-            #   until it receives at least 1 byte from the connected client socket
-            receivedData = conn.recv(1024)
-            # Break from this infinite loop and close this connection
-            #   if conn received the empty bytes object (b'') from the connected client socket
-            if not receivedData:
-                break
-            # Otherwise, conn it will send all of what it received currently
-            #   to the connected client socket, thus resulting the "echo" effect
-            conn.sendall(receivedData)
+        if args.bulk:
+            receive_bulk(conn, args.buffer_size, args.output)
+        else:
+            echo(conn)
 
 print('Server socket closed')
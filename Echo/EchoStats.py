@@ -0,0 +1,145 @@
+# EchoStats.py
+
+# Logging and statistics of the echo programs, replacing the print() calls made for every message sent and received
+#
+# Logging: every program logs through the 'echo' logger, at these levels:
+#   - DEBUG: one line per message sent or received (the hot path), sampled: only 1 message in every sample_every is logged
+#   - INFO: one line per connection opened, closed, refused or timed out
+#   - WARNING: errors that do not stop the program
+# Hot path code checks MessageLog.enabled before building anything, so per-message logging costs a single
+#   attribute lookup when it is off
+#
+# Statistics: LoopStats measures the event loop of MultiConnEchoServer.py (iterations, events per select(),
+#   connections accepted per wakeup of the server socket, time spent in select() versus in the handlers), and snapshot() combines them with the counters (see EchoCounters.py)
+#   into a dictionary, which the server serves on a local stats socket and/or dumps as one JSON line per interval
+
+import os
+import sys
+import json
+import time
+import logging
+
+from EchoCounters import COUNTER_NAMES
+from LatencyHistogram import LatencyHistogram
+
+log = logging.getLogger('echo')
+
+LOG_LEVELS = ('debug', 'info', 'warning', 'error')
+
+# Per-message logging, at DEBUG level and sampled
+class MessageLog:
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = 1
+        self.seen = 0
+
+    # True for 1 message in every sample_every; only call this when self.enabled is True
+    def sample(self):
+        self.seen += 1
+        return self.seen % self.sample_every == 0
+
+message_log = MessageLog()
+
+# Configure the 'echo' logger: level is one of LOG_LEVELS, and sample_every the sampling of per-message logging
+def setup_logging(level='info', sample_every=1):
+    logging.basicConfig(stream=sys.stdout, format='%(message)s')
+    log.setLevel(getattr(logging, level.upper()))
+    message_log.enabled = log.isEnabledFor(logging.DEBUG)
+    message_log.sample_every = max(1, sample_every)
+
+# Add the logging options shared by the echo programs to an argparse parser
+def add_logging_arguments(parser, default_level='info'):
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=default_level,
+                        help=f'debug logs every message, info every connection (default: {default_level})')
+    parser.add_argument('--log-sample', type=int, default=1,
+                        help='at debug level, log only 1 message in every LOG_SAMPLE (default: 1, all of them)')
+
+# Statistics of one event loop
+class LoopStats:
+    def __init__(self):
+        self.iterations = 0
+        self.select_ns = 0
+        self.handler_ns = 0
+        self.events_per_select = LatencyHistogram()
+        self.accepts_per_wakeup = LatencyHistogram()
+        # Durations are recorded in microseconds
+        self.select_us = LatencyHistogram()
+        self.handler_us = LatencyHistogram()
+        # Periodic JSON dumps (see dump_due()), disabled while dump_interval is 0
+        self.dump_interval = 0
+        self.dump_file = sys.stderr
+        self.next_dump = None
+
+    # Record one loop iteration: num_events events returned by a select() that took select_ns nanoseconds,
+    #   then handled in handler_ns nanoseconds
+    def record_iteration(self, num_events, select_ns, handler_ns):
+        self.iterations += 1
+        self.select_ns += select_ns
+        self.handler_ns += handler_ns
+        self.events_per_select.record(num_events)
+        self.select_us.record(select_ns // 1000)
+        self.handler_us.record(handler_ns // 1000)
+
+    # Record one wakeup of the server socket, during which num_accepted connections were accepted
+    def record_accepts(self, num_accepted):
+        self.accepts_per_wakeup.record(num_accepted)
+
+    # Dump statistics to dump_file every interval seconds, the first time interval seconds from now
+    def start_dumps(self, interval, dump_file, now):
+        self.dump_interval = interval
+        self.dump_file = dump_file
+        self.next_dump = now + interval
+
+    # Seconds from now until the next dump is due (None without periodic dumps), used as a select() timeout
+    def dump_timeout(self, now):
+        if not self.dump_interval:
+            return None
+        return max(0.0, self.next_dump - now)
+
+    # True if a dump is due at now; the next one is then scheduled
+    def dump_due(self, now):
+        if not self.dump_interval or now < self.next_dump:
+            return False
+        self.next_dump = now + self.dump_interval
+        return True
+
+    def summary(self):
+        return {
+            'iterations': self.iterations,
+            'select_seconds': round(self.select_ns / 1e9, 6),
+            'handler_seconds': round(self.handler_ns / 1e9, 6),
+            'events_per_select': self.events_per_select.summary(),
+            'accepts_per_wakeup': self.accepts_per_wakeup.summary(),
+            'select_us': self.select_us.summary(),
+            'handler_us': self.handler_us.summary(),
+        }
+
+# Dictionary with everything worth watching in a running server:
+# counters is a counters sequence (see EchoCounters.py), loop_stats a LoopStats or None,
+#   buffer_sizes the number of output bytes waiting for each open connection, and extra any other values
+def snapshot(counters, loop_stats=None, buffer_sizes=(), **extra):
+    occupancy = LatencyHistogram()
+    for size in buffer_sizes:
+        occupancy.record(size)
+    result = {
+        'time': round(time.time(), 3),
+        'counters': dict(zip(COUNTER_NAMES, counters)),
+        'buffer_occupancy': occupancy.summary(),
+    }
+    result.update(extra)
+    if loop_stats is not None:
+        result['loop'] = loop_stats.summary()
+    return result
+
+# Resident memory of this process in bytes, or None where it cannot be read (it is read from /proc, so Linux only)
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Write a snapshot as a single line of JSON
+def dump_snapshot(result, output):
+    output.write(json.dumps(result) + '\n')
+    output.flush()
@@ -0,0 +1,99 @@
+# EchoTls.py
+
+# TLS for MultiConnEchoServer.py and MultiConnEchoClient.py, with --tls
+# Both programs keep their non-blocking selector loops: sockets are wrapped with do_handshake_on_connect=False, and
+#   every call on an SSL socket may raise instead of blocking:
+#   - ssl.SSLWantReadError: the TLS layer needs bytes from the peer first (during the handshake, or when a recv()
+#     only got records without application data, such as the session tickets of TLS 1.3)
+#   - ssl.SSLWantWriteError: the TLS layer could not write its records, the socket buffer being full
+#   so the handshake is driven from the event loop (see handshake()), by asking the selector for whichever event
+#   it waits for, and reads and writes that raise either of them simply did nothing this time
+# A TLS record is decrypted as a whole, so a recv() smaller than the record leaves the rest of it inside the SSL object
+#   (sock.pending()), where the selector cannot see it: the server keeps track of those connections (see tls.pending
+#   in MultiConnEchoServer.py)
+#
+# Session resumption: a client that reconnects with the session of an earlier connection skips the full handshake
+#   (no certificate, and no key exchange in TLS 1.2), if the server still knows the session:
+#   - tickets (default): the server keeps nothing, and hands out session tickets encrypted with a key of its own process
+#   - cache: the server keeps the sessions in the session cache of OpenSSL, and clients only hold their ID
+#     (with TLS 1.3, each ticket is then single use)
+#   Either way, the sessions are those of one process: with --workers, a client only resumes on the worker that
+#   issued its session
+
+import os
+import ssl
+import selectors
+import subprocess
+
+# Session resumption modes of the server (see server_context())
+SESSION_MODES = ('tickets', 'cache')
+
+# Create a self-signed certificate for localhost in directory, valid for one day, and return the paths of the
+#   certificate and of its private key (with openssl, which has to be installed)
+def create_certificate(directory):
+    certfile = os.path.join(directory, 'echo-cert.pem')
+    keyfile = os.path.join(directory, 'echo-key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes',
+         '-days', '1', '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return certfile, keyfile
+
+# Return the SSLContext of the server, with the given certificate and private key
+# sessions is one of SESSION_MODES
+def server_context(certfile, keyfile, sessions='tickets'):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    # Echo clients close their connection without a close_notify alert; OpenSSL 3 would take that for an error,
+    #   and then not keep the session (see close_notify())
+    context.options |= getattr(ssl, 'OP_IGNORE_UNEXPECTED_EOF', 0)
+    if sessions == 'cache':
+        # Without tickets, OpenSSL falls back to its server-side session cache
+        context.options |= ssl.OP_NO_TICKET
+    return context
+
+# Return the SSLContext of the clients
+# The certificate of the server is only verified against cafile when given, since the server usually runs with
+#   a self-signed one; the host name is never checked, since clients connect to an IP address
+def client_context(cafile=None):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    if cafile:
+        context.load_verify_locations(cafile)
+    else:
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+# Advance the handshake of sock, and return 0 once it is complete, or the event (selectors.EVENT_READ or
+#   selectors.EVENT_WRITE) the selector has to wait for before calling it again
+# Any other failure (ssl.SSLError, or the connection being closed) is raised
+def handshake(sock):
+    try:
+        sock.do_handshake()
+    except ssl.SSLWantReadError:
+        return selectors.EVENT_READ
+    except ssl.SSLWantWriteError:
+        return selectors.EVENT_WRITE
+    return 0
+
+# Send the close_notify alert of sock before closing it, without waiting for the peer's one
+# OpenSSL removes the session of a connection from the session cache when the connection is freed without it,
+#   so that the server-side cache would never resume any session
+def close_notify(sock):
+    try:
+        sock.unwrap()
+    except (ssl.SSLError, OSError):
+        # Waiting for the close_notify of the peer (ssl.SSLWantReadError), or the connection is already gone
+        pass
+
+# Statistics of the TLS handshakes of a server: handshakes completed, how many of them resumed a session,
+#   and the session cache statistics of OpenSSL for context
+def summary(handshakes, resumed, failures, context):
+    return {
+        'handshakes': handshakes,
+        'resumed': resumed,
+        'failures': failures,
+        'resumption_hit_rate': round(resumed / handshakes, 3) if handshakes else None,
+        'session_cache': context.session_stats(),
+    }
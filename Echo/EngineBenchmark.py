@@ -0,0 +1,78 @@
+# EngineBenchmark.py
+
+# Example commands to run this program: python3 EngineBenchmark.py
+# Example commands to run this program with more load: python3 EngineBenchmark.py --connections 200 --pipeline 8 --duration 10
+
+# Side by side benchmark of the two server engines of MultiConnEchoServer.py (--engine selectors and --engine asyncio)
+# For each engine, a server is started in its own process, loaded with the load generation mode of
+#   MultiConnEchoClient.py (see run_benchmark()), and stopped again
+# The server output is discarded, so that printing to the terminal does not limit the results
+
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import subprocess
+
+from MultiConnEchoClient import run_benchmark
+
+# Start MultiConnEchoServer.py with the given engine on (host, port), and wait until it accepts connections
+# The server runs in a process group of its own, with its workers if extra_args has --workers (see stop_server())
+def start_server(host, port, engine, extra_args):
+    server = subprocess.Popen(
+        [sys.executable, 'MultiConnEchoServer.py', host, str(port), '--engine', engine] + extra_args,
+        stdout=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    stop_server(server, timeout=0)
+    raise RuntimeError(f'{engine} server did not start listening on {(host, port)}')
+
+# Stop a server started by start_server(), and wait until it exited
+# The termination signal lets it drain its connections (with --workers, the supervisor terminates its workers and
+#   waits for them); whatever is still running after timeout seconds, workers included, is killed with its process group
+def stop_server(server, timeout=10):
+    server.terminate()
+    try:
+        server.wait(timeout)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(server.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    server.wait()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the selectors and asyncio engines of MultiConnEchoServer.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the servers bind to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65432, help='port number the servers bind to (default: 65432)')
+    parser.add_argument('--engines', nargs='+', choices=('selectors', 'asyncio'), default=['selectors', 'asyncio'],
+                        help='engines to compare (default: both)')
+    parser.add_argument('--connections', type=int, default=50, help='number of client connections (default: 50)')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes per request (default: 64)')
+    parser.add_argument('--pipeline', type=int, default=4, help='maximum requests in flight per connection (default: 4)')
+    parser.add_argument('--duration', type=float, default=5, help='duration of each run in seconds (default: 5)')
+    args, server_args = parser.parse_known_args()
+
+    print(f'{"engine":<10} {"msgs/s":>12} {"MB/s":>10} {"p50 us":>10} {"p99 us":>10} {"p99.9 us":>10} {"errors":>7}')
+    for engine in args.engines:
+        # Any unknown option is passed on to the servers, e.g. --workers 4
+        server = start_server(args.host, args.port, engine, server_args)
+        try:
+            results = run_benchmark(args.host, args.port, args.connections, args.payload_size,
+                                    args.pipeline, 0, args.duration)
+        finally:
+            stop_server(server)
+
+        latency = results['latency_us']
+        print(f'{engine:<10} {results["msgs_per_sec"]:>12} {results["mb_per_sec"]:>10} '
+              f'{latency["p50"]:>10} {latency["p99"]:>10} {latency["p99.9"]:>10} {results["errors"]:>7}')
@@ -0,0 +1,99 @@
+# LatencyHistogram.py
+
+# LatencyHistogram records integer values (usually latencies in microseconds) in HDR-style log-linear buckets:
+#   - every power of two range [2^k, 2^(k+1)) is split into the same number of equally sized sub-buckets
+#   - so each recorded value is kept with a relative error below 1 / 2^(SUB_BUCKET_BITS - 1) (under 1% here)
+# Recording a value is O(1) and the memory used only grows with the logarithm of the largest value,
+#   so millions of latencies can be recorded without keeping them all around
+
+# Number of bits of precision kept for each value: 256 sub-buckets, relative error below 1/128
+SUB_BUCKET_BITS = 8
+SUB_BUCKET_HALF_BITS = SUB_BUCKET_BITS - 1
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+# Percentiles reported by LatencyHistogram.summary()
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram:
+    def __init__(self):
+        # counts[i] is the number of recorded values that fell in bucket i (see _bucket_index())
+        self.counts = []
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    # Index of the bucket holding value
+    # Values below SUB_BUCKET_COUNT get a bucket each; above that, each power of two range gets
+    #   SUB_BUCKET_COUNT / 2 buckets, indexed by the top SUB_BUCKET_BITS bits of the value
+    @staticmethod
+    def _bucket_index(value):
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << SUB_BUCKET_HALF_BITS) + (value >> shift)
+
+    # Highest value that falls in the bucket at index (reported values are rounded up, like HdrHistogram does)
+    @staticmethod
+    def _bucket_value(index):
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift = (index >> SUB_BUCKET_HALF_BITS) - 1
+        top_bits = index - (shift << SUB_BUCKET_HALF_BITS)
+        return ((top_bits + 1) << shift) - 1
+
+    # Record value (a non-negative integer), count times
+    def record(self, value, count=1):
+        if value < 0:
+            value = 0
+        index = self._bucket_index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # Add all values recorded by other to this histogram
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    # Value below which percentile percent of the recorded values fall (0 if nothing was recorded)
+    def percentile(self, percentile):
+        if not self.total:
+            return 0
+        # Number of values that have to be at or below the returned value, at least 1
+        wanted = max(1, -(-self.total * percentile // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    # Dictionary with the count, min, mean, max and the given percentiles (keyed like 'p99.9')
+    def summary(self, percentiles=DEFAULT_PERCENTILES):
+        result = {
+            'count': self.total,
+            'min': self.min or 0,
+            'mean': round(self.mean(), 3),
+            'max': self.max or 0,
+        }
+        for percentile in percentiles:
+            result[f'p{percentile:g}'] = self.percentile(percentile)
+        return result
@@ -0,0 +1,117 @@
+# MemoryBenchmark.py
+
+# Example commands to run this program: python3 MemoryBenchmark.py
+# Example commands to run this program with 100k connections: python3 MemoryBenchmark.py --connections 100000 --source-ips 5
+# *Note: every connection is a file descriptor on both sides, so the open files limit (ulimit -n) of both processes
+#   has to be above the number of connections
+
+# Memory used per idle connection by the selectors engine of MultiConnEchoServer.py, in two ways:
+#   - records: the Python objects kept per connection (the Connection record and its buffers, see accept_connection()),
+#     measured with tracemalloc for --connections records, without any socket
+#   - server: the resident memory (RSS) of a real server process before and after --connections client sockets
+#     connected, each of them sending one message, receiving its echo and then staying idle
+# Memory the kernel uses for the sockets themselves is not part of the RSS of the server, so it is not counted
+
+import time
+import socket
+import argparse
+import resource
+import selectors
+import tracemalloc
+
+from MultiConnEchoServer import Connection
+from EchoFraming import encode_frame
+from ConnectBenchmark import read_stats
+from EngineBenchmark import start_server, stop_server
+
+# Bytes allocated per record when creating num_records idle Connection records (with framed records if framed is True)
+def measure_records(num_records, framed=False):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [Connection(None, ('127.0.0.1', 40000 + i % 20000), 0.0, framed) for i in range(num_records)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del records
+    return used / num_records
+
+# Connect num_conns client sockets to (host, port), num_sources source addresses (127.0.0.1, 127.0.0.2, ...) taking
+#   turns so that a local test is not limited by the number of ports of a single address
+# Every client socket sends one byte (one message of one byte if framed is True) and waits for its echo;
+#   the connected client sockets are returned
+# Raises TimeoutError if a batch of batch connections is not done within timeout seconds
+def open_idle_connections(host, port, num_conns, num_sources=1, framed=False, batch=100, timeout=10):
+    message = encode_frame(b'x') if framed else b'x'
+    selector = selectors.DefaultSelector()
+    socks = []
+    for first in range(0, num_conns, batch):
+        for i in range(first, min(first + batch, num_conns)):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if num_sources > 1:
+                sock.bind((f'127.0.0.{1 + i % num_sources}', 0))
+            sock.setblocking(False)
+            sock.connect_ex((host, port))
+            selector.register(sock, selectors.EVENT_WRITE)
+            socks.append(sock)
+
+        # Wait until every connection of this batch sent its byte and received the echo
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                stalled = len(selector.get_map())
+                selector.close()
+                raise TimeoutError(f'{stalled} connections of a batch stalled for {timeout} seconds')
+            for key, mask in selector.select(timeout=remaining):
+                sock = key.fileobj
+                if mask & selectors.EVENT_WRITE:
+                    sock.send(message)
+                    selector.modify(sock, selectors.EVENT_READ)
+                    continue
+                # The echo of such a small message arrives in one piece
+                received = len(sock.recv(len(message)))
+                if not received:
+                    raise ConnectionError('server closed a connection')
+                selector.unregister(sock)
+    selector.close()
+    return socks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory used per idle connection by MultiConnEchoServer.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the server binds to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65432, help='port number the server binds to (default: 65432)')
+    parser.add_argument('--connections', type=int, default=100000, help='number of idle connections (default: 100000)')
+    parser.add_argument('--source-ips', type=int, default=1,
+                        help='number of local source addresses the client sockets use, 127.0.0.1 and up (default: 1)')
+    parser.add_argument('--framed', action='store_true', help='run the server with --framed, and send it length-prefixed messages')
+    args, server_args = parser.parse_known_args()
+
+    print(f'Records: {measure_records(args.connections):.0f} bytes per idle connection, '
+          f'{measure_records(args.connections, framed=True):.0f} in framed mode ({args.connections} records)')
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections + 16 > hard:
+        parser.error(f'--connections is too high for the limit of {hard} open files, measure fewer connections')
+
+    # Any unknown option is passed on to the server, e.g. --memory-budget 0
+    if args.framed:
+        server_args.append('--framed')
+    server = start_server(args.host, args.port, 'selectors',
+                          ['--log-level', 'warning', '--stats-port', str(args.port + 1)] + server_args)
+    try:
+        before = read_stats(args.host, args.port + 1)['rss_bytes']
+        start = time.perf_counter()
+        socks = open_idle_connections(args.host, args.port, args.connections, args.source_ips, args.framed)
+        elapsed = time.perf_counter() - start
+        stats = read_stats(args.host, args.port + 1)
+        for sock in socks:
+            sock.close()
+    finally:
+        stop_server(server)
+
+    if before is None or stats['rss_bytes'] is None:
+        print('Server: resident memory is not available on this system')
+    else:
+        used = stats['rss_bytes'] - before
+        print(f'Server: {used / args.connections:.0f} bytes per idle connection ({stats["connections"]} connections, '
+              f'RSS {before / 2**20:.1f}MB -> {stats["rss_bytes"] / 2**20:.1f}MB, connected in {elapsed:.1f}s)')
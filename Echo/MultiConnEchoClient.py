@@ -1,24 +1,89 @@
 # MultiConnEchoClient.py
 
 # Example commands to run this program: python3 MultiConnEchoClient.py 127.0.0.1 65432 2
+# Example commands to run this program with length-prefixed messages: python3 MultiConnEchoClient.py 127.0.0.1 65432 2 --framed
+# Example commands to run this program as a load generator: python3 MultiConnEchoClient.py 127.0.0.1 65432 100 --bench --duration 10
+# Example commands to run this program over TLS: python3 MultiConnEchoClient.py 127.0.0.1 65432 2 --tls
 # *Note: The server side program (MultiConnEchoServer.py) has to run first
 
+import os
+import ssl
 import sys
+import csv
+import json
+import time
+import heapq
 import socket
+import argparse
 import selectors
 import types
+import collections
+
+import EchoStats
+import EchoTls
+from EchoStats import log, message_log
+from EchoBuffer import EchoBuffer
+from EchoFraming import FrameParser, FrameWriter, HEADER
+from LatencyHistogram import LatencyHistogram
+
+# Scratch buffer that every client socket receives into with .recv_into(), since received bytes are only counted
+recv_buffer = bytearray(1024)
+
+# State of one client socket, stored as its data in the selector
+# A class with __slots__ rather than a types.SimpleNamespace, since there is one per connection (see Connection in
+#   MultiConnEchoServer.py)
+# messages is the message table shared by every connection (a tuple, never modified), and next_message the index
+#   of the next message this connection sends, instead of a copy of the messages per connection
+# msg_total is the number of bytes (or, in framed mode, of messages) to receive back before closing, and recv_total
+#   the number received so far
+# outb is the output buffer (a FrameWriter in framed mode), and inb the FrameParser of framed mode (None otherwise)
+# events is the set of events the client socket is currently registered with (see update_interest())
+# handshaking is True until the TLS handshake is complete, and tls_wants the event the handshake waits for
+class ClientConnection:
+    __slots__ = ('connid', 'messages', 'next_message', 'msg_total', 'recv_total', 'framed', 'outb', 'inb', 'events',
+                 'handshaking', 'tls_wants')
+
+    def __init__(self, connid, messages, msg_total, framed=False, handshaking=False):
+        self.connid = connid
+        self.messages = messages
+        self.next_message = 0
+        self.msg_total = msg_total
+        self.recv_total = 0
+        self.framed = framed
+        if framed:
+            self.inb = FrameParser()
+            self.outb = FrameWriter()
+        else:
+            self.inb = None
+            self.outb = EchoBuffer()
+        self.events = 0
+        self.handshaking = handshaking
+        # The handshake starts once the connection is established, which the socket being writable tells
+        self.tls_wants = selectors.EVENT_WRITE if handshaking else 0
+
+    # True while some messages have not been queued for sending yet
+    def has_messages(self):
+        return self.next_message < len(self.messages)
 
 # Start establishing connections to the server socket for num_conns number of client sockets
 # num_conns is read from the command-line and is the number of connections to create to the server.
-def start_connections(host, port, num_conns, selector, messages):
+# messages is the sequence of messages every connection sends
+# framed is True to send the messages length-prefixed (see EchoFraming.py), to a server also running with --framed
+# tls is the SSLContext of the connections (see EchoTls.py), None to connect without TLS
+def start_connections(host, port, num_conns, selector, messages, framed=False, tls=None):
     # Server socket IP address and port number initialized
     server_addr = (host, port)
 
+    # One immutable message table shared by all the connections
+    messages = tuple(messages)
+    # In framed mode, completion is counted in messages rather than in bytes
+    msg_total = len(messages) if framed else sum(len(m) for m in messages)
+
     # Do the following process for each client socket
     for i in range(0, num_conns):
         # Give this client socket an id for identification
         connid = i + 1
-        print(f'\nClient establishes connection {connid} to {server_addr}')
+        log.info('Client establishes connection %d to %s', connid, server_addr)
 
         # socket.AF_INET means that it has a host with an IPv4 address, and a port number which is an integer
         # socket.SOCK_STREAM means that the protocol used is TCP (Transmission Control Protocol)
@@ -26,6 +91,9 @@ def start_connections(host, port, num_conns, selector, messages):
 
         # setblocking(False) makes this client socket no longer block
         sock.setblocking(False)
+        if tls is not None:
+            # The handshake is not done when connecting, which would block: serve() drives it, one event at a time
+            sock = tls.wrap_socket(sock, do_handshake_on_connect=False)
 
         # Connect this client socket with the server socket using .connect_ex()
         # We use .connect_ex() here instead of .connect() because .connect() would immediately raise a BlockingIOError exception 
@@ -34,65 +102,125 @@ def start_connections(host, port, num_conns, selector, messages):
         #   instead of raising an exception that would interfere with the connection in progress
         sock.connect_ex(server_addr)
         
-        # events can either be selectors.EVENT_READ or selectors.EVENT_WRITE since the socket is ready for reading and writing
-        events = selectors.EVENT_READ | selectors.EVENT_WRITE
-
-        # More information on types.SimpleNamespace can be found in MultiConnEchoServer.py
-        data = types.SimpleNamespace(
-            connid=connid,
-            msg_total=sum(len(m) for m in messages),
-            recv_total=0,
-            messages=messages.copy(),
-            outb=b'',
-        )
+        data = ClientConnection(connid, messages, msg_total, framed, tls is not None)
+
+        # data.events can either be selectors.EVENT_READ or selectors.EVENT_WRITE since the socket is ready for reading and writing
+        # selectors.EVENT_WRITE is only wanted while there are messages to send (see update_interest())
+        data.events = selectors.EVENT_READ
+        if messages:
+            data.events |= selectors.EVENT_WRITE
 
         # .register() registers this client socket to be monitored with selector.select()
         # For this client socket, it would want read events: selectors.EVENT_READ or selectors.EVENT_WRITE
         # data will store what's being sent and received on this client socket
-        selector.register(sock, events, data=data)
+        selector.register(sock, data.events, data=data)
+
+# Update the events selector monitors the client socket for, so that selectors.EVENT_WRITE is only requested
+#   while there are bytes in data.outb or messages left to send
+# A TCP socket is almost always ready for writing, so keeping selectors.EVENT_WRITE after everything is sent would
+#   make selector.select() return immediately, over and over, while waiting for the echo from the server
+# Until its TLS handshake is complete, the client socket is only monitored for the event the handshake waits for
+def update_interest(selector, sock, data):
+    if data.handshaking:
+        events = data.tls_wants
+    else:
+        events = selectors.EVENT_READ
+        if data.outb or data.has_messages():
+            events |= selectors.EVENT_WRITE
+    if events != data.events:
+        selector.modify(sock, events, data)
+        data.events = events
 
 # Perform services on the connection between the client socket and the server socket
 # key contains the socket object (fileobj) and data object
 # mask contains the events that are ready
-# selector is registered with the client socket and events: selectors.EVENT_READ OR selectors.EVENT_WRITE
+# selector is registered with the client socket and events: selectors.EVENT_READ, plus selectors.EVENT_WRITE while there is something to send
 def serve(key, mask, selector):
     socket = key.fileobj
     data = key.data
 
+    # With TLS, nothing is sent until the handshake is complete (see EchoTls.py)
+    if data.handshaking:
+        data.tls_wants = EchoTls.handshake(socket)
+        if not data.tls_wants:
+            data.handshaking = False
+            log.info('Client completes TLS handshake on connection %d (%s)', data.connid, socket.version())
+        update_interest(selector, socket, data)
+        return
+
     # Handle reading event if the socket is ready for reading
     if mask & selectors.EVENT_READ:
-        recv_data = socket.recv(1024)
+        try:
+            if data.framed:
+                received = data.inb.recv_into(socket, len(recv_buffer))
+            else:
+                received = socket.recv_into(recv_buffer)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            # TLS: only records without application data were received, such as session tickets (see EchoTls.py)
+            received = None
 
+        if data.framed and received:
+            # Framed mode: count the complete messages echoed back, however the network split them
+            for payload in data.inb.frames():
+                data.recv_total += 1
+                if message_log.enabled and message_log.sample():
+                    log.debug('Client receives message: %r from connection %d', payload, data.connid)
         # If there are data received
-        if recv_data:
+        elif received:
             # Client side keeps track of the number of bytes it received from the server so that it can close its side of the connection
             # When the server detects this, it closes its side of the connection too
-            data.recv_total += len(recv_data)
-            print(f'\nClient receives message: {recv_data!r} from connection {data.connid}')
+            data.recv_total += received
+            if message_log.enabled and message_log.sample():
+                log.debug('Client receives message: %r from connection %d', bytes(recv_buffer[:received]), data.connid)
 
         # If there are no data received, it means that the server side wants to close the connection with this client socket
-        if not recv_data or (data.recv_total == data.msg_total):
+        if received == 0 or (data.recv_total == data.msg_total):
             # Remove this client socket from selector.select()
             selector.unregister(socket)
 
             # After unregistering, close this client socket (thus the connection with the server socket is fully closed)
             socket.close()
-            print(f'\nClient closes connection to {data.connid}')
+            log.info('Client closes connection to %d', data.connid)
+            return
 
     # Handle writing event if the socket is ready for writing
-    if mask & selectors.EVENT_WRITE:
-        if not data.outb and data.messages:
-            data.outb = data.messages.pop(0)
+    try:
+        send_messages(socket, mask, data)
+    except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+        # TLS: nothing could be sent this time; selectors.EVENT_WRITE stays requested while data.outb has bytes waiting
+        pass
+
+    # Stop asking for selectors.EVENT_WRITE once everything has been sent
+    update_interest(selector, socket, data)
+
+# Writing part of serve(): queue the messages left to send, and send as much of them as the socket accepts
+def send_messages(socket, mask, data):
+    if mask & selectors.EVENT_WRITE and data.framed:
+        # Framed mode: queue every message at once, and send as many of them as possible with one sendmsg() call
+        for message in data.messages[data.next_message:]:
+            data.outb.write_frame(message)
+            if message_log.enabled and message_log.sample():
+                log.debug('Client sends message: %r to connection %d', message, data.connid)
+        data.next_message = len(data.messages)
+        if data.outb:
+            data.outb.send(socket)
+    elif mask & selectors.EVENT_WRITE:
+        if not data.outb and data.has_messages():
+            data.outb.write(data.messages[data.next_message])
+            data.next_message += 1
             
         if data.outb:
-            # Any received data stored in data.outb is sent to the server socket using sock.send()
+            # Any data stored in data.outb is sent to the server socket using sock.send()
+            # .readable() is a memoryview of the pending bytes, so no copy is made to send them
             # The .send() method returns the number of bytes sent. 
-            # This number can then be used with slice notation on the .outb buffer to discard the bytes sent.
-            sent = socket.send(data.outb)  # Should be ready to write to the server socket
-            print(f'\nClient sends message: {data.outb!r} to connection {data.connid}')
+            # This number can then be used to discard the bytes sent from the .outb buffer.
+            pending = data.outb.readable()
+            sent = socket.send(pending)  # Should be ready to write to the server socket
+            if message_log.enabled and message_log.sample():
+                log.debug('Client sends message: %r to connection %d', pending[:sent].tobytes(), data.connid)
 
             # After sending the stored data to the server socket, remove the sent bytes from the send buffer
-            data.outb = data.outb[sent:]
+            data.outb.consume(sent)
 
 def start_serving_connection(selector):
     try:
@@ -117,20 +245,323 @@ def start_serving_connection(selector):
     finally:
         selector.close()
 
-if __name__ == '__main__':
-    # This ensures that this program will be ran with appropriate commands accompanied
-    if len(sys.argv) != 4:
-        print(f'Wrong command format. Usage: {sys.argv[0]} <host> <port> <num_connections>')
-        sys.exit(1)
+# Load generation (benchmark) mode
+# Instead of sending the two test messages once, every connection keeps sending requests of payload_size bytes
+#   for duration seconds, and the round-trip time of every request is recorded in a LatencyHistogram
+# A request is complete once payload_size more bytes have been echoed back on its connection,
+#   since the server echoes the bytes of each connection in the order they were sent
+
+# Open benchmark connection connid to server_addr and register it with bench.selector
+def start_bench_connection(server_addr, connid, bench):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    # Small pipelined requests should be sent right away, instead of being held back by Nagle's algorithm
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if bench.tls is not None:
+        # The handshake starts once the connection is established (see bench_serve()), resuming bench.tls_session if set
+        sock = bench.tls.wrap_socket(sock, do_handshake_on_connect=False, session=bench.tls_session)
+    sock.connect_ex(server_addr)
+
+    # outb is a FrameWriter in framed mode, so that all queued requests go out with one sendmsg() call
+    # sent_times holds the time each request in flight was meant to be sent, oldest first
+    # recv_partial is the number of bytes received so far for the oldest request in flight
+    # next_send is the time the next request is due (rate limited mode only), and waiting is True
+    #   when that request could not be sent yet because pipeline requests were already in flight
+    data = types.SimpleNamespace(
+        connid=connid,
+        sock=sock,
+        outb=FrameWriter() if bench.framed else EchoBuffer(),
+        sent_times=collections.deque(),
+        recv_partial=0,
+        next_send=None,
+        waiting=False,
+        connected=False,
+        closed=False,
+        # selectors.EVENT_WRITE tells us when the connection is established
+        events=selectors.EVENT_READ | selectors.EVENT_WRITE,
+        # With TLS, requests wait in outb until the handshake is complete; tls_wants is the event it waits for
+        handshaking=bench.tls is not None,
+        tls_wants=0,
+    )
+    bench.selector.register(sock, data.events, data=data)
+    bench.opened += 1
+
+    now = time.perf_counter_ns()
+    if bench.interval is None:
+        # Closed loop: fill the pipeline right away, then send a new request whenever one completes
+        for i in range(bench.pipeline):
+            queue_request(data, bench, now)
+    else:
+        # Rate limited: spread the first request of each connection evenly over one interval
+        data.next_send = now + (connid - 1) * bench.interval // bench.num_conns
+        heapq.heappush(bench.schedule, (data.next_send, connid, data))
+
+# Queue one request on the connection; sent_at is the time it was meant to be sent, so that a request delayed
+#   by a full pipeline still counts the delay in its latency (no coordinated omission)
+def queue_request(data, bench, sent_at):
+    if bench.framed:
+        data.outb.write_frame(bench.payload)
+    else:
+        data.outb.write(bench.payload)
+    data.sent_times.append(sent_at)
 
+# Send the due request of a rate limited connection if the pipeline has room, and schedule the next one
+def send_scheduled_request(data, bench):
+    if len(data.sent_times) >= bench.pipeline:
+        # Wait for a response first, see complete_responses()
+        data.waiting = True
+        return
+    data.waiting = False
+    queue_request(data, bench, data.next_send)
+    data.next_send += bench.interval
+    heapq.heappush(bench.schedule, (data.next_send, data.connid, data))
+
+# Account for received bytes echoed on the connection, completing the requests they finish
+# Every request has the same size, so each bench.response_size bytes received complete one request, framed or not
+def complete_responses(data, bench, received):
+    data.recv_partial += received
+    now = time.perf_counter_ns()
+    while data.recv_partial >= bench.response_size and data.sent_times:
+        data.recv_partial -= bench.response_size
+        # Latencies are recorded in microseconds
+        bench.histogram.record((now - data.sent_times.popleft()) // 1000)
+        bench.completed += 1
+
+        if not bench.running:
+            continue
+        if bench.interval is None:
+            queue_request(data, bench, now)
+        elif data.waiting:
+            send_scheduled_request(data, bench)
+
+# Benchmark counterpart of update_interest(): selectors.EVENT_WRITE is wanted until the connection is established,
+#   and afterwards only while there are bytes waiting in data.outb
+# In between, a TLS connection only waits for the event its handshake waits for
+def update_bench_interest(selector, sock, data):
+    if data.handshaking and data.connected:
+        events = data.tls_wants
+    else:
+        events = selectors.EVENT_READ
+        if data.outb or not data.connected:
+            events |= selectors.EVENT_WRITE
+    if events != data.events:
+        selector.modify(sock, events, data)
+        data.events = events
+
+def close_bench_connection(selector, sock, data):
+    selector.unregister(sock)
+    sock.close()
+    data.closed = True
+
+# Benchmark counterpart of serve(), without printing anything per message
+def bench_serve(key, mask, bench):
+    sock = key.fileobj
+    data = key.data
+    try:
+        if mask & selectors.EVENT_WRITE:
+            if not data.connected:
+                # The first writable event means that .connect_ex() finished, successfully or not
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise OSError(error, os.strerror(error))
+                data.connected = True
+                bench.connected += 1
+        if data.handshaking:
+            data.tls_wants = EchoTls.handshake(sock)
+            if data.tls_wants:
+                update_bench_interest(bench.selector, sock, data)
+                return
+            data.handshaking = False
+            bench.tls_handshakes += 1
+            if sock.session_reused:
+                bench.tls_resumed += 1
+            # Send the requests queued while handshaking
+            mask = selectors.EVENT_WRITE
+
+        if mask & selectors.EVENT_WRITE:
+            if data.outb and bench.framed:
+                data.outb.send(sock)
+                bench.send_calls += 1
+            elif data.outb:
+                sent = sock.send(data.outb.readable())
+                data.outb.consume(sent)
+                bench.send_calls += 1
+
+        if mask & selectors.EVENT_READ:
+            # bench.recv_buffer is larger than a TLS record, so no decrypted byte is ever left inside the SSL object
+            received = sock.recv_into(bench.recv_buffer)
+            if not received:
+                raise ConnectionResetError('server closed the connection')
+            complete_responses(data, bench, received)
+    except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+        # TLS: nothing was sent or received this time, for example when only session tickets arrived (see EchoTls.py)
+        pass
+    except OSError:
+        bench.errors += 1
+        close_bench_connection(bench.selector, sock, data)
+        return
+    update_bench_interest(bench.selector, sock, data)
+
+# Run the load generator against the server at (host, port) and return its results as a dictionary
+# num_conns: number of connections, opened at ramp connections per second (0 opens them all at once)
+# payload_size: size in bytes of each request
+# pipeline: maximum number of requests in flight per connection
+# rate: total requests per second over all connections (0 for closed loop: send as fast as responses come back)
+# duration: length of the test in seconds, counted from the start of the ramp-up
+# framed: send length-prefixed requests (see EchoFraming.py), to a server also running with --framed
+# tls: SSLContext of the connections (see EchoTls.py), None to connect without TLS
+# tls_session: TLS session every connection tries to resume, None for full handshakes
+def run_benchmark(host, port, num_conns, payload_size=64, pipeline=1, rate=0, duration=10, ramp=0, framed=False,
+                  tls=None, tls_session=None):
+    server_addr = (host, port)
+    bench = types.SimpleNamespace(
+        selector=selectors.DefaultSelector(),
+        num_conns=num_conns,
+        payload=b'x' * payload_size,
+        framed=framed,
+        response_size=payload_size + HEADER.size if framed else payload_size,
+        pipeline=pipeline,
+        # Time between two requests of one connection in nanoseconds, None in closed loop mode
+        interval=int(1e9 * num_conns / rate) if rate else None,
+        # Heap of (time the next request is due, connid, data), rate limited mode only
+        schedule=[],
+        recv_buffer=bytearray(max(65536, payload_size)),
+        histogram=LatencyHistogram(),
+        running=True,
+        opened=0,
+        connected=0,
+        completed=0,
+        send_calls=0,
+        errors=0,
+        tls=tls,
+        tls_session=tls_session,
+        tls_handshakes=0,
+        tls_resumed=0,
+    )
+
+    start = time.perf_counter_ns()
+    end = start + int(duration * 1e9)
+    try:
+        while True:
+            now = time.perf_counter_ns()
+            if now >= end:
+                break
+
+            # Ramp-up: open the connections that are due by now
+            if bench.opened < num_conns:
+                if ramp:
+                    due = min(num_conns, 1 + (now - start) * ramp // 1_000_000_000)
+                else:
+                    due = num_conns
+                while bench.opened < due:
+                    start_bench_connection(server_addr, bench.opened + 1, bench)
+
+            # Rate limited mode: send the requests that are due by now
+            while bench.schedule and bench.schedule[0][0] <= now:
+                next_send, connid, data = heapq.heappop(bench.schedule)
+                if not data.closed:
+                    send_scheduled_request(data, bench)
+                    update_bench_interest(bench.selector, data.sock, data)
+
+            # Sleep in selector.select() until the next request or connection is due, or the test ends
+            wake = end
+            if bench.schedule:
+                wake = min(wake, bench.schedule[0][0])
+            if bench.opened < num_conns and ramp:
+                wake = min(wake, start + bench.opened * 1_000_000_000 // ramp)
+            timeout = max(0, wake - time.perf_counter_ns()) / 1e9
+
+            for key, mask in bench.selector.select(timeout=timeout):
+                bench_serve(key, mask, bench)
+    except KeyboardInterrupt:
+        print('Caught keyboard interrupt, stopping benchmark', file=sys.stderr)
+    finally:
+        bench.running = False
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        for key in list(bench.selector.get_map().values()):
+            close_bench_connection(bench.selector, key.fileobj, key.data)
+        bench.selector.close()
+
+    return {
+        'connections': num_conns,
+        'connected': bench.connected,
+        'errors': bench.errors,
+        'payload_size': payload_size,
+        'framed': framed,
+        'pipeline': pipeline,
+        'rate': rate,
+        'duration_s': round(elapsed, 3),
+        'requests': bench.completed,
+        'msgs_per_sec': round(bench.completed / elapsed, 1),
+        'mb_per_sec': round(bench.completed * payload_size / elapsed / 1e6, 3),
+        'sends_per_request': round(bench.send_calls / bench.completed, 3) if bench.completed else 0,
+        'tls': tls is not None,
+        'tls_handshakes': bench.tls_handshakes,
+        'tls_resumed': bench.tls_resumed,
+        'latency_us': bench.histogram.summary(),
+    }
+
+# Write the results of run_benchmark() to output, as JSON or as CSV (a header row and a value row)
+def write_report(results, output, fmt):
+    if fmt == 'json':
+        json.dump(results, output, indent=2)
+        output.write('\n')
+    else:
+        # Flatten the nested latency dictionary into latency_us_p50, latency_us_p99, ...
+        row = {name: value for name, value in results.items() if name != 'latency_us'}
+        row.update({f'latency_us_{name}': value for name, value in results['latency_us'].items()})
+        writer = csv.DictWriter(output, fieldnames=list(row))
+        writer.writeheader()
+        writer.writerow(row)
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Multi-connection echo client')
+    parser.add_argument('host', help='IP address of the server socket')
+    parser.add_argument('port', type=int, help='port number of the server socket')
+    parser.add_argument('num_connections', type=int, help='number of connections to create to the server')
+    # --framed sends length-prefixed messages (see EchoFraming.py), to a server also running with --framed
+    parser.add_argument('--framed', action='store_true', help='send length-prefixed messages')
+    # Load generation mode, see run_benchmark()
+    parser.add_argument('--bench', action='store_true', help='run as a load generator instead of sending the test messages once')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes per request (default: 64)')
+    parser.add_argument('--pipeline', type=int, default=1, help='maximum requests in flight per connection (default: 1)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='total requests per second over all connections, 0 for closed loop (default: 0)')
+    parser.add_argument('--duration', type=float, default=10, help='test duration in seconds (default: 10)')
+    parser.add_argument('--ramp', type=float, default=0,
+                        help='connections opened per second, 0 to open them all at once (default: 0)')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help='report format (default: json)')
+    parser.add_argument('--output', help='file the report is written to (default: standard output)')
+    # TLS, see EchoTls.py; the server's certificate is only verified with --tls-ca, since it is usually self-signed
+    parser.add_argument('--tls', action='store_true', help='connect over TLS, to a server also running with --tls')
+    parser.add_argument('--tls-ca', help='certificate file (PEM) the server certificate is verified against (default: none)')
+    # Logging (see EchoStats.py); every message is logged by default, since this program only sends a few of them
+    EchoStats.add_logging_arguments(parser, default_level='debug')
+    return parser.parse_args()
+
+if __name__ == '__main__':
     # Client IP address and port number will be parsed from inputed commands
-    host, port, num_conns = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
-    # Two binary messages used for testing in client's side program
+    args = parse_arguments()
+    host, port, num_conns = args.host, args.port, args.num_connections
+    EchoStats.setup_logging(args.log_level, args.log_sample)
+    tls = EchoTls.client_context(args.tls_ca) if args.tls else None
 
+    if args.bench:
+        results = run_benchmark(host, port, num_conns, args.payload_size, args.pipeline,
+                                args.rate, args.duration, args.ramp, args.framed, tls)
+        if args.output:
+            with open(args.output, 'w', newline='') as output:
+                write_report(results, output, args.format)
+        else:
+            write_report(results, sys.stdout, args.format)
+        sys.exit(0)
+
+    # Two binary messages used for testing in client's side program
     messages = [b"Message 1, sent by client. ", b"Message 2, sent by client. "]
     #messages = [b'', b'']
 
     # Introduce selector to handle multiple connection simultaneously
     selector = selectors.DefaultSelector()
-    start_connections(host, port, num_conns, selector, messages)
+    start_connections(host, port, num_conns, selector, messages, args.framed, tls)
     start_serving_connection(selector)
@@ -1,94 +1,591 @@
 # MultiConnEchoServer.py
 
 # Example commands to run this program: python3 MultiConnEchoServer.py 127.0.0.1 65432
+# Example commands to run this program with 4 worker processes: python3 MultiConnEchoServer.py 127.0.0.1 65432 --workers 4
+# Example commands to run this program with the asyncio engine: python3 MultiConnEchoServer.py 127.0.0.1 65432 --engine asyncio
+# Example commands to run this program with length-prefixed messages: python3 MultiConnEchoServer.py 127.0.0.1 65432 --framed
+# Example commands to run this program logging 1 in every 1000 messages: python3 MultiConnEchoServer.py 127.0.0.1 65432 --log-level debug --log-sample 1000
+# Example commands to run this program with a stats socket: python3 MultiConnEchoServer.py 127.0.0.1 65432 --stats-port 9100
+# Example commands to run this program with connection limits: python3 MultiConnEchoServer.py 127.0.0.1 65432 --max-connections 10000 --idle-timeout 60
+# Example commands to run this program for connection storms: python3 MultiConnEchoServer.py 127.0.0.1 65432 --backlog 4096 --accept-batch 256
+# Example commands to run this program with TLS (and a self-signed certificate): python3 MultiConnEchoServer.py 127.0.0.1 65432 --tls
+# Example commands to run this program with TLS and a server-side session cache: python3 MultiConnEchoServer.py 127.0.0.1 65432 --tls --tls-sessions cache
 
+import ssl
 import sys
+import json
+import time
+import signal
 import socket
+import tempfile
+import argparse
 import selectors
 import types
+import multiprocessing
 
-# Accept the connection established by a client socket
+import AsyncEchoServer
+import EchoStats
+import EchoTls
+from EchoStats import log, message_log
+from EchoBuffer import EchoBuffer, HIGH_WATER, LOW_WATER, buffer_pool
+from EchoFraming import FrameParser, FrameWriter
+from TimerWheel import TimerWheel
+from EchoCounters import (COUNTER_NAMES, ACCEPTS, CLOSES, BYTES_IN, BYTES_OUT, READ_PAUSES, BUDGET_PAUSES, READ_RESUMES,
+                          SEND_CALLS, FRAMES, TIMEOUTS, REFUSED, ACCEPT_WAKEUPS, ACCEPT_ERRORS, TLS_HANDSHAKES,
+                          TLS_RESUMED, TLS_FAILURES, BUDGET_CLOSES, new_counters)
+
+# Maximum number of bytes received from a client socket per reading event
+RECV_SIZE = 65536
+
+# Default memory budget (in bytes) for the output buffered by all connections together
+MEMORY_BUDGET = 64 * 1024 * 1024
+
+# Marker stored as the data of the stats socket in the selector (see setup_stats_socket())
+STATS_SOCKET = 'stats'
+
+# Default number of seconds given to connections to receive their waiting output when the server shuts down
+DRAIN_TIMEOUT = 5.0
+
+# Default maximum number of connections accepted per wakeup of the server socket (see accept())
+ACCEPT_BATCH = 64
+
+# Restart backoff of the workers in worker mode (see start_workers()): a worker that dies less than WORKER_MIN_UPTIME
+#   seconds after it started (e.g. failing to bind its server socket) is restarted after a delay that starts at
+#   RESTART_DELAY seconds and doubles each time, up to MAX_RESTART_DELAY seconds
+WORKER_MIN_UPTIME = 5.0
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+# framed is True when clients send length-prefixed messages (see EchoFraming.py), which are then echoed message by message,
+#   many messages per sendmsg() call; run_engine() sets it from the commands used to run this program
+framed = False
+
+# Counters kept by this process (see EchoCounters.py)
+# In worker mode, run_worker() replaces them with the worker's slice of shared memory
+counters = new_counters()
+
+# Flow control state of the selectors engine, so that clients which send faster than they read
+#   cannot make the server buffer without bound:
+# - high_water / low_water: reading from a connection pauses once it holds high_water bytes (see buffered()) with
+#   output waiting, and resumes once its data.outb drains to low_water bytes
+# - memory_budget: reading from any connection that receives pauses once all connections together hold more than
+#   memory_budget bytes (0 for no budget), and paused connections resume once the total drains to budget_low
+#   (the same proportion of the budget as low_water is of high_water)
+# - queued: number of bytes held by all connections together (see buffered())
+# - over_budget: True from the moment queued passes memory_budget until it drains to budget_low
+# - paused: the paused connections, as {conn: data}
+# - draining: True once the server is shutting down (see drain_connections()); reading never resumes after that
+# run_engine() sets the limits from the commands used to run this program
+flow = types.SimpleNamespace(
+    high_water=HIGH_WATER,
+    low_water=LOW_WATER,
+    memory_budget=MEMORY_BUDGET,
+    budget_low=MEMORY_BUDGET * LOW_WATER // HIGH_WATER,
+    queued=0,
+    over_budget=False,
+    paused={},
+    draining=False,
+)
+
+# Statistics of the selectors event loop (see EchoStats.py)
+loop_stats = EchoStats.LoopStats()
+
+# Connection limits and timeouts of the selectors engine, 0 meaning no limit:
+# - max_connections: connections beyond this many are accepted and closed right away (refused)
+# - active: number of connections currently open
+# - idle_timeout: a connection is closed after this many seconds without receiving or sending any byte
+# - read_timeout: a connection is closed after this many seconds without receiving any byte
+# - write_timeout: a connection is closed after this many seconds with output waiting but no byte sent
+# - drain_timeout: on shutdown, seconds given to connections to receive their waiting output before being closed
+# - wheel: TimerWheel holding one timer per connection (its data), due at the earliest of its timeouts
+#   (None when no timeout is set, so that connections have no timer to update at all)
+# - now: time.monotonic() at the last wakeup of the event loop, used as the time of every event it handles
+# run_engine() sets the limits from the commands used to run this program
+limits = types.SimpleNamespace(
+    max_connections=0,
+    active=0,
+    idle_timeout=0,
+    read_timeout=0,
+    write_timeout=0,
+    drain_timeout=DRAIN_TIMEOUT,
+    wheel=None,
+    now=time.monotonic(),
+)
+
+# How the selectors engine accepts connections:
+# - accept_batch: maximum number of connections accepted per wakeup of the server socket
+# - nodelay: True to set TCP_NODELAY on every accepted connection, so that small echoes are sent right away
+# run_engine() sets them from the commands used to run this program
+accepting = types.SimpleNamespace(
+    accept_batch=ACCEPT_BATCH,
+    nodelay=False,
+)
+
+# TLS state of the selectors engine (see EchoTls.py):
+# - context: the SSLContext accepted connections are wrapped with, None without --tls
+# - pending: the connections with decrypted bytes waiting inside their SSL object, as {conn: data}; the selector
+#   cannot see those bytes, so these connections are served as if they were ready for reading (see serve_pending())
+# - certdir: the tempfile.TemporaryDirectory holding the self-signed certificate and its private key, when --tls runs
+#   without --tls-cert; kept for the life of the server (workers load the certificate whenever they start), and
+#   removed with everything in it when the server exits
+# run_engine() sets the context from the commands used to run this program
+tls = types.SimpleNamespace(
+    context=None,
+    pending={},
+    certdir=None,
+)
+
+# State of one accepted connection, stored as the data of its socket in the selector
+# A class with __slots__ rather than a types.SimpleNamespace, since there is one per connection: its attributes are
+#   stored in fixed slots instead of a per-object __dict__, so each record takes about a third of the memory
+# conn and addr are the socket and the address of the client socket
+# outb is the output buffer: since the server echoes, received bytes are written straight into it and sent from there
+#   (see EchoBuffer.py); in framed mode, received bytes go to inb, a FrameParser, and the complete messages it finds
+#   are queued in outb, a FrameWriter (which has the same len() and truth value as an EchoBuffer)
+# Neither of them holds any storage while the connection is idle
+# events is the set of events conn is currently registered with (see update_interest())
+# paused is True while reading from conn is paused by flow control (see pause_reading())
+# last_read and last_sent are the times a byte was last received and last sent (see update_timer())
+# deadline and wheel_deadline make the record the timer of conn in limits.wheel (see TimerWheel.py)
+# handshaking is True until the TLS handshake of conn is complete, and tls_wants the event the handshake waits for
+class Connection:
+    __slots__ = ('conn', 'addr', 'outb', 'inb', 'events', 'paused', 'last_read', 'last_sent', 'deadline', 'wheel_deadline',
+                 'handshaking', 'tls_wants')
+
+    def __init__(self, conn, addr, now, framed=False, handshaking=False):
+        self.conn = conn
+        self.addr = addr
+        if framed:
+            self.inb = FrameParser()
+            self.outb = FrameWriter()
+        else:
+            self.inb = None
+            self.outb = EchoBuffer()
+        self.events = 0
+        self.paused = False
+        self.last_read = now
+        self.last_sent = now
+        self.deadline = None
+        self.wheel_deadline = None
+        self.handshaking = handshaking
+        # The server speaks second: the handshake starts by waiting for the client's hello
+        self.tls_wants = selectors.EVENT_READ if handshaking else 0
+
+# Accept the connections established by client sockets
 # socket is serverSocket
 # selector is registered with serverSocket and events: selectors.EVENT_READ
+# Accepting only one connection per wakeup would take one loop iteration per connection, so during a connection storm
+#   the backlog fills up faster than it drains: instead, the backlog is drained until it is empty,
+#   but never more than accepting.accept_batch connections at once, so that connections already open still get served
 def accept(serverSocket, selector):
-    # Should be ready to read since the listening socket was registered with selectors.EVENT_READ
-    # conn is a new socket object (a sub socket created by the serverSocket)
-    #   which can be used to send and receive data, to or from the connected client socket
-    # For each client socket accepted, there will be one corresponding conn to be connected with it
-    conn, address = serverSocket.accept()
-    print(f'\nServer accepts connection from {address}')
+    counters[ACCEPT_WAKEUPS] += 1
+    accepted = 0
+    while accepted < accepting.accept_batch:
+        # conn is a new socket object (a sub socket created by the serverSocket)
+        #   which can be used to send and receive data, to or from the connected client socket
+        # For each client socket accepted, there will be one corresponding conn to be connected with it
+        try:
+            conn, address = serverSocket.accept()
+        except BlockingIOError:
+            # The backlog is empty (or another worker sharing serverSocket accepted the connection first)
+            break
+        except OSError as error:
+            # For example too many open files: leave the rest of the backlog for the next wakeup
+            counters[ACCEPT_ERRORS] += 1
+            log.warning('Server could not accept a connection: %s', error)
+            break
+        accepted += 1
+        accept_connection(conn, address, selector)
+    loop_stats.record_accepts(accepted)
+
+# Set up conn, the connection accepted from the client socket at address, and register it with selector
+def accept_connection(conn, address, selector):
+    counters[ACCEPTS] += 1
+
+    # Refuse the connection cleanly (the client socket sees it closed) once the maximum number of connections is open
+    if limits.max_connections and limits.active >= limits.max_connections:
+        conn.close()
+        counters[REFUSED] += 1
+        log.info('Server refuses connection from %s: %d connections open', address, limits.active)
+        return
+    limits.active += 1
+    log.info('Server accepts connection from %s', address)
 
     # setblocking(False) to conn will set it to non-blocking state
     # Reason to do so: if conn blocks, then the entire server is stalled until it returns. 
     # This means other sockets are left waiting even though the server isn’t actively working
     conn.setblocking(False)
+    if accepting.nodelay:
+        # Send small echoes right away instead of waiting (Nagle's algorithm) for the previous ones to be acknowledged
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if tls.context is not None:
+        # The handshake is not done here, which would block: serve() drives it, one event at a time
+        conn = tls.context.wrap_socket(conn, server_side=True, do_handshake_on_connect=False)
 
-    # Credit for SimpleNamespace explanation: https://shorturl.at/Uo7B7
-    # .SimpleNamespace is similar to an empty class, except that it has several advantages
-    # data is the object that holds the data info we want to be included along with the socket
+    # data is the object that holds the data info we want to be included along with the socket (see Connection)
     # Therefore, for every newly connected (accepted) client socket, there will be a corresponding data object
-    # each data is initialized with the client socket's address, an empty binary input variable and an empty binary output variable
-    data = types.SimpleNamespace(addr=address, inb=b'', outb=b'')
+    data = Connection(conn, address, limits.now, framed, tls.context is not None)
 
-    # events should be selectors.EVENT_READ OR selectors.EVENT_WRITE 
-    #   since we want to know when the client connection is ready for readinig and writing
-    events = selectors.EVENT_READ | selectors.EVENT_WRITE
+    # events is only selectors.EVENT_READ for now, since there is nothing to echo back yet
+    # A TCP socket is almost always ready for writing, so also asking for selectors.EVENT_WRITE here would make
+    #   selector.select() return immediately for every idle connection, and the server would spin at 100% CPU
+    # selectors.EVENT_WRITE is added by update_interest() only while data.outb has bytes waiting to be sent
+    # data.events remembers which events conn is currently registered with
+    data.events = selectors.EVENT_READ
     
     # .register() registers conn to be monitored with selector.select()
-    # conn would want these events: selectors.EVENT_READ OR selectors.EVENT_WRITE
+    # conn would want read events: selectors.EVENT_READ
     # data will store what's being sent and received by conn
-    selector.register(conn, events, data)
+    selector.register(conn, data.events, data)
+    update_timer(data)
+
+# Schedule the timer of the connection at the earliest of its idle, read and write timeouts
+# This runs after every event of the connection, so it has to stay cheap: rescheduling a later deadline
+#   only updates data.deadline (see TimerWheel.py)
+def update_timer(data):
+    if limits.wheel is None:
+        return
+    deadline = None
+    if limits.idle_timeout:
+        deadline = max(data.last_read, data.last_sent) + limits.idle_timeout
+    if limits.read_timeout:
+        read_deadline = data.last_read + limits.read_timeout
+        if deadline is None or read_deadline < deadline:
+            deadline = read_deadline
+    if limits.write_timeout and data.outb:
+        write_deadline = data.last_sent + limits.write_timeout
+        if deadline is None or write_deadline < deadline:
+            deadline = write_deadline
+
+    if deadline is None:
+        limits.wheel.cancel(data)
+    else:
+        limits.wheel.schedule(data, deadline)
+
+# Update the events selector monitors conn for, so that selectors.EVENT_WRITE is only requested
+#   while data.outb has bytes waiting to be sent to the client socket, and selectors.EVENT_READ
+#   only while reading from conn is not paused by flow control
+# selector.modify() is only called when the events actually change
+# A selector cannot monitor a socket for no events at all, so a paused connection with nothing left to send
+#   is unregistered, and registered again once it resumes
+# Until its TLS handshake is complete, conn is only monitored for the event the handshake waits for
+def update_interest(selector, conn, data):
+    events = 0
+    if data.handshaking:
+        events = data.tls_wants
+    else:
+        if not data.paused:
+            events |= selectors.EVENT_READ
+        if data.outb:
+            events |= selectors.EVENT_WRITE
+    if events == data.events:
+        return
+    if not events:
+        selector.unregister(conn)
+    elif not data.events:
+        selector.register(conn, events, data)
+    else:
+        selector.modify(conn, events, data)
+    data.events = events
+
+# Number of bytes held for the connection of data: its output, and in framed mode the incomplete frame at the end of
+#   its input (up to EchoFraming.MAX_FRAME_SIZE), so that partial frames count toward the watermarks and the budget too
+def buffered(data):
+    if data.inb is None:
+        return len(data.outb)
+    return len(data.outb) + len(data.inb)
+
+# Stop reading from conn, because its own output passed the high watermark or all output passed the memory budget
+def pause_reading(conn, data, counter):
+    data.paused = True
+    flow.paused[conn] = data
+    counters[counter] += 1
+
+# Resume reading from conn, if it was paused and its output drained to the low watermark
+# Connections paused by the memory budget stay paused until all output drained to flow.budget_low
+def resume_reading(selector, conn, data):
+    if data.paused and len(data.outb) <= flow.low_water and not flow.over_budget and not flow.draining:
+        data.paused = False
+        del flow.paused[conn]
+        counters[READ_RESUMES] += 1
+        update_interest(selector, conn, data)
+
+# Account for num_bytes more (or fewer, if negative) bytes held by some connection, and update flow.over_budget
+# Once the total drains to flow.budget_low, every connection paused by the memory budget is given a chance to resume
+def add_queued(selector, num_bytes):
+    flow.queued += num_bytes
+    if not flow.memory_budget:
+        return
+    if flow.queued > flow.memory_budget:
+        flow.over_budget = True
+    elif flow.over_budget and flow.queued <= flow.budget_low:
+        flow.over_budget = False
+        for conn, data in list(flow.paused.items()):
+            resume_reading(selector, conn, data)
+
+# Close the connection between conn and the client socket, forgetting whatever was still buffered for it
+def close_connection(selector, conn, data):
+    if data.events:
+        selector.unregister(conn)
+    if data.paused:
+        del flow.paused[conn]
+    tls.pending.pop(conn, None)
+    add_queued(selector, -buffered(data))
+    if limits.wheel is not None:
+        limits.wheel.cancel(data)
+    if tls.context is not None and not data.handshaking:
+        EchoTls.close_notify(conn)
+    conn.close()
+    limits.active -= 1
+    counters[CLOSES] += 1
+    log.info('Server closes connection to %s', data.addr)
+
+# Advance the TLS handshake of conn, and return True once it is complete (see EchoTls.handshake())
+def tls_handshake(conn, data):
+    data.tls_wants = EchoTls.handshake(conn)
+    if data.tls_wants:
+        return False
+    data.handshaking = False
+    counters[TLS_HANDSHAKES] += 1
+    if conn.session_reused:
+        counters[TLS_RESUMED] += 1
+    log.info('Server completes TLS handshake with %s (%s, session %s)', data.addr, conn.version(),
+             'resumed' if conn.session_reused else 'new')
+    return True
 
 # Perform services on the connection between conn and the client socket
 # key contains the socket object (fileobj) and data object
 # mask contains the events that are ready
-# selector is registered with conn and events: selectors.EVENT_READ OR selectors.EVENT_WRITE
+# selector is registered with conn and events: selectors.EVENT_READ while reading is not paused by flow control,
+#   plus selectors.EVENT_WRITE while data.outb is not empty
 def serve(key, mask, selector):
     # Retrive socket object and data object from key
     socket = key.fileobj
     data = key.data
 
-    # Handle reading event if the socket is ready for reading
-    if mask & selectors.EVENT_READ:
-        recv_data = socket.recv(1024)
-        # If receiving data sent by client socket
-        if recv_data:
-            # Append received data to data.outb to later sent it back to the client socket (echo)
-            data.outb += recv_data
-        else: 
-            # If there are no data received, it means that the client socket wants to close the connection with conn
-            selector.unregister(socket)
-            socket.close()
-            print(f'\nServer closes connection to {data.addr}')
-
-    # Handle writing event if the socket is ready for writing
-    if mask & selectors.EVENT_WRITE:
-        # Received data stored in data.outb, if any, is echoed to the client using sock.send()
-        if data.outb:
-            # The .send() method returns the number of bytes sent. 
-            # This number can then be used with slice notation on the .outb buffer to discard the bytes sent.
-            sent = socket.send(data.outb)
-            print(f'\nServer echos message: {data.outb!r} to {data.addr}')
-            
-            # After sending the stored data to the client socket, clear the buffer by removing sent bytes
-            data.outb = data.outb[sent:]
+    # A client socket that resets the connection (for example by closing it with unread data), or whose connection
+    #   fails in any other way (timed out, host unreachable...), is closed on our side too, instead of stopping the
+    #   whole server
+    # In framed mode, so is a client socket that sends a message larger than EchoFraming.MAX_FRAME_SIZE,
+    #   and with TLS, a client socket whose handshake or records are invalid
+    try:
+        # With TLS, nothing is echoed until the handshake is complete
+        if data.handshaking:
+            if not tls_handshake(socket, data):
+                update_interest(selector, socket, data)
+                update_timer(data)
+                return
+            # The client's first request may have arrived along with the end of the handshake
+            mask = selectors.EVENT_READ
 
-# Setup the server socket
-def setup_serverSocket():
-    # This ensures that this program will be ran with appropriate commands accompanied
-    if len(sys.argv) != 3:
-        print(f'Wrong command format. Usage: {sys.argv[0]} <host> <port>')
-        sys.exit(1)
+        # Handle reading event if the socket is ready for reading
+        if mask & selectors.EVENT_READ:
+            # Never receive more than what brings the connection up to the high watermark, unless all it holds is
+            #   an incomplete frame, which only the rest of it can turn into output
+            held = buffered(data)
+            room = flow.high_water - held if data.outb or data.inb is None else flow.high_water
+            recv_size = min(RECV_SIZE, max(room, 1))
+            queued = len(data.outb)
+            try:
+                if framed:
+                    # Receive into the FrameParser, and queue every complete message to be sent back as it is
+                    received = data.inb.recv_into(socket, recv_size)
+                else:
+                    # Receive straight into the free space of data.outb, to later sent it back to the client socket (echo)
+                    received = data.outb.recv_into(socket, recv_size)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                # TLS: only records without application data were received (see EchoTls.py)
+                received = None
+            # Account for the received bytes before parsing them, which can fail (and then close the connection)
+            add_queued(selector, buffered(data) - held)
+            if framed and received:
+                # Complete frames move from data.inb to data.outb with the same size, header included
+                for payload in data.inb.frames():
+                    data.outb.write_frame(payload)
+                    counters[FRAMES] += 1
+                    if message_log.enabled and message_log.sample():
+                        log.debug('Server echos message: %r to %s', payload, data.addr)
+            if tls.context is not None:
+                # Part of a TLS record may be left inside the SSL object, out of sight of the selector
+                if socket.pending():
+                    tls.pending[socket] = data
+                else:
+                    tls.pending.pop(socket, None)
+            # If receiving data sent by client socket
+            if received:
+                counters[BYTES_IN] += received
+                data.last_read = limits.now
+                if not queued:
+                    # Output just started waiting: the write timeout counts from now
+                    data.last_sent = limits.now
+                # Flow control: stop reading from this client socket until the output buffered for it
+                #   (or for all client sockets) drained
+                # A connection holding nothing but an incomplete frame is never paused: waiting cannot shrink that frame,
+                #   only reading the rest of it can; over the memory budget, it keeps reading as long as the frame stays
+                #   below the high watermark, and is closed once it is larger (such frames would hold the budget)
+                if data.outb and buffered(data) >= flow.high_water:
+                    pause_reading(socket, data, READ_PAUSES)
+                elif flow.over_budget:
+                    if data.outb:
+                        pause_reading(socket, data, BUDGET_PAUSES)
+                    elif buffered(data) >= flow.high_water:
+                        counters[BUDGET_CLOSES] += 1
+                        log.warning('Server closes connection to %s, its incomplete frame of %d bytes is over the '
+                                    'memory budget', data.addr, buffered(data))
+                        close_connection(selector, socket, data)
+                        return
+            elif received is not None:
+                # If there are no data received, it means that the client socket wants to close the connection with conn
+                close_connection(selector, socket, data)
+                return
+
+        # Handle writing event if the socket is ready for writing
+        if mask & selectors.EVENT_WRITE:
+            if framed and data.outb:
+                # All queued messages (up to EchoFraming.IOV_MAX buffers) are sent with a single sendmsg() call
+                sent = data.outb.send(socket)
+                counters[SEND_CALLS] += 1
+                counters[BYTES_OUT] += sent
+                data.last_sent = limits.now
+                add_queued(selector, -sent)
+                resume_reading(selector, socket, data)
+            # Received data stored in data.outb, if any, is echoed to the client using sock.send()
+            elif data.outb:
+                # .readable() is a memoryview of the pending bytes, so no copy is made to send them
+                # The .send() method returns the number of bytes sent. 
+                # This number can then be used to discard the bytes sent from the .outb buffer.
+                pending = data.outb.readable()
+                sent = socket.send(pending)
+                counters[SEND_CALLS] += 1
+                counters[BYTES_OUT] += sent
+                if message_log.enabled and message_log.sample():
+                    log.debug('Server echos message: %r to %s', pending[:sent].tobytes(), data.addr)
+                
+                # After sending the stored data to the client socket, clear the buffer by removing sent bytes
+                data.outb.consume(sent)
+                data.last_sent = limits.now
+                add_queued(selector, -sent)
+                resume_reading(selector, socket, data)
+    except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+        # TLS: nothing could be sent this time (see EchoTls.py); selectors.EVENT_WRITE stays requested
+        #   as long as data.outb has bytes waiting
+        pass
+    except BlockingIOError:
+        # A spurious wakeup: nothing to receive, or no room to send, after all
+        pass
+    except (OSError, ValueError):
+        # ssl.SSLError is an OSError too
+        if data.handshaking:
+            counters[TLS_FAILURES] += 1
+        close_connection(selector, socket, data)
+        return
+
+    # While the server shuts down, a connection is closed as soon as all its waiting output is sent
+    if flow.draining and not data.outb:
+        close_connection(selector, socket, data)
+        return
+
+    # Ask for selectors.EVENT_WRITE if there are now bytes to echo back, or stop asking once they are all sent
+    # Also stop asking for selectors.EVENT_READ if reading was just paused
+    update_interest(selector, socket, data)
+    update_timer(data)
+
+# Serve the connections with decrypted bytes waiting inside their SSL object (see tls), unless reading from them is paused
+def serve_pending(selector):
+    for conn, data in list(tls.pending.items()):
+        if conn in tls.pending and not data.paused:
+            serve(selectors.SelectorKey(conn, conn.fileno(), data.events, data), selectors.EVENT_READ, selector)
 
-    # Server IP address and port number will be parsed from inputed commands
-    host, port = sys.argv[1], int(sys.argv[2])
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Multi-connection echo server')
+    parser.add_argument('host', help='IP address the server socket binds to')
+    parser.add_argument('port', type=int, help='port number the server socket binds to')
+    # --workers N runs N copies of the selector loop in N processes, all of them sharing the same port
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes serving connections (default: 1, no supervisor)')
+    # --engine selects the event loop serving connections: the selectors loop in this file, or AsyncEchoServer.py
+    parser.add_argument('--engine', choices=('selectors', 'asyncio'), default='selectors',
+                        help='event loop engine (default: selectors)')
+    # Flow control of each connection: reading pauses above --high-water buffered output bytes,
+    #   and resumes below --low-water buffered output bytes
+    parser.add_argument('--high-water', type=int, default=HIGH_WATER,
+                        help=f'buffered output bytes above which reading pauses (default: {HIGH_WATER})')
+    parser.add_argument('--low-water', type=int, default=LOW_WATER,
+                        help=f'buffered output bytes below which reading resumes (default: {LOW_WATER})')
+    # --framed echoes length-prefixed messages (see EchoFraming.py) instead of a plain stream of bytes
+    parser.add_argument('--framed', action='store_true', help='clients send length-prefixed messages')
+    # Flow control over all connections (selectors engine)
+    parser.add_argument('--memory-budget', type=int, default=MEMORY_BUDGET,
+                        help=f'buffered output bytes over all connections above which reading pauses, '
+                             f'0 for no budget (default: {MEMORY_BUDGET})')
+    # Connection limits and timeouts (selectors engine), see limits
+    parser.add_argument('--max-connections', type=int, default=0,
+                        help='maximum number of open connections, 0 for no limit (default: 0)')
+    parser.add_argument('--idle-timeout', type=float, default=0,
+                        help='seconds without receiving or sending before a connection is closed, 0 for none (default: 0)')
+    parser.add_argument('--read-timeout', type=float, default=0,
+                        help='seconds without receiving before a connection is closed, 0 for none (default: 0)')
+    parser.add_argument('--write-timeout', type=float, default=0,
+                        help='seconds with output waiting but nothing sent before a connection is closed, 0 for none (default: 0)')
+    parser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                        help=f'seconds given to connections to receive their waiting output on shutdown (default: {DRAIN_TIMEOUT:g})')
+    # Accepting connections, see setup_serverSocket() and accept()
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN,
+                        help=f'length of the queue of connections waiting to be accepted (default: {socket.SOMAXCONN})')
+    parser.add_argument('--accept-batch', type=int, default=ACCEPT_BATCH,
+                        help=f'maximum connections accepted per wakeup (selectors engine; default: {ACCEPT_BATCH})')
+    parser.add_argument('--nodelay', action='store_true',
+                        help='set TCP_NODELAY on accepted connections (selectors engine; asyncio always sets it)')
+    parser.add_argument('--sndbuf', type=int, default=0,
+                        help='SO_SNDBUF of the server socket, inherited by accepted connections, 0 for the system default (default: 0)')
+    parser.add_argument('--rcvbuf', type=int, default=0,
+                        help='SO_RCVBUF of the server socket, inherited by accepted connections, 0 for the system default (default: 0)')
+    # Logging and statistics, see EchoStats.py
+    EchoStats.add_logging_arguments(parser)
+    parser.add_argument('--stats-port', type=int, default=0,
+                        help='local port serving statistics as JSON (selectors engine; worker i uses STATS_PORT + i), 0 for none (default: 0)')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='seconds between statistics dumps as JSON lines (selectors engine), 0 for none (default: 0)')
+    parser.add_argument('--stats-file', help='file statistics dumps are appended to (default: standard error)')
+    # TLS, see EchoTls.py; without --tls-cert, a self-signed certificate is created for this run
+    parser.add_argument('--tls', action='store_true', help='serve connections over TLS')
+    parser.add_argument('--tls-cert', help='certificate file (PEM) of the server (default: a self-signed certificate)')
+    parser.add_argument('--tls-key', help='private key file (PEM) of the certificate (default: in --tls-cert)')
+    parser.add_argument('--tls-sessions', choices=EchoTls.SESSION_MODES, default='tickets',
+                        help='how sessions are kept for resumption: stateless tickets, or a server-side cache (default: tickets)')
+    args = parser.parse_args()
+    if not 0 <= args.low_water < args.high_water:
+        parser.error('--low-water has to be lower than --high-water')
+    if args.accept_batch < 1:
+        parser.error('--accept-batch has to be at least 1')
+    if args.tls and not args.tls_cert:
+        tls.certdir = tempfile.TemporaryDirectory(prefix='echo-tls-')
+        args.tls_cert, args.tls_key = EchoTls.create_certificate(tls.certdir.name)
+        print(f'Server uses the self-signed certificate {args.tls_cert}')
+    return args
 
+# Setup the server socket
+# reuse_port=True sets SO_REUSEPORT on serverSocket, so that several processes can each bind their own
+#   server socket to the same (host, port), with the kernel spreading incoming connections between them
+# backlog is the length of the queue of connections established but not accepted yet; connections arriving
+#   while it is full are dropped and retried by the client about a second later, so it has to absorb connection storms
+#   (the system caps it, on Linux at net.core.somaxconn)
+# sndbuf and rcvbuf, unless 0, set SO_SNDBUF and SO_RCVBUF; they are set before listening, so that every accepted
+#   connection inherits them (the receive buffer size has to be known before the handshake to pick the TCP window scale)
+def setup_serverSocket(host, port, reuse_port=False, backlog=socket.SOMAXCONN, sndbuf=0, rcvbuf=0):
     # Create the server socket, call it serverSocket
     serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if reuse_port:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    if sndbuf:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
     serverSocket.bind((host, port))
 
     # Make serverSocket start listening to connections (not yet accept any, just open for connection)
-    serverSocket.listen()
+    serverSocket.listen(backlog)
     print(f'Server listens on {(host, port)}')
 
     # When setblocking(False) is used with selector.select(), it will wait for events on one or more sockets,
@@ -107,39 +604,308 @@ def setup_selector(serverSocket):
     selector.register(serverSocket, selectors.EVENT_READ, data=None)
     return selector
 
+# Close every connection whose timer is due (see update_timer())
+def expire_connections(selector):
+    for data in limits.wheel.expire(limits.now):
+        counters[TIMEOUTS] += 1
+        log.info('Server times out connection to %s', data.addr)
+        close_connection(selector, data.conn, data)
+
+# Shut the server down gracefully instead of dropping every connection at once:
+#   - stop accepting connections, by closing serverSocket
+#   - stop reading from every connection, and close the ones with no output waiting
+#   - keep sending the waiting output for up to limits.drain_timeout seconds, closing each connection once it is all sent
+#   - close whatever connection is left
+def drain_connections(selector):
+    flow.draining = True
+    deadline = time.monotonic() + limits.drain_timeout
+
+    connections = dict(flow.paused)
+    for key in list(selector.get_map().values()):
+        if key.data is None or key.data is STATS_SOCKET:
+            # serverSocket, or the stats socket
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+        else:
+            connections[key.fileobj] = key.data
+    print(f'Server drains {len(connections)} connections')
+
+    for conn, data in connections.items():
+        if not data.paused:
+            data.paused = True
+            flow.paused[conn] = data
+        if data.outb:
+            update_interest(selector, conn, data)
+        else:
+            close_connection(selector, conn, data)
+
+    try:
+        while selector.get_map():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            events = selector.select(timeout=timeout)
+            limits.now = time.monotonic()
+            for key, mask in events:
+                serve(key, mask, selector)
+    except KeyboardInterrupt:
+        print('Caught user keyboard interrupt again, closing connections now')
+
+    for key in list(selector.get_map().values()):
+        close_connection(selector, key.fileobj, key.data)
+
+# Return the statistics of this server (see EchoStats.snapshot())
+def server_snapshot(selector):
+    buffer_sizes = [len(key.data.outb) for key in selector.get_map().values() if isinstance(key.data, Connection)]
+    buffer_sizes += [len(data.outb) for data in flow.paused.values() if not data.events]
+    extra = {}
+    if tls.context is not None:
+        # Handshakes, and how many of them resumed a session (see EchoTls.summary())
+        extra['tls'] = EchoTls.summary(counters[TLS_HANDSHAKES], counters[TLS_RESUMED], counters[TLS_FAILURES], tls.context)
+    return EchoStats.snapshot(
+        counters,
+        loop_stats,
+        buffer_sizes,
+        connections=limits.active,
+        queued_bytes=flow.queued,
+        paused_connections=len(flow.paused),
+        pooled_buffers=len(buffer_pool.free),
+        rss_bytes=EchoStats.rss_bytes(),
+        **extra,
+    )
+
+# Setup the stats socket: a local server socket on port stats_port, monitored by selector like serverSocket
+# Connecting to it (for example with "nc 127.0.0.1 <stats_port>") returns the statistics of this server as JSON
+def setup_stats_socket(selector, stats_port):
+    statsSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    statsSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    statsSocket.bind(('127.0.0.1', stats_port))
+    statsSocket.listen()
+    statsSocket.setblocking(False)
+    selector.register(statsSocket, selectors.EVENT_READ, data=STATS_SOCKET)
+    print(f'Server serves statistics on {("127.0.0.1", stats_port)}')
+
+# Answer one connection to the stats socket with the statistics of this server, then close it
+# The answer is a few kilobytes sent on a local connection, so it is sent in blocking mode with a short timeout
+def serve_stats(statsSocket, selector):
+    try:
+        conn, address = statsSocket.accept()
+    except BlockingIOError:
+        return
+    with conn:
+        conn.settimeout(1)
+        try:
+            conn.sendall(json.dumps(server_snapshot(selector), indent=2).encode() + b'\n')
+        except OSError as error:
+            log.warning('Server could not send statistics to %s: %s', address, error)
+
 # Accepting or Serving connections from client sockets
 # selector is registered with serverSocket and events: selectors.EVENT_READ
 def start_listen_connections(selector):
+    limits.now = time.monotonic()
+    if limits.idle_timeout or limits.read_timeout or limits.write_timeout:
+        limits.wheel = TimerWheel(limits.now)
+    if loop_stats.dump_interval:
+        loop_stats.next_dump = limits.now + loop_stats.dump_interval
+
     try:
         # Keep running until an user keyboard input interrupt this program
         while True:
-            # selector.select(timeout=None) blocks indefinitely until there are sockets ready for reading or writing events
+            # selector.select() blocks until there are sockets ready for reading or writing events,
+            #   or until the next connection timer or statistics dump is due (indefinitely if there is none)
             # It returns a list of tuples, one for each socket, with each tuple containing a key and a mask
-            events = selector.select(timeout=None)
+            timeout = limits.wheel.next_timeout(limits.now) if limits.wheel is not None else None
+            dump_timeout = loop_stats.dump_timeout(limits.now)
+            if dump_timeout is not None and (timeout is None or dump_timeout < timeout):
+                timeout = dump_timeout
+            if tls.pending and any(not data.paused for data in tls.pending.values()):
+                # Some connections have bytes to read already (see serve_pending())
+                timeout = 0
+            select_start = time.perf_counter_ns()
+            events = selector.select(timeout=timeout)
+            handler_start = time.perf_counter_ns()
+            limits.now = time.monotonic()
 
             for key, mask in events:
                 # If key.data is equal to None, it means that key.fileobj is serverSocket (see setup_selector())
                 # We need to accept the connection by calling .accept()
                 if key.data is None:
                     accept(key.fileobj, selector)
+                elif key.data is STATS_SOCKET:
+                    serve_stats(key.fileobj, selector)
                 else:
                     # If key.data is not None, it means that key.fileobj is a client socket that has already been accepted
                     # We need to serve the client socket by calling .serve()
                     serve(key, mask, selector)
+            if tls.pending:
+                serve_pending(selector)
+
+            if limits.wheel is not None:
+                expire_connections(selector)
+            loop_stats.record_iteration(len(events), handler_start - select_start, time.perf_counter_ns() - handler_start)
+            if loop_stats.dump_due(limits.now):
+                EchoStats.dump_snapshot(server_snapshot(selector), loop_stats.dump_file)
     except KeyboardInterrupt:
         # Encountering user input [ctrl+c], thus breaking from the infinite loop of serving client sockets
-        print('Caught user keyboard interrupt, exiting')
+        print('Caught user keyboard interrupt, draining connections and exiting')
+        # In worker mode, [ctrl+c] reaches the supervisor too, which then terminates every worker: that must not
+        #   interrupt the drain (the supervisor kills the workers still running once the drain timeout passed)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        drain_connections(selector)
     finally:
         # Upon encountering user keyboard interrupt, closes the selector and exits the program
         selector.close()
 
-if __name__ == '__main__':
-    # Setup a server socket
-    serverSocket = setup_serverSocket()
+# Turn the termination signal (sent by the supervisor in worker mode, or by kill) into a KeyboardInterrupt,
+#   so that the server drains its connections just like after [ctrl+c]
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+# Serve connections accepted by serverSocket with the engine selected by args.engine
+# worker_index is the index of this worker process in worker mode, 0 otherwise
+def run_engine(args, serverSocket, worker_index=0):
+    global framed
+    framed = args.framed
+    EchoStats.setup_logging(args.log_level, args.log_sample)
+    signal.signal(signal.SIGTERM, handle_sigterm)
 
-    # Setup a selector that monitors that server socket
-    selector = setup_selector(serverSocket)
+    if args.tls:
+        # Created in each worker, so that each has its own session cache and ticket key (see EchoTls.py)
+        tls.context = EchoTls.server_context(args.tls_cert, args.tls_key, args.tls_sessions)
+
+    if args.engine == 'asyncio':
+        AsyncEchoServer.start_async_server(serverSocket, counters, args.high_water, args.low_water, args.framed, tls.context)
+    else:
+        flow.high_water = args.high_water
+        flow.low_water = args.low_water
+        flow.memory_budget = args.memory_budget
+        flow.budget_low = args.memory_budget * args.low_water // args.high_water
+        limits.max_connections = args.max_connections
+        limits.idle_timeout = args.idle_timeout
+        limits.read_timeout = args.read_timeout
+        limits.write_timeout = args.write_timeout
+        limits.drain_timeout = args.drain_timeout
+        accepting.accept_batch = args.accept_batch
+        accepting.nodelay = args.nodelay
+
+        # Setup a selector that monitors that server socket
+        selector = setup_selector(serverSocket)
+        if args.stats_port:
+            setup_stats_socket(selector, args.stats_port + worker_index)
+        if args.stats_interval:
+            stats_file = open(args.stats_file, 'a') if args.stats_file else sys.stderr
+            loop_stats.start_dumps(args.stats_interval, stats_file, time.monotonic())
+
+        # Start accepting to connections established by client sockets and 
+        #   serve them by echoing back messages they sent to the server socket
+        start_listen_connections(selector)
+
+# Body of one worker process in worker mode
+# args are the parsed commands used to run this program
+# serverSocket is the listener inherited from the supervisor, or None if this worker should bind its own
+#   server socket with SO_REUSEPORT
+# worker_counters is this worker's slice of shared memory, which replaces the module level counters list
+# worker_index is the index of this worker (0 to args.workers - 1)
+def run_worker(args, serverSocket, worker_counters, worker_index):
+    global counters
+    counters = worker_counters
+
+    if serverSocket is None:
+        serverSocket = setup_serverSocket(args.host, args.port, True, args.backlog, args.sndbuf, args.rcvbuf)
+    run_engine(args, serverSocket, worker_index)
+
+# Start worker worker_index, serving connections on (args.host, args.port)
+def start_worker(args, serverSocket, worker_counters, worker_index):
+    worker = multiprocessing.Process(target=run_worker, args=(args, serverSocket, worker_counters, worker_index))
+    worker.start()
+    return worker
+
+# Start args.workers worker processes and supervise them until an user keyboard input (or the termination signal)
+#   interrupts this program
+# Each worker runs its own event loop (see run_engine()) on its own core
+# Workers that die are restarted, with a backoff for those that die right after starting (see WORKER_MIN_UPTIME)
+# On shutdown, every worker is terminated at once, so that they all drain their connections at the same time, and
+#   those still running once the drain timeout passed are killed
+# If SO_REUSEPORT is available, each worker binds its own server socket and the kernel balances new connections
+#   between them; otherwise the supervisor creates a single server socket which is inherited by every worker
+def start_workers(args):
+    num_workers = args.workers
+    # Installed before starting the workers, which inherit it until run_engine() installs their own
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        # Each worker binds its own server socket to the same port
+        serverSocket = None
+    else:
+        # Fallback: all workers share one server socket created here, and race to accept from it
+        serverSocket = setup_serverSocket(args.host, args.port, False, args.backlog, args.sndbuf, args.rcvbuf)
+
+    # One row of counters per worker, stored in shared memory so that the supervisor can read them
+    # lock=False since each row is only ever written by the worker that owns it
+    worker_counters = [multiprocessing.Array('q', len(COUNTER_NAMES), lock=False) for i in range(num_workers)]
+    workers = [start_worker(args, serverSocket, worker_counters[i], i) for i in range(num_workers)]
+    print(f'Supervisor started {num_workers} workers')
+    last_totals = None
+    # Restart state of each worker: when it was started, its current restart delay, and when it is due to be
+    #   restarted (None while it runs)
+    started = [time.monotonic()] * num_workers
+    delays = [0.0] * num_workers
+    restart_at = [None] * num_workers
+
+    try:
+        # Keep running until an user keyboard input interrupt this program
+        while True:
+            time.sleep(1)
+
+            # Restart any worker that died; its row of counters is kept, so totals are not lost
+            now = time.monotonic()
+            for i, worker in enumerate(workers):
+                if worker.is_alive():
+                    continue
+                if restart_at[i] is None:
+                    if now - started[i] < WORKER_MIN_UPTIME:
+                        delays[i] = min(max(delays[i] * 2, RESTART_DELAY), MAX_RESTART_DELAY)
+                    else:
+                        delays[i] = 0.0
+                    restart_at[i] = now + delays[i]
+                    print(f'Worker {i} (pid {worker.pid}) exited with code {worker.exitcode}, '
+                          f'restarting in {delays[i]:g} seconds')
+                if now >= restart_at[i]:
+                    workers[i] = start_worker(args, serverSocket, worker_counters[i], i)
+                    started[i] = now
+                    restart_at[i] = None
+
+            # Add up the counters of all workers, and report them whenever they changed
+            totals = [sum(row[j] for row in worker_counters) for j in range(len(COUNTER_NAMES))]
+            if totals != last_totals:
+                print('Supervisor totals: ' + ', '.join(f'{name}={total}' for name, total in zip(COUNTER_NAMES, totals)))
+                last_totals = totals
+    except KeyboardInterrupt:
+        print('Caught user keyboard interrupt, stopping workers')
+    finally:
+        # Another termination signal must not interrupt the shutdown of the workers
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        # Terminate every worker at once, so that they all drain their connections together (see handle_sigterm()),
+        #   then kill those still running once they had drain_timeout seconds (plus one) to do so
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        deadline = time.monotonic() + args.drain_timeout + 1
+        for worker in workers:
+            worker.join(timeout=max(0, deadline - time.monotonic()))
+            if worker.is_alive():
+                print(f'Worker (pid {worker.pid}) did not drain in time, killing it')
+                worker.kill()
+                worker.join()
+        if serverSocket is not None:
+            serverSocket.close()
+
+if __name__ == '__main__':
+    args = parse_arguments()
 
-    # Start accepting to connections established by client sockets and 
-    #   serve them by echoing back messages they sent to the server socket
-    start_listen_connections(selector)
+    if args.workers > 1:
+        # Serve connections with args.workers processes, each running its own event loop
+        start_workers(args)
+    else:
+        # Setup a server socket, and serve the connections it accepts
+        serverSocket = setup_serverSocket(args.host, args.port, False, args.backlog, args.sndbuf, args.rcvbuf)
+        run_engine(args, serverSocket)
@@ -0,0 +1,86 @@
+# TimerWheel.py
+
+# Hashed timer wheel used by MultiConnEchoServer.py for the idle, read and write timeouts of its connections
+#
+# Time is cut into ticks of tick seconds, and the wheel has num_slots slots; a timer due during tick t
+#   is kept in slot t % num_slots (timers more than num_slots ticks away simply stay there for several turns)
+# Scheduling, rescheduling and cancelling a timer are all O(1):
+#   - a timer is any object with two attributes, deadline and wheel_deadline (both initially None)
+#   - deadline is the time the timer is due; setting it to None cancels the timer
+#   - wheel_deadline is the deadline of the timer's entry in the wheel
+# Most rescheduling pushes a deadline later (every byte received pushes back an idle timeout), and that only updates
+#   timer.deadline: the old entry fires early, notices that the deadline moved, and puts the timer back in the wheel
+# A deadline moved earlier gets a new entry, and the old one is dropped when it fires (wheel_deadline no longer matches it)
+
+class TimerWheel:
+    def __init__(self, now, tick=0.1, num_slots=512):
+        self.tick = tick
+        self.slots = [[] for i in range(num_slots)]
+        # current_tick is the first tick whose slot has not been processed yet
+        self.current_tick = int(now / tick)
+        # Number of entries in the wheel, including the ones that will be dropped when they fire
+        self.size = 0
+
+    # Schedule timer to be due at deadline (in the same clock as now, usually time.monotonic())
+    def schedule(self, timer, deadline):
+        timer.deadline = deadline
+        if timer.wheel_deadline is not None and timer.wheel_deadline <= deadline:
+            # The existing entry fires first and puts the timer back in the wheel (see expire())
+            return
+        self._insert(timer, deadline)
+
+    # Cancel timer; its entry stays in the wheel until it fires, and is then dropped
+    def cancel(self, timer):
+        timer.deadline = None
+
+    def _insert(self, timer, deadline):
+        due_tick = max(int(deadline / self.tick), self.current_tick)
+        self.slots[due_tick % len(self.slots)].append((deadline, timer))
+        timer.wheel_deadline = deadline
+        self.size += 1
+
+    # Return the timers due at or before now, removing them from the wheel
+    # Only the slots of ticks that are entirely in the past are processed, so a timer can fire up to one tick late
+    def expire(self, now):
+        expired = []
+        if not self.size:
+            self.current_tick = int(now / self.tick)
+            return expired
+
+        while (self.current_tick + 1) * self.tick <= now and self.size:
+            index = self.current_tick % len(self.slots)
+            entries = self.slots[index]
+            self.current_tick += 1
+            if not entries:
+                continue
+            self.slots[index] = []
+            self.size -= len(entries)
+            for entry_deadline, timer in entries:
+                if timer.wheel_deadline != entry_deadline:
+                    # Stale entry, replaced by a newer one when the deadline moved earlier
+                    continue
+                timer.wheel_deadline = None
+                if timer.deadline is None:
+                    # Cancelled
+                    continue
+                if timer.deadline <= now:
+                    timer.deadline = None
+                    expired.append(timer)
+                else:
+                    # The deadline moved later, or is more than one turn of the wheel away
+                    self._insert(timer, timer.deadline)
+
+        if not self.size:
+            self.current_tick = max(self.current_tick, int(now / self.tick))
+        return expired
+
+    # Number of seconds from now until the next slot holding entries has to be processed,
+    #   or None if the wheel is empty; used as the timeout of selector.select()
+    def next_timeout(self, now):
+        if not self.size:
+            return None
+        for i in range(len(self.slots)):
+            tick = self.current_tick + i
+            if self.slots[tick % len(self.slots)]:
+                return max(0.0, (tick + 1) * self.tick - now)
+        return None
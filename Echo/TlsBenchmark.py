@@ -0,0 +1,225 @@
+# TlsBenchmark.py
+
+# Example commands to run this program: python3 TlsBenchmark.py
+# Example commands to run this program with a server-side session cache: python3 TlsBenchmark.py --tls-sessions cache
+# Example commands to run this program with more load: python3 TlsBenchmark.py --concurrency 64 --connections 200 --duration 10
+
+# TLS benchmark of the selectors engine of MultiConnEchoServer.py
+# For each mode, a server is started in its own process, and measured twice:
+#   - connection setup: --concurrency client sockets keep connecting, sending one request, waiting for its echo and
+#     closing, each one replaced by a new one right away, for --duration seconds; reported are the connections per
+#     second, and the setup latency (from connect_ex() until the connection is ready to send, handshake included)
+#   - throughput: the load generation mode of MultiConnEchoClient.py (see run_benchmark()), with --connections
+#     connections opened once
+# Modes:
+#   - off: plain TCP
+#   - full: TLS, every connection doing a full handshake
+#   - resumed: TLS, every connection resuming the session of the last connection that completed
+# The servers all use one self-signed certificate, created for the run, which the clients verify like real clients
+#   would (a resumed handshake skips sending and verifying it)
+# The handshakes seen by the server, and how many of them resumed a session, are read from its stats socket
+#   (the readiness check of start_server() adds one failed handshake, since it does not speak TLS)
+
+import ssl
+import time
+import types
+import socket
+import argparse
+import resource
+import tempfile
+import selectors
+
+import EchoTls
+from EngineBenchmark import start_server, stop_server
+from ConnectBenchmark import read_stats
+from LatencyHistogram import LatencyHistogram
+from MultiConnEchoClient import run_benchmark
+
+# Modes: (TLS, resume sessions)
+MODES = {
+    'off': (False, False),
+    'full': (True, False),
+    'resumed': (True, True),
+}
+
+# Values of --tls-version
+TLS_VERSIONS = {
+    '1.2': ssl.TLSVersion.TLSv1_2,
+    '1.3': ssl.TLSVersion.TLSv1_3,
+}
+
+# Open one more setup connection to server_addr, and register it with bench.selector
+def open_connection(server_addr, bench):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if bench.tls is not None:
+        session = bench.session if bench.resume else None
+        sock = bench.tls.wrap_socket(sock, do_handshake_on_connect=False, session=session)
+    sock.connect_ex(server_addr)
+    data = types.SimpleNamespace(
+        started=time.perf_counter_ns(),
+        connected=False,
+        handshaking=bench.tls is not None,
+        received=0,
+    )
+    # selectors.EVENT_WRITE tells us when the connection is established
+    bench.selector.register(sock, selectors.EVENT_WRITE, data)
+    bench.opened += 1
+
+# The connection is ready: record its setup time, and send its request
+def connection_ready(sock, data, bench):
+    bench.setup.record((time.perf_counter_ns() - data.started) // 1000)
+    sock.send(bench.payload)
+    bench.selector.modify(sock, selectors.EVENT_READ, data)
+
+# Close a setup connection, and replace it with a new one while the benchmark runs
+def close_connection(server_addr, sock, bench):
+    bench.selector.unregister(sock)
+    sock.close()
+    if bench.running:
+        open_connection(server_addr, bench)
+
+# Serve one setup connection: connect, handshake, send the request, and close once its echo came back
+def serve_connection(server_addr, key, mask, bench):
+    sock = key.fileobj
+    data = key.data
+    try:
+        if not data.connected:
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise ConnectionRefusedError(error, 'connect failed')
+            data.connected = True
+            if not data.handshaking:
+                connection_ready(sock, data, bench)
+                return
+        if data.handshaking:
+            wants = EchoTls.handshake(sock)
+            if wants:
+                bench.selector.modify(sock, wants, data)
+                return
+            data.handshaking = False
+            bench.handshakes += 1
+            if sock.session_reused:
+                bench.resumed += 1
+            connection_ready(sock, data, bench)
+            return
+
+        received = sock.recv(65536)
+        if not received:
+            raise ConnectionResetError('server closed the connection')
+        data.received += len(received)
+        if data.received < len(bench.payload):
+            return
+        if bench.resume:
+            # With TLS 1.3, the session tickets arrive after the handshake: by now they came with the echo
+            bench.session = sock.session
+        bench.completed += 1
+    except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+        # Nothing was received yet but session tickets, see EchoTls.py
+        return
+    except OSError:
+        bench.errors += 1
+    close_connection(server_addr, sock, bench)
+
+# Keep concurrency connections being set up against the server at (host, port) for duration seconds, each one
+#   sending a request of payload_size bytes and closing once it is echoed, and return the results as a dictionary
+# tls is the SSLContext of the connections, None without TLS; with resume, connections resume the last session
+# The last session is also returned, for the throughput test to resume it
+def run_setup(host, port, tls, resume, concurrency=16, payload_size=64, duration=5):
+    server_addr = (host, port)
+    bench = types.SimpleNamespace(
+        selector=selectors.DefaultSelector(),
+        tls=tls,
+        resume=resume,
+        session=None,
+        payload=b'x' * payload_size,
+        running=True,
+        opened=0,
+        completed=0,
+        errors=0,
+        handshakes=0,
+        resumed=0,
+        setup=LatencyHistogram(),
+    )
+    start = time.perf_counter()
+    end = start + duration
+    try:
+        for i in range(concurrency):
+            open_connection(server_addr, bench)
+        while (now := time.perf_counter()) < end:
+            for key, mask in bench.selector.select(timeout=end - now):
+                serve_connection(server_addr, key, mask, bench)
+    finally:
+        bench.running = False
+        elapsed = time.perf_counter() - start
+        for key in list(bench.selector.get_map().values()):
+            close_connection(server_addr, key.fileobj, bench)
+        bench.selector.close()
+
+    return {
+        'connections': bench.completed,
+        'errors': bench.errors,
+        'connections_per_sec': round(bench.completed / elapsed, 1),
+        'handshakes': bench.handshakes,
+        'resumed': bench.resumed,
+        'setup_us': bench.setup.summary(),
+    }, bench.session
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TLS benchmark of MultiConnEchoServer.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the servers bind to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65470,
+                        help='port number the servers bind to, plus twice the index of the mode; '
+                             'the next port serves statistics (default: 65470)')
+    parser.add_argument('--modes', nargs='+', choices=tuple(MODES), default=list(MODES),
+                        help='modes to compare (default: all)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='connections being set up at any time in the setup test (default: 16)')
+    parser.add_argument('--connections', type=int, default=50, help='connections of the throughput test (default: 50)')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes per request (default: 64)')
+    parser.add_argument('--pipeline', type=int, default=4,
+                        help='maximum requests in flight per connection in the throughput test (default: 4)')
+    parser.add_argument('--duration', type=float, default=5, help='duration of each test in seconds (default: 5)')
+    # TLS 1.3 resumption still does a key exchange (only the certificate is skipped), TLS 1.2 resumption does not
+    parser.add_argument('--tls-version', choices=('1.2', '1.3'), default='1.3',
+                        help='highest TLS version the clients offer (default: 1.3)')
+    args, server_args = parser.parse_known_args()
+
+    # Every connection of the throughput test is a file descriptor
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    certdir = tempfile.TemporaryDirectory(prefix='echo-tls-')
+    certfile, keyfile = EchoTls.create_certificate(certdir.name)
+
+    print(f'{"mode":<8} {"conns/s":>9} {"setup p50 ms":>13} {"setup p99 ms":>13} {"msgs/s":>10} {"MB/s":>7} '
+          f'{"p50 us":>8} {"p99 us":>8} {"handshakes":>11} {"resumed":>8} {"errors":>7}')
+    for index, mode in enumerate(args.modes):
+        use_tls, resume = MODES[mode]
+        port = args.port + 2 * index
+        # Any unknown option is passed on to the servers, e.g. --tls-sessions cache
+        # --nodelay: the session tickets and the first echo are separate small writes, which Nagle's algorithm would
+        #   otherwise hold back until the client's delayed acknowledgement
+        extra_args = ['--nodelay', '--log-level', 'warning', '--stats-port', str(port + 1)] + server_args
+        tls_args = ['--tls', '--tls-cert', certfile, '--tls-key', keyfile] if use_tls else []
+        server = start_server(args.host, port, 'selectors', tls_args + extra_args)
+        try:
+            tls = None
+            if use_tls:
+                tls = EchoTls.client_context(certfile)
+                tls.maximum_version = TLS_VERSIONS[args.tls_version]
+            setup, session = run_setup(args.host, port, tls, resume, args.concurrency, args.payload_size, args.duration)
+            results = run_benchmark(args.host, port, args.connections, args.payload_size, args.pipeline, 0,
+                                    args.duration, tls=tls, tls_session=session)
+            stats = read_stats(args.host, port + 1).get('tls')
+        finally:
+            stop_server(server)
+
+        setup_us = setup['setup_us']
+        latency = results['latency_us']
+        handshakes = stats['handshakes'] if stats else 0
+        hit_rate = f'{stats["resumption_hit_rate"]:.1%}' if stats and stats['handshakes'] else '-'
+        print(f'{mode:<8} {setup["connections_per_sec"]:>9} {setup_us["p50"] / 1000:>13.2f} {setup_us["p99"] / 1000:>13.2f} '
+              f'{results["msgs_per_sec"]:>10} {results["mb_per_sec"]:>7} {latency["p50"]:>8} {latency["p99"]:>8} '
+              f'{handshakes:>11} {hit_rate:>8} {setup["errors"] + results["errors"]:>7}')
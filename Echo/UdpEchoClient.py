@@ -0,0 +1,325 @@
+# UdpEchoClient.py
+
+# Example commands to run this program: python3 UdpEchoClient.py 127.0.0.1 65432 2
+# Example commands to run this program as a load generator: python3 UdpEchoClient.py 127.0.0.1 65432 8 --bench --pipeline 16 --duration 10
+# Example commands to run this program at a fixed rate: python3 UdpEchoClient.py 127.0.0.1 65432 8 --bench --rate 50000 --duration 10
+# *Note: The server side program (UdpEchoServer.py) has to run first
+
+# Datagram (UDP) counterpart of MultiConnEchoClient.py
+# Each client socket is a UDP socket connected to the server socket (so it only receives datagrams from the server),
+#   and sends each message as one datagram
+# Unlike TCP, datagrams can be lost or arrive out of order, so the load generation mode (see run_udp_benchmark())
+#   numbers every datagram and measures loss and reordering along with the round-trip times
+
+import sys
+import time
+import heapq
+import socket
+import struct
+import argparse
+import selectors
+import types
+
+import EchoStats
+from EchoStats import log, message_log
+from LatencyHistogram import LatencyHistogram
+from MultiConnEchoClient import write_report
+
+# Header at the front of every datagram sent in load generation mode: its sequence number on its client socket,
+#   and the time (time.perf_counter_ns()) it was meant to be sent
+DATAGRAM_HEADER = struct.Struct('!QQ')
+
+# Maximum number of echoed datagrams received from one client socket per wakeup
+RECEIVE_BATCH = 64
+
+# Send the messages from num_socks client sockets to the server socket at (host, port), one datagram per message,
+#   and wait up to timeout seconds for their echoes
+def send_messages(host, port, num_socks, messages, timeout=2):
+    selector = selectors.DefaultSelector()
+    for i in range(num_socks):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.connect((host, port))
+        log.info('Client socket %d sends to %s', i + 1, (host, port))
+        try:
+            for message in messages:
+                sock.send(message)
+                if message_log.enabled and message_log.sample():
+                    log.debug('Client sends datagram: %r from socket %d', message, i + 1)
+        except ConnectionRefusedError:
+            # The server is not running: a previous datagram was answered by an ICMP error
+            log.info('Client socket %d: connection refused', i + 1)
+            sock.close()
+            continue
+        # data is the number of echoes still expected on this client socket
+        selector.register(sock, selectors.EVENT_READ, data=[i + 1, len(messages)])
+
+    deadline = time.monotonic() + timeout
+    try:
+        while selector.get_map() and time.monotonic() < deadline:
+            for key, mask in selector.select(timeout=max(0, deadline - time.monotonic())):
+                sockid, expected = key.data
+                try:
+                    datagram = key.fileobj.recv(65535)
+                except ConnectionRefusedError:
+                    # The server is not running: the previous datagram was answered by an ICMP error
+                    log.info('Client socket %d: connection refused', sockid)
+                    expected = 0
+                else:
+                    expected -= 1
+                    if message_log.enabled and message_log.sample():
+                        log.debug('Client receives datagram: %r on socket %d', datagram, sockid)
+                key.data[1] = expected
+                if not expected:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    log.info('Client closes socket %d', sockid)
+    except KeyboardInterrupt:
+        print('Caught keyboard interrupt, exiting')
+
+    # Whatever did not come back in time was lost
+    for key in list(selector.get_map().values()):
+        log.info('Client socket %d: %d datagrams lost', key.data[0], key.data[1])
+        selector.unregister(key.fileobj)
+        key.fileobj.close()
+    selector.close()
+
+# Load generation (benchmark) mode
+# State of one client socket:
+# outstanding maps the sequence number of every datagram sent but not echoed yet to the time it was meant to be sent,
+#   in sending order, so that the oldest one comes first
+# highest is the highest sequence number echoed so far, to detect datagrams echoed out of order
+# blocked is True while the socket send buffer is full (closed loop mode only, see fill_pipeline())
+class Flow:
+    __slots__ = ('flowid', 'sock', 'next_seq', 'outstanding', 'highest', 'blocked')
+
+    def __init__(self, flowid, sock):
+        self.flowid = flowid
+        self.sock = sock
+        self.next_seq = 0
+        self.outstanding = {}
+        self.highest = -1
+        self.blocked = False
+
+# Send one datagram on flow, meant to be sent at sent_at; returns False if the socket send buffer is full
+def send_datagram(flow, bench, sent_at):
+    DATAGRAM_HEADER.pack_into(bench.payload, 0, flow.next_seq, sent_at)
+    try:
+        flow.sock.send(bench.payload)
+    except BlockingIOError:
+        bench.send_blocked += 1
+        return False
+    flow.outstanding[flow.next_seq] = sent_at
+    flow.next_seq += 1
+    bench.sent += 1
+    return True
+
+# Closed loop mode: send datagrams on flow until bench.pipeline of them are in flight
+# If the socket send buffer fills up, selectors.EVENT_WRITE is requested to try again once it drained
+def fill_pipeline(flow, bench):
+    now = time.perf_counter_ns()
+    while bench.running and len(flow.outstanding) < bench.pipeline:
+        if not send_datagram(flow, bench, now):
+            if not flow.blocked:
+                flow.blocked = True
+                bench.selector.modify(flow.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, flow)
+            return
+    if flow.blocked:
+        flow.blocked = False
+        bench.selector.modify(flow.sock, selectors.EVENT_READ, flow)
+
+# Receive the datagrams echoed on flow, up to RECEIVE_BATCH of them
+def receive_echoes(flow, bench):
+    for i in range(RECEIVE_BATCH):
+        try:
+            received = flow.sock.recv_into(bench.recv_buffer)
+        except BlockingIOError:
+            break
+        except ConnectionRefusedError:
+            # An ICMP error: the server is not (or no longer) running
+            bench.errors += 1
+            continue
+        now = time.perf_counter_ns()
+        if received < DATAGRAM_HEADER.size:
+            bench.errors += 1
+            continue
+        seq, sent_at = DATAGRAM_HEADER.unpack_from(bench.recv_buffer)
+        if flow.outstanding.pop(seq, None) is None:
+            # Duplicated, or echoed after it was already counted as lost
+            bench.late += 1
+            continue
+        if seq < flow.highest:
+            bench.reordered += 1
+        else:
+            flow.highest = seq
+        bench.received += 1
+        # Latencies are recorded in microseconds
+        bench.histogram.record((now - sent_at) // 1000)
+
+# Count every datagram of flow in flight for longer than bench.timeout as lost
+def expire_datagrams(flow, bench, now):
+    outstanding = flow.outstanding
+    deadline = now - bench.timeout
+    while outstanding:
+        seq = next(iter(outstanding))
+        if outstanding[seq] > deadline:
+            break
+        del outstanding[seq]
+        bench.lost += 1
+
+# Run the load generator against the server at (host, port) and return its results as a dictionary
+# num_socks: number of client sockets
+# payload_size: size in bytes of each datagram (at least DATAGRAM_HEADER.size)
+# pipeline: maximum number of datagrams in flight per client socket (closed loop mode)
+# rate: total datagrams per second over all client sockets (0 for closed loop: send as fast as echoes come back);
+#   a rate limited (open loop) test sends every datagram when it is due, however many are still in flight
+# duration: length of the test in seconds
+# timeout: seconds after which a datagram not echoed yet is counted as lost
+def run_udp_benchmark(host, port, num_socks, payload_size=64, pipeline=1, rate=0, duration=10, timeout=1.0):
+    bench = types.SimpleNamespace(
+        selector=selectors.DefaultSelector(),
+        # The datagram sent, rewritten in place with the header of each one (see send_datagram())
+        payload=bytearray(b'x' * max(payload_size, DATAGRAM_HEADER.size)),
+        recv_buffer=bytearray(65535),
+        pipeline=pipeline,
+        # Time between two datagrams of one client socket in nanoseconds, None in closed loop mode
+        interval=int(1e9 * num_socks / rate) if rate else None,
+        # Heap of (time the next datagram is due, flowid, flow), rate limited mode only
+        schedule=[],
+        timeout=int(timeout * 1e9),
+        histogram=LatencyHistogram(),
+        running=True,
+        sent=0,
+        received=0,
+        lost=0,
+        reordered=0,
+        late=0,
+        send_blocked=0,
+        errors=0,
+    )
+    flows = []
+    for i in range(num_socks):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.connect((host, port))
+        flow = Flow(i + 1, sock)
+        flows.append(flow)
+        bench.selector.register(sock, selectors.EVENT_READ, flow)
+
+    start = time.perf_counter_ns()
+    end = start + int(duration * 1e9)
+    if bench.interval is None:
+        for flow in flows:
+            fill_pipeline(flow, bench)
+    else:
+        # Spread the first datagram of each client socket evenly over one interval
+        for flow in flows:
+            heapq.heappush(bench.schedule, (start + (flow.flowid - 1) * bench.interval // num_socks, flow.flowid, flow))
+    next_expiry = start + bench.timeout // 10
+    elapsed = None
+
+    try:
+        while True:
+            now = time.perf_counter_ns()
+            if bench.running and now >= end:
+                # Stop sending, and give the datagrams still in flight up to timeout seconds to come back
+                bench.running = False
+                elapsed = (now - start) / 1e9
+                end = now + bench.timeout
+            if not bench.running and (now >= end or not any(flow.outstanding for flow in flows)):
+                break
+
+            # Rate limited mode: send the datagrams that are due by now
+            while bench.running and bench.schedule and bench.schedule[0][0] <= now:
+                due, flowid, flow = heapq.heappop(bench.schedule)
+                send_datagram(flow, bench, due)
+                heapq.heappush(bench.schedule, (due + bench.interval, flowid, flow))
+
+            # Count the datagrams in flight for too long as lost, checking ten times per timeout
+            if now >= next_expiry:
+                for flow in flows:
+                    expire_datagrams(flow, bench, now)
+                    if bench.interval is None:
+                        fill_pipeline(flow, bench)
+                next_expiry = now + bench.timeout // 10
+
+            # Sleep in selector.select() until the next datagram or check is due, or the test ends
+            wake = min(end, next_expiry)
+            if bench.running and bench.schedule:
+                wake = min(wake, bench.schedule[0][0])
+            for key, mask in bench.selector.select(timeout=max(0, wake - time.perf_counter_ns()) / 1e9):
+                flow = key.data
+                if mask & selectors.EVENT_READ:
+                    receive_echoes(flow, bench)
+                if bench.interval is None:
+                    fill_pipeline(flow, bench)
+    except KeyboardInterrupt:
+        print('Caught keyboard interrupt, stopping benchmark', file=sys.stderr)
+    finally:
+        if elapsed is None:
+            elapsed = (time.perf_counter_ns() - start) / 1e9
+        # Whatever is still in flight now is lost
+        for flow in flows:
+            bench.lost += len(flow.outstanding)
+            bench.selector.unregister(flow.sock)
+            flow.sock.close()
+        bench.selector.close()
+
+    return {
+        'sockets': num_socks,
+        'payload_size': payload_size,
+        'pipeline': pipeline,
+        'rate': rate,
+        'duration_s': round(elapsed, 3),
+        'sent': bench.sent,
+        'received': bench.received,
+        'lost': bench.lost,
+        'loss_pct': round(100 * bench.lost / bench.sent, 3) if bench.sent else 0,
+        'reordered': bench.reordered,
+        'late': bench.late,
+        'send_blocked': bench.send_blocked,
+        'errors': bench.errors,
+        'msgs_per_sec': round(bench.received / elapsed, 1),
+        'mb_per_sec': round(bench.received * payload_size / elapsed / 1e6, 3),
+        'latency_us': bench.histogram.summary(),
+    }
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='UDP echo client')
+    parser.add_argument('host', help='IP address of the server socket')
+    parser.add_argument('port', type=int, help='port number of the server socket')
+    parser.add_argument('num_sockets', type=int, help='number of client sockets')
+    # Load generation mode, see run_udp_benchmark()
+    parser.add_argument('--bench', action='store_true', help='run as a load generator instead of sending the test messages once')
+    parser.add_argument('--payload-size', type=int, default=64,
+                        help=f'bytes per datagram, at least {DATAGRAM_HEADER.size} (default: 64)')
+    parser.add_argument('--pipeline', type=int, default=1, help='maximum datagrams in flight per client socket (default: 1)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='total datagrams per second over all client sockets, 0 for closed loop (default: 0)')
+    parser.add_argument('--duration', type=float, default=10, help='test duration in seconds (default: 10)')
+    parser.add_argument('--timeout', type=float, default=1,
+                        help='seconds after which a datagram not echoed is counted as lost (default: 1)')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help='report format (default: json)')
+    parser.add_argument('--output', help='file the report is written to (default: standard output)')
+    # Logging (see EchoStats.py); every message is logged by default, since this program only sends a few of them
+    EchoStats.add_logging_arguments(parser, default_level='debug')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    EchoStats.setup_logging(args.log_level, args.log_sample)
+
+    if args.bench:
+        results = run_udp_benchmark(args.host, args.port, args.num_sockets, args.payload_size, args.pipeline,
+                                    args.rate, args.duration, args.timeout)
+        if args.output:
+            with open(args.output, 'w', newline='') as output:
+                write_report(results, output, args.format)
+        else:
+            write_report(results, sys.stdout, args.format)
+        sys.exit(0)
+
+    # Two binary messages used for testing, as in MultiConnEchoClient.py
+    messages = [b"Message 1, sent by client. ", b"Message 2, sent by client. "]
+    send_messages(args.host, args.port, args.num_sockets, messages)
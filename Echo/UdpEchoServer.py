@@ -0,0 +1,223 @@
+# UdpEchoServer.py
+
+# Example commands to run this program: python3 UdpEchoServer.py 127.0.0.1 65432
+# Example commands to run this program draining up to 256 datagrams per wakeup: python3 UdpEchoServer.py 127.0.0.1 65432 --batch 256
+# Example commands to run this program with statistics every second: python3 UdpEchoServer.py 127.0.0.1 65432 --stats-interval 1
+
+# Datagram (UDP) counterpart of MultiConnEchoServer.py, with the same selector loop structure
+# There are no connections: one server socket receives the datagrams of every client socket, and each datagram is
+#   echoed back as one datagram to the address it came from
+# Each time the server socket is ready for reading, datagrams are drained in a batch:
+#   - up to --batch datagrams are received with recvfrom_into(), each straight into a free slot of a preallocated
+#     buffer pool (see DatagramPool), so receiving never allocates
+#   - then their replies are sent back to back, straight from the same slots, before going back to select()
+# Python has no recvmmsg()/sendmmsg(), so a batch still takes one system call per datagram, but it takes a single
+#   wakeup of the event loop for up to --batch datagrams instead of one wakeup each
+# A reply that cannot be sent yet (the socket send buffer is full) keeps its slot, and selectors.EVENT_WRITE is
+#   requested until it is sent; once every slot holds a reply waiting to be sent, reading pauses, and new datagrams
+#   wait in (or are dropped by) the kernel receive buffer, as UDP allows
+
+import sys
+import time
+import signal
+import socket
+import argparse
+import selectors
+import collections
+
+import EchoStats
+from EchoStats import log, message_log
+from LatencyHistogram import LatencyHistogram
+
+# Largest payload of a UDP datagram over IPv4
+MAX_DATAGRAM_SIZE = 65507
+
+# Default maximum number of datagrams received per wakeup
+DATAGRAM_BATCH = 64
+
+# Default number of slots of the buffer pool, that is of datagrams received but not echoed yet
+POOL_SLOTS = 256
+
+# Names of the counters kept by this server, and their index in counters
+# datagrams_in / datagrams_out: datagrams received and echoed
+# wakeups: times the server socket was ready for reading; datagrams_in / wakeups is the average batch size
+# send_blocked: replies that had to wait for the socket send buffer to drain
+# errors: datagrams that could not be received or echoed (for example an ICMP error reported by the previous send)
+COUNTER_NAMES = ('datagrams_in', 'datagrams_out', 'bytes_in', 'bytes_out', 'wakeups', 'send_blocked', 'errors')
+(DATAGRAMS_IN, DATAGRAMS_OUT, BYTES_IN, BYTES_OUT, WAKEUPS, SEND_BLOCKED, ERRORS) = range(len(COUNTER_NAMES))
+
+counters = [0] * len(COUNTER_NAMES)
+
+# Statistics of the event loop (see EchoStats.py), and the number of datagrams received per wakeup
+loop_stats = EchoStats.LoopStats()
+datagrams_per_wakeup = LatencyHistogram()
+
+# Preallocated receive buffers: num_slots slots of slot_size bytes each, carved out of a single bytearray
+# free holds the indexes of the slots not holding a datagram, and replies the (slot, length, address) of the
+#   datagrams received but not echoed yet, oldest first
+class DatagramPool:
+    def __init__(self, num_slots=POOL_SLOTS, slot_size=MAX_DATAGRAM_SIZE):
+        self.storage = bytearray(num_slots * slot_size)
+        view = memoryview(self.storage)
+        self.slots = [view[i * slot_size:(i + 1) * slot_size] for i in range(num_slots)]
+        self.free = list(range(num_slots))
+        self.replies = collections.deque()
+
+# The buffer pool, and the maximum number of datagrams received per wakeup,
+#   set from the commands used to run this program
+pool = None
+batch = DATAGRAM_BATCH
+
+# Receive up to batch datagrams from serverSocket, each into a free slot of pool, and queue their replies
+def receive_datagrams(serverSocket):
+    counters[WAKEUPS] += 1
+    received = 0
+    while received < batch and pool.free:
+        slot = pool.free[-1]
+        try:
+            length, address = serverSocket.recvfrom_into(pool.slots[slot])
+        except BlockingIOError:
+            # Every datagram waiting in the receive buffer was received
+            break
+        except OSError as error:
+            counters[ERRORS] += 1
+            log.warning('Server could not receive a datagram: %s', error)
+            continue
+        pool.free.pop()
+        pool.replies.append((slot, length, address))
+        received += 1
+        counters[DATAGRAMS_IN] += 1
+        counters[BYTES_IN] += length
+        if message_log.enabled and message_log.sample():
+            log.debug('Server receives datagram: %r from %s', pool.slots[slot][:length].tobytes(), address)
+    datagrams_per_wakeup.record(received)
+
+# Send the queued replies back to back, each straight from its slot, until they are all sent or the send buffer is full
+def send_replies(serverSocket):
+    replies = pool.replies
+    while replies:
+        slot, length, address = replies[0]
+        try:
+            serverSocket.sendto(pool.slots[slot][:length], address)
+            counters[DATAGRAMS_OUT] += 1
+            counters[BYTES_OUT] += length
+        except BlockingIOError:
+            # Try again once the server socket is ready for writing
+            counters[SEND_BLOCKED] += 1
+            return
+        except OSError as error:
+            # The reply is dropped, as the network could have done
+            counters[ERRORS] += 1
+            log.warning('Server could not echo a datagram to %s: %s', address, error)
+        replies.popleft()
+        pool.free.append(slot)
+
+# Update the events selector monitors serverSocket for: selectors.EVENT_WRITE only while replies wait to be sent,
+#   and selectors.EVENT_READ only while there are free slots to receive into
+# events is the set of events serverSocket is currently registered with; the new set is returned
+def update_interest(selector, serverSocket, events):
+    new_events = 0
+    if pool.free:
+        new_events |= selectors.EVENT_READ
+    if pool.replies:
+        new_events |= selectors.EVENT_WRITE
+    if new_events != events:
+        # There is always at least one of them: a pool without free slots holds replies waiting to be sent
+        selector.modify(serverSocket, new_events)
+    return new_events
+
+# Statistics of this server, as a dictionary
+def server_snapshot():
+    return {
+        'time': round(time.time(), 3),
+        'counters': dict(zip(COUNTER_NAMES, counters)),
+        'datagrams_per_wakeup': datagrams_per_wakeup.summary(),
+        'pending_replies': len(pool.replies),
+        'loop': loop_stats.summary(),
+    }
+
+# Receive and echo datagrams until an user keyboard input interrupts this program
+def start_listen_datagrams(selector, serverSocket):
+    events = selectors.EVENT_READ
+    now = time.monotonic()
+    if loop_stats.dump_interval:
+        loop_stats.next_dump = now + loop_stats.dump_interval
+    try:
+        while True:
+            select_start = time.perf_counter_ns()
+            ready = selector.select(timeout=loop_stats.dump_timeout(now))
+            handler_start = time.perf_counter_ns()
+            now = time.monotonic()
+
+            for key, mask in ready:
+                if mask & selectors.EVENT_READ:
+                    receive_datagrams(serverSocket)
+                # Replies are sent right after their batch is received, without waiting for another wakeup
+                send_replies(serverSocket)
+            events = update_interest(selector, serverSocket, events)
+
+            loop_stats.record_iteration(len(ready), handler_start - select_start, time.perf_counter_ns() - handler_start)
+            if loop_stats.dump_due(now):
+                EchoStats.dump_snapshot(server_snapshot(), loop_stats.dump_file)
+    except KeyboardInterrupt:
+        print('Caught user keyboard interrupt, exiting')
+    finally:
+        selector.close()
+        EchoStats.dump_snapshot(server_snapshot(), loop_stats.dump_file)
+
+# Turn the termination signal into a KeyboardInterrupt, so that the final statistics are written
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+# Setup the server socket: a datagram socket bound to (host, port)
+# sndbuf and rcvbuf, unless 0, set SO_SNDBUF and SO_RCVBUF; a bigger receive buffer absorbs bigger bursts
+#   before datagrams are dropped
+def setup_serverSocket(host, port, sndbuf=0, rcvbuf=0):
+    # socket.SOCK_DGRAM means that the protocol used is UDP (User Datagram Protocol)
+    serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if sndbuf:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    serverSocket.bind((host, port))
+    serverSocket.setblocking(False)
+    print(f'Server receives datagrams on {(host, port)}')
+    return serverSocket
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='UDP echo server')
+    parser.add_argument('host', help='IP address the server socket binds to')
+    parser.add_argument('port', type=int, help='port number the server socket binds to')
+    parser.add_argument('--batch', type=int, default=DATAGRAM_BATCH,
+                        help=f'maximum datagrams received per wakeup (default: {DATAGRAM_BATCH})')
+    parser.add_argument('--pool-slots', type=int, default=POOL_SLOTS,
+                        help=f'datagrams received but not echoed yet, at most (default: {POOL_SLOTS})')
+    parser.add_argument('--buffer-size', type=int, default=MAX_DATAGRAM_SIZE,
+                        help=f'bytes per slot; longer datagrams are truncated (default: {MAX_DATAGRAM_SIZE})')
+    parser.add_argument('--sndbuf', type=int, default=0, help='SO_SNDBUF in bytes, 0 for the system default (default: 0)')
+    parser.add_argument('--rcvbuf', type=int, default=0, help='SO_RCVBUF in bytes, 0 for the system default (default: 0)')
+    # Logging and statistics, see EchoStats.py
+    EchoStats.add_logging_arguments(parser)
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='seconds between statistics dumps as JSON lines, 0 for none (default: 0)')
+    parser.add_argument('--stats-file', help='file statistics are appended to, at every interval and on exit (default: standard error)')
+    args = parser.parse_args()
+    if args.batch < 1 or args.pool_slots < args.batch:
+        parser.error('--batch has to be at least 1, and --pool-slots at least --batch')
+    return args
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    EchoStats.setup_logging(args.log_level, args.log_sample)
+    pool = DatagramPool(args.pool_slots, args.buffer_size)
+    batch = args.batch
+
+    serverSocket = setup_serverSocket(args.host, args.port, args.sndbuf, args.rcvbuf)
+    selector = selectors.DefaultSelector()
+    selector.register(serverSocket, selectors.EVENT_READ)
+    stats_file = open(args.stats_file, 'a') if args.stats_file else sys.stderr
+    loop_stats.start_dumps(args.stats_interval, stats_file, time.monotonic())
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    start_listen_datagrams(selector, serverSocket)
+    serverSocket.close()
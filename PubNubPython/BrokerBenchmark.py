@@ -0,0 +1,214 @@
+# BrokerBenchmark.py
+
+# Example commands to run this program: python3 BrokerBenchmark.py
+# Example commands to run this program with fewer subscribers: python3 BrokerBenchmark.py --subscribers 1000 --duration 5
+# Example commands to run this program with more messages in flight: python3 BrokerBenchmark.py --window 8
+# *Note: every subscriber is a file descriptor on both sides, so the open files limit (ulimit -n) has to be
+#   above the number of subscribers
+
+# Fan-out benchmark of LocalBroker.py: --subscribers client sockets subscribe to one channel, and one publisher
+#   publishes to it for --duration seconds, keeping up to --window messages in flight (waiting for the broker's
+#   acknowledgement before publishing the next one)
+# Every message carries the time it was published (time.time_ns()), so that each subscriber measures its delivery
+#   latency; the broker is started once per mode:
+#   - shared: every published message is encoded once and shared by all subscribers (the default of the broker)
+#   - copy: every published message is encoded again for every subscriber (LocalBroker.py --copy-per-subscriber)
+# Subscribers and publisher all run in this process, in one selector loop; the same frame arrives on every subscriber
+#   socket, so it is only decoded once (see receive_frames()), to keep the cost of this process out of the results
+
+import os
+import sys
+import json
+import time
+import types
+import socket
+import argparse
+import resource
+import tempfile
+import selectors
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Echo'))
+
+from EchoFraming import FrameParser, encode_frame
+from LatencyHistogram import LatencyHistogram
+from LocalBroker import spawn_broker
+
+# Channel the benchmark publishes to
+CHANNEL = 'bench'
+
+# Marker stored as the data of the publisher socket in the selector
+PUBLISHER = 'publisher'
+
+# Return request (a dictionary) as one frame
+def encode(request):
+    return encode_frame(json.dumps(request, separators=(',', ':')).encode())
+
+# Connect num_subs subscribers to (host, port), batch of them at a time, and wait until they are all subscribed
+#   to CHANNEL; each one stays registered with selector, with its FrameParser as data
+def connect_subscribers(selector, host, port, num_subs, batch=500):
+    socks = []
+    for first in range(0, num_subs, batch):
+        waiting = 0
+        for i in range(first, min(first + batch, num_subs)):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            sock.connect_ex((host, port))
+            selector.register(sock, selectors.EVENT_WRITE, FrameParser())
+            socks.append(sock)
+            waiting += 1
+
+        while waiting:
+            events = selector.select(timeout=10)
+            if not events:
+                raise TimeoutError(f'{waiting} subscribers did not subscribe in time')
+            for key, mask in events:
+                sock = key.fileobj
+                if mask & selectors.EVENT_WRITE:
+                    # Connected: introduce the subscriber and subscribe it, in one send
+                    sock.send(encode({'op': 'hello', 'user_id': f'subscriber-{len(socks)}-{sock.fileno()}'})
+                              + encode({'op': 'subscribe', 'channels': [CHANNEL]}))
+                    selector.modify(sock, selectors.EVENT_READ, key.data)
+                    continue
+                data = sock.recv(65536)
+                if not data:
+                    raise ConnectionError('broker closed a subscriber connection')
+                key.data.feed(data)
+                for payload in key.data.frames():
+                    if json.loads(payload)['op'] == 'subscribed':
+                        waiting -= 1
+    return socks
+
+# Publish one message on the publisher socket, stamped with the time it is published
+def publish(bench):
+    bench.publisher.sendall(encode({'op': 'publish', 'channel': CHANNEL, 'seq': bench.published,
+                                    'message': {'sent_ns': time.time_ns(), 'pad': bench.pad}}))
+    bench.published += 1
+
+# Receive on the socket of a subscriber (or of the publisher), and account for every complete frame
+def receive_frames(sock, parser, bench):
+    data = sock.recv(65536)
+    if not data:
+        raise ConnectionError('broker closed a connection')
+    parser.feed(data)
+    now = time.time_ns()
+    for payload in parser.frames():
+        # The same frame arrives on every subscriber socket: only decode it when it differs from the last one
+        if payload != bench.last_payload:
+            bench.last_payload = payload
+            bench.last_event = json.loads(payload)
+        event = bench.last_event
+        op = event['op']
+        if op == 'message':
+            bench.delivered += 1
+            bench.histogram.record((now - event['message']['sent_ns']) // 1000)
+        elif op == 'published':
+            bench.acked += 1
+            if bench.running:
+                publish(bench)
+
+# Run one benchmark against the broker at (host, port), and return its results as a dictionary
+def run_fanout_benchmark(host, port, num_subs, payload_size=64, window=1, duration=5, drain_timeout=10):
+    selector = selectors.DefaultSelector()
+    start = time.perf_counter()
+    socks = connect_subscribers(selector, host, port, num_subs)
+    connect_seconds = time.perf_counter() - start
+
+    bench = types.SimpleNamespace(
+        publisher=socket.create_connection((host, port)),
+        pad='x' * payload_size,
+        running=True,
+        published=0,
+        acked=0,
+        delivered=0,
+        last_payload=None,
+        last_event=None,
+        histogram=LatencyHistogram(),
+    )
+    bench.publisher.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    publisher_parser = FrameParser()
+    selector.register(bench.publisher, selectors.EVENT_READ, PUBLISHER)
+
+    try:
+        start = time.perf_counter()
+        end = start + duration
+        for i in range(window):
+            publish(bench)
+        while True:
+            now = time.perf_counter()
+            if bench.running and now >= end:
+                # Stop publishing, and wait for the messages in flight to reach every subscriber
+                bench.running = False
+                elapsed = now - start
+                end = now + drain_timeout
+            if not bench.running and (now >= end or bench.delivered >= bench.published * num_subs):
+                break
+            for key, mask in selector.select(timeout=max(0, end - now)):
+                if key.data is PUBLISHER:
+                    receive_frames(key.fileobj, publisher_parser, bench)
+                else:
+                    receive_frames(key.fileobj, key.data, bench)
+    finally:
+        # Close the client sockets first, so that the broker's side of the connections does not linger in TIME_WAIT
+        for sock in socks + [bench.publisher]:
+            selector.unregister(sock)
+            sock.close()
+        selector.close()
+
+    return {
+        'subscribers': num_subs,
+        'connect_seconds': round(connect_seconds, 3),
+        'published': bench.published,
+        'publishes_per_sec': round(bench.acked / elapsed, 1),
+        'delivered': bench.delivered,
+        'lost': bench.published * num_subs - bench.delivered,
+        'deliveries_per_sec': round(bench.delivered / elapsed, 1),
+        'latency_us': bench.histogram.summary(),
+    }
+
+# Last statistics line written by the broker (see LocalBroker.broker_snapshot())
+def read_broker_stats(stats_path):
+    with open(stats_path) as stats_file:
+        lines = stats_file.read().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fan-out benchmark of LocalBroker.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the broker binds to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65440,
+                        help='port number the broker binds to, plus the index of the mode (default: 65440)')
+    parser.add_argument('--modes', nargs='+', choices=('shared', 'copy'), default=['shared', 'copy'],
+                        help='fan-out modes to compare (default: both)')
+    parser.add_argument('--subscribers', type=int, default=10000, help='number of subscribers (default: 10000)')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes of padding per message (default: 64)')
+    parser.add_argument('--window', type=int, default=1, help='maximum messages published but not acknowledged (default: 1)')
+    parser.add_argument('--duration', type=float, default=5, help='seconds of publishing per mode (default: 5)')
+    # Any unknown option is passed on to the broker, e.g. --max-queue 4194304
+    args, broker_args = parser.parse_known_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.subscribers + 16 > hard:
+        parser.error(f'--subscribers is too high for the limit of {hard} open files')
+
+    print(f'{"mode":<8} {"subscribers":>11} {"publishes/s":>12} {"deliveries/s":>13} {"p50 ms":>8} {"p99 ms":>8} '
+          f'{"p99.9 ms":>9} {"fan-out p50 ms":>15} {"lost":>6}')
+    for index, mode in enumerate(args.modes):
+        extra_args = broker_args + (['--copy-per-subscriber'] if mode == 'copy' else [])
+        stats_path = tempfile.mkstemp(prefix='broker-stats-', suffix='.jsonl')[1]
+        # Each mode gets its own port, in case connections of the previous broker still hold the last one
+        port = args.port + index
+        broker = spawn_broker(args.host, port, stats_path, extra_args)
+        try:
+            results = run_fanout_benchmark(args.host, port, args.subscribers, args.payload_size,
+                                           args.window, args.duration)
+        finally:
+            broker.terminate()
+            broker.wait()
+        stats = read_broker_stats(stats_path)
+        os.remove(stats_path)
+
+        latency = results['latency_us']
+        fanout = stats['fanout_us']['p50'] / 1000 if stats else float('nan')
+        print(f'{mode:<8} {results["subscribers"]:>11} {results["publishes_per_sec"]:>12} {results["deliveries_per_sec"]:>13} '
+              f'{latency["p50"] / 1000:>8.1f} {latency["p99"] / 1000:>8.1f} {latency["p99.9"] / 1000:>9.1f} '
+              f'{fanout:>15.1f} {results["lost"]:>6}')
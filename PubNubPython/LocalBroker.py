@@ -0,0 +1,561 @@
+# LocalBroker.py
+
+# Example commands to run this program: python3 LocalBroker.py 127.0.0.1 65440
+# Example commands to run this program with statistics every second: python3 LocalBroker.py 127.0.0.1 65440 --stats-interval 1
+# Example commands to run the clients against it: python3 client.py --broker 127.0.0.1:65440
+# *Note: run it from this folder; it imports the echo server modules of ../Echo
+
+# Local stand-in for the channels of the hosted PubNub service, so that client.py (through LocalPubNub.py), simulator.py
+#   and BrokerBenchmark.py can run without any network access to PubNub
+# It is the selector loop of ../Echo/MultiConnEchoServer.py serving length-prefixed messages (../Echo/EchoFraming.py),
+#   each of them a JSON object whose "op" names the request:
+#   client to broker:
+#     {"op": "hello", "user_id": ..., "skip_self": bool}               names the client (the publisher of its messages);
+#                                                                        with skip_self, its own messages are not sent back to it
+#     {"op": "subscribe", "channels": [...], "with_presence": bool}    answered with {"op": "subscribed", "channels": [...]}
+#     {"op": "unsubscribe", "channels": [...]}                         answered with {"op": "unsubscribed", "channels": [...]}
+#     {"op": "publish", "channel": ..., "message": ..., "seq": n}      answered with {"op": "published", "seq": n, "timetoken": t}
+#     {"op": "publish_batch", "messages": [[channel, message], ...], "seq": n}
+#                                                                      answered with {"op": "published", "seq": n, "timetokens": [...]}
+#     {"op": "here_now", "channel": ..., "seq": n}                     answered with {"op": "here_now", "seq": n, "channel": ...,
+#                                                                        "occupancy": n, "uuids": [...]}
+#   broker to subscribers:
+#     {"op": "message", "channel": ..., "publisher": ..., "message": ..., "timetoken": t}
+#     {"op": "presence", "channel": ..., "event": "join" | "leave" | "interval", "uuid": ..., "occupancy": n, "timetoken": t}
+#   and {"op": "error", "seq": n, "error": ...} for a request that cannot be served
+# Timetokens are, as with PubNub, the time of the publish in units of 100 nanoseconds since the epoch
+#
+# Fan-out: a published message is encoded (JSON and frame header) once, and the same immutable bytes object is handed
+#   to every subscriber of the channel (see fan_out()):
+#   - a subscriber with nothing waiting to be sent gets it with one send() right away, so an idle subscriber never
+#     needs selectors.EVENT_WRITE (and its two selector.modify() calls) for a message that fits in its socket buffer
+#   - a subscriber whose socket buffer is full keeps a reference to it in its FrameWriter, without copying it,
+#     until its socket is ready for writing again
+#   - consecutive messages of a "publish_batch" request to the same channel are joined into one buffer, so that each
+#     subscriber gets all of them with a single send()
+#   - a subscriber that falls more than --max-queue bytes behind is disconnected (a slow consumer), so that it cannot
+#     make the broker buffer without bound
+# Presence: join and leave events are sent to the subscribers that asked for presence, as long as the channel has
+#   at most --announce-max subscribers; above that, like PubNub, a single "interval" event with the occupancy is sent
+#   every --presence-interval seconds instead, if the occupancy changed, so that 10k subscribers joining a channel
+#   do not cost 10k events each
+
+import os
+import sys
+import json
+import time
+import types
+import signal
+import socket
+import argparse
+import selectors
+import subprocess
+
+# The broker is built on the echo server of ../Echo
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Echo'))
+
+import EchoStats
+from EchoStats import log, message_log
+from EchoFraming import FrameParser, FrameWriter, encode_frame
+from LatencyHistogram import LatencyHistogram
+from MultiConnEchoServer import setup_serverSocket, ACCEPT_BATCH
+
+# Maximum number of bytes received from a client socket per reading event
+RECV_SIZE = 65536
+
+# Default number of output bytes a client can fall behind before it is disconnected
+MAX_QUEUE = 1024 * 1024
+
+# Default largest channel occupancy for which join and leave events are sent one by one
+ANNOUNCE_MAX = 20
+
+# Default number of seconds between two "interval" presence events of a channel above ANNOUNCE_MAX subscribers
+PRESENCE_INTERVAL = 10.0
+
+# Names of the counters kept by the broker, and their index in counters
+# requests: requests received, of any kind
+# deliveries: messages handed to subscribers (one publish to a channel of n subscribers makes n deliveries)
+# queued_deliveries: frames (messages, presence events or replies) that could not be sent right away, and had to wait
+#   in the client's FrameWriter
+# slow_consumers: clients disconnected for falling more than --max-queue bytes behind
+COUNTER_NAMES = ('accepts', 'closes', 'requests', 'publishes', 'deliveries', 'presence_events', 'queued_deliveries',
+                 'slow_consumers', 'bytes_in', 'bytes_out', 'errors')
+(ACCEPTS, CLOSES, REQUESTS, PUBLISHES, DELIVERIES, PRESENCE_EVENTS, QUEUED_DELIVERIES,
+ SLOW_CONSUMERS, BYTES_IN, BYTES_OUT, ERRORS) = range(len(COUNTER_NAMES))
+
+counters = [0] * len(COUNTER_NAMES)
+
+# Statistics of the event loop (see EchoStats.py), and the time in microseconds taken to hand each published message
+#   to every subscriber of its channel
+loop_stats = EchoStats.LoopStats()
+fanout_us = LatencyHistogram()
+
+# State of the broker:
+# - channels: the channels with at least one subscriber, as {name: Channel}
+# - active: number of client connections open
+# - max_queue, announce_max, presence_interval: see MAX_QUEUE, ANNOUNCE_MAX and PRESENCE_INTERVAL
+# - interval_pending: channels above announce_max subscribers whose occupancy changed since their last "interval" event
+# - next_interval: time.monotonic() at which the pending "interval" events are sent, None if there are none
+# - accept_batch: maximum number of connections accepted per wakeup of the server socket
+# - copy_per_subscriber: True to encode a published message again for every subscriber (--copy-per-subscriber),
+#   only to measure what sharing one buffer saves
+# Set from the commands used to run this program
+broker = types.SimpleNamespace(
+    channels={},
+    active=0,
+    max_queue=MAX_QUEUE,
+    announce_max=ANNOUNCE_MAX,
+    presence_interval=PRESENCE_INTERVAL,
+    interval_pending=set(),
+    next_interval=None,
+    accept_batch=ACCEPT_BATCH,
+    copy_per_subscriber=False,
+)
+
+# State of one client connection, stored as the data of its socket in the selector
+# inb is a FrameParser of the requests received, outb a FrameWriter of the frames waiting to be sent
+# user_id names the client in the messages it publishes and in presence events, and skip_self is True if the messages
+#   it publishes are not to be sent back to it even where it subscribed (see the "hello" request)
+# channels holds the names of the channels it is subscribed to
+# events is the set of events conn is currently registered with (see update_interest())
+# closed is True once the connection is closed, since it can be closed while handling another connection's request
+class Session:
+    __slots__ = ('conn', 'addr', 'user_id', 'skip_self', 'inb', 'outb', 'channels', 'events', 'closed')
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.user_id = f'{addr[0]}:{addr[1]}'
+        self.skip_self = False
+        self.inb = FrameParser()
+        self.outb = FrameWriter()
+        self.channels = set()
+        self.events = selectors.EVENT_READ
+        self.closed = False
+
+# One channel: subscribers are the sessions receiving its messages, and presence the ones also receiving its
+#   presence events, both as {session: None} so that they keep the order in which sessions subscribed
+class Channel:
+    __slots__ = ('name', 'subscribers', 'presence')
+
+    def __init__(self, name):
+        self.name = name
+        self.subscribers = {}
+        self.presence = {}
+
+# Time now as a timetoken
+def timetoken():
+    return time.time_ns() // 100
+
+# Return a message (a dictionary) as one frame, ready to be sent
+def encode(message):
+    return encode_frame(json.dumps(message, separators=(',', ':')).encode())
+
+# Update the events selector monitors the connection of session for, so that selectors.EVENT_WRITE is only
+#   requested while frames are waiting to be sent
+def update_interest(selector, session):
+    events = selectors.EVENT_READ
+    if session.outb:
+        events |= selectors.EVENT_WRITE
+    if events != session.events:
+        selector.modify(session.conn, events, session)
+        session.events = events
+
+# Send frame to session, right away if nothing is waiting to be sent before it, otherwise after what is waiting
+# Returns False if session has to be closed: its connection broke, or it fell more than broker.max_queue bytes behind
+def send_frame(selector, session, frame):
+    outb = session.outb
+    if outb:
+        if len(outb) >= broker.max_queue:
+            return False
+        # Already registered for selectors.EVENT_WRITE
+        outb.write(frame)
+        counters[QUEUED_DELIVERIES] += 1
+        return True
+    try:
+        sent = session.conn.send(frame)
+    except BlockingIOError:
+        sent = 0
+    except OSError:
+        return False
+    counters[BYTES_OUT] += sent
+    if sent < len(frame):
+        # The socket buffer is full: keep the rest of the frame (without copying it) until it is ready for writing
+        outb.write(frame)
+        outb.consume(sent)
+        counters[QUEUED_DELIVERIES] += 1
+        update_interest(selector, session)
+    return True
+
+# Send frame to every session of sessions but skip, and return the number of sessions it was sent to
+# Sessions that have to be closed are only closed once every session was served, since closing one changes the channels
+# messages, if not None, are encoded again for every session instead of sending frame (see broker.copy_per_subscriber)
+def fan_out(selector, sessions, frame, messages=None, skip=None):
+    delivered = 0
+    dropped = None
+    for session in sessions:
+        if session is skip:
+            continue
+        if messages is not None:
+            frame = b''.join([encode(message) for message in messages])
+        if send_frame(selector, session, frame):
+            delivered += 1
+        else:
+            if dropped is None:
+                dropped = []
+            dropped.append(session)
+    if dropped is not None:
+        for session in dropped:
+            drop_session(selector, session)
+    return delivered
+
+# Send a reply to session, the client that made a request
+def reply(selector, session, message):
+    if not session.closed and not send_frame(selector, session, encode(message)):
+        drop_session(selector, session)
+
+# Close the connection of session after send_frame() failed
+def drop_session(selector, session):
+    if session.closed:
+        return
+    if len(session.outb) >= broker.max_queue:
+        counters[SLOW_CONSUMERS] += 1
+        log.warning('Broker disconnects slow consumer %s (%d bytes waiting)', session.user_id, len(session.outb))
+    close_session(selector, session)
+
+# Tell the channel's presence subscribers that uuid joined or left it (event is 'join' or 'leave'), or, above
+#   broker.announce_max subscribers, schedule an "interval" event instead
+def announce(selector, channel, event, uuid):
+    occupancy = len(channel.subscribers)
+    if occupancy > broker.announce_max or (event == 'leave' and occupancy >= broker.announce_max):
+        broker.interval_pending.add(channel)
+        if broker.next_interval is None:
+            broker.next_interval = time.monotonic() + broker.presence_interval
+        return
+    if channel.presence:
+        message = {'op': 'presence', 'channel': channel.name, 'event': event, 'uuid': uuid,
+                   'occupancy': occupancy, 'timetoken': timetoken()}
+        counters[PRESENCE_EVENTS] += fan_out(selector, channel.presence, encode(message))
+
+# Send the "interval" presence events that are due
+def announce_intervals(selector):
+    pending = broker.interval_pending
+    broker.interval_pending = set()
+    broker.next_interval = None
+    for channel in pending:
+        if channel.presence and broker.channels.get(channel.name) is channel:
+            message = {'op': 'presence', 'channel': channel.name, 'event': 'interval',
+                       'occupancy': len(channel.subscribers), 'timetoken': timetoken()}
+            counters[PRESENCE_EVENTS] += fan_out(selector, channel.presence, encode(message))
+
+# Return the channel name of a request, or raise KeyError if it is missing or not a name
+def channel_name(name):
+    if not isinstance(name, str) or not name:
+        raise KeyError('channel')
+    return name
+
+# Return the channel names of a request, or raise KeyError if they are missing or not a list of names
+def channel_names(names):
+    if not isinstance(names, list):
+        raise KeyError('channels')
+    return [channel_name(name) for name in names]
+
+# Subscribe session to the channels named in the request, and to their presence events if it asks for them
+def subscribe(selector, session, request):
+    names = channel_names(request['channels'])
+    for name in names:
+        channel = broker.channels.get(name)
+        if channel is None:
+            channel = broker.channels[name] = Channel(name)
+        if request.get('with_presence'):
+            channel.presence[session] = None
+        if session not in channel.subscribers:
+            channel.subscribers[session] = None
+            session.channels.add(name)
+            announce(selector, channel, 'join', session.user_id)
+    reply(selector, session, {'op': 'subscribed', 'channels': names})
+
+# Unsubscribe session from the channel named name, forgetting the channel once nobody is subscribed to it
+def leave_channel(selector, session, name):
+    session.channels.discard(name)
+    channel = broker.channels.get(name)
+    if channel is None:
+        return
+    channel.presence.pop(session, None)
+    if session in channel.subscribers:
+        del channel.subscribers[session]
+        announce(selector, channel, 'leave', session.user_id)
+    if not channel.subscribers and not channel.presence:
+        del broker.channels[name]
+
+# Unsubscribe session from the channels named in the request
+def unsubscribe(selector, session, request):
+    names = channel_names(request['channels'])
+    for name in names:
+        leave_channel(selector, session, name)
+    reply(selector, session, {'op': 'unsubscribed', 'channels': names})
+
+# Publish messages, a list of (channel name, message) published by session, to the subscribers of their channels,
+#   and return their timetokens
+# Consecutive messages to the same channel are fanned out together, as one buffer shared by every subscriber
+# If session asked for it (see the "hello" request), its own messages are not sent back to it: skipping it here costs
+#   one comparison per subscriber, instead of a send() by the broker and a receive and a callback by the client
+def publish_messages(selector, session, messages):
+    first = timetoken()
+    skip = session if session.skip_self else None
+    start = 0
+    while start < len(messages):
+        name = messages[start][0]
+        end = start + 1
+        while end < len(messages) and messages[end][0] == name:
+            end += 1
+        counters[PUBLISHES] += end - start
+        channel = broker.channels.get(name)
+        if channel is not None:
+            events = [{'op': 'message', 'channel': name, 'publisher': session.user_id, 'message': message,
+                       'timetoken': first + i} for i, (_, message) in enumerate(messages[start:end], start)]
+            began = time.perf_counter_ns()
+            frame = encode(events[0]) if len(events) == 1 else b''.join([encode(event) for event in events])
+            delivered = fan_out(selector, channel.subscribers, frame,
+                                events if broker.copy_per_subscriber else None, skip)
+            counters[DELIVERIES] += delivered * len(events)
+            fanout_us.record((time.perf_counter_ns() - began) // 1000)
+        if message_log.enabled and message_log.sample():
+            log.debug('Broker publishes %d messages: %r from %s on %s', end - start, messages[start][1], session.user_id, name)
+        start = end
+    return [first + i for i in range(len(messages))]
+
+# Publish the message of the request, and acknowledge it to the publisher
+# The acknowledgement is only sent once every subscriber was handed the message
+def publish(selector, session, request):
+    timetokens = publish_messages(selector, session, [(channel_name(request['channel']), request['message'])])
+    reply(selector, session, {'op': 'published', 'seq': request.get('seq'), 'timetoken': timetokens[0]})
+
+# Publish the messages of the request, in order, and acknowledge them all to the publisher with one reply
+def publish_batch(selector, session, request):
+    messages = request['messages']
+    if not isinstance(messages, list) or not messages:
+        raise KeyError('messages')
+    for item in messages:
+        if not isinstance(item, list) or len(item) != 2:
+            raise KeyError('messages')
+        channel_name(item[0])
+    timetokens = publish_messages(selector, session, messages)
+    reply(selector, session, {'op': 'published', 'seq': request.get('seq'), 'timetokens': timetokens})
+
+# Answer a here_now request with the occupancy of the channel and the user IDs of its subscribers
+def here_now(selector, session, request):
+    name = channel_name(request['channel'])
+    channel = broker.channels.get(name)
+    subscribers = channel.subscribers if channel is not None else {}
+    reply(selector, session, {'op': 'here_now', 'seq': request.get('seq'), 'channel': name,
+                              'occupancy': len(subscribers), 'uuids': [other.user_id for other in subscribers]})
+
+# Serve one request of session
+def handle_request(selector, session, request):
+    counters[REQUESTS] += 1
+    op = request.get('op') if isinstance(request, dict) else None
+    try:
+        if op == 'publish':
+            publish(selector, session, request)
+        elif op == 'publish_batch':
+            publish_batch(selector, session, request)
+        elif op == 'subscribe':
+            subscribe(selector, session, request)
+        elif op == 'unsubscribe':
+            unsubscribe(selector, session, request)
+        elif op == 'here_now':
+            here_now(selector, session, request)
+        elif op == 'hello':
+            session.user_id = str(request['user_id'])
+            session.skip_self = bool(request.get('skip_self'))
+        else:
+            raise KeyError('op')
+    except (KeyError, TypeError) as error:
+        # A well-formed frame with a request the broker does not understand: answer it, and keep the connection
+        counters[ERRORS] += 1
+        seq = request.get('seq') if isinstance(request, dict) else None
+        reply(selector, session, {'op': 'error', 'seq': seq, 'error': f'bad {op or "request"}: missing or invalid {error}'})
+
+# Close the connection of session, leaving every channel it is subscribed to
+def close_session(selector, session):
+    if session.closed:
+        return
+    session.closed = True
+    selector.unregister(session.conn)
+    for name in list(session.channels):
+        leave_channel(selector, session, name)
+    session.conn.close()
+    broker.active -= 1
+    counters[CLOSES] += 1
+    log.info('Broker closes connection to %s', session.user_id)
+
+# Accept the connections established by client sockets, up to broker.accept_batch of them per wakeup
+def accept(serverSocket, selector):
+    accepted = 0
+    while accepted < broker.accept_batch:
+        try:
+            conn, address = serverSocket.accept()
+        except BlockingIOError:
+            break
+        except OSError as error:
+            counters[ERRORS] += 1
+            log.warning('Broker could not accept a connection: %s', error)
+            break
+        accepted += 1
+        conn.setblocking(False)
+        # Messages are small and latency matters: send them right away instead of waiting for acknowledgements
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        selector.register(conn, selectors.EVENT_READ, Session(conn, address))
+        broker.active += 1
+        counters[ACCEPTS] += 1
+        log.info('Broker accepts connection from %s', address)
+    loop_stats.record_accepts(accepted)
+
+# Serve the connection of session: receive and handle its requests, and send the frames waiting for it
+def serve(key, mask, selector):
+    sock = key.fileobj
+    session = key.data
+    if session.closed:
+        # Closed while handling another connection's request, after select() returned
+        return
+    try:
+        if mask & selectors.EVENT_READ:
+            received = session.inb.recv_into(sock, RECV_SIZE)
+            if not received:
+                close_session(selector, session)
+                return
+            counters[BYTES_IN] += received
+            for payload in session.inb.frames():
+                handle_request(selector, session, json.loads(payload))
+                if session.closed:
+                    return
+        if mask & selectors.EVENT_WRITE and session.outb:
+            # Every waiting frame (up to EchoFraming.IOV_MAX of them) is sent with a single sendmsg() call
+            counters[BYTES_OUT] += session.outb.send(sock)
+    except BlockingIOError:
+        # A spurious wakeup: nothing to receive, or no room to send, after all
+        pass
+    except (OSError, ValueError):
+        # A broken connection (reset, timed out, unreachable...), a frame too large, or a payload that is not JSON:
+        #   only this session is closed, never the broker
+        close_session(selector, session)
+        return
+    update_interest(selector, session)
+
+# Statistics of the broker, as a dictionary
+def broker_snapshot():
+    return {
+        'time': round(time.time(), 3),
+        'counters': dict(zip(COUNTER_NAMES, counters)),
+        'connections': broker.active,
+        'channels': len(broker.channels),
+        'subscriptions': sum(len(channel.subscribers) for channel in broker.channels.values()),
+        'fanout_us': fanout_us.summary(),
+        'rss_bytes': EchoStats.rss_bytes(),
+        'loop': loop_stats.summary(),
+    }
+
+# Serve client connections until an user keyboard input interrupts this program
+def start_broker(selector):
+    now = time.monotonic()
+    if loop_stats.dump_interval:
+        loop_stats.next_dump = now + loop_stats.dump_interval
+    try:
+        while True:
+            timeout = loop_stats.dump_timeout(now)
+            if broker.next_interval is not None:
+                interval_timeout = max(0.0, broker.next_interval - now)
+                if timeout is None or interval_timeout < timeout:
+                    timeout = interval_timeout
+            select_start = time.perf_counter_ns()
+            events = selector.select(timeout=timeout)
+            handler_start = time.perf_counter_ns()
+            now = time.monotonic()
+
+            for key, mask in events:
+                # key.data is None for serverSocket, and the Session of the connection otherwise
+                if key.data is None:
+                    accept(key.fileobj, selector)
+                else:
+                    serve(key, mask, selector)
+
+            if broker.next_interval is not None and now >= broker.next_interval:
+                announce_intervals(selector)
+            loop_stats.record_iteration(len(events), handler_start - select_start, time.perf_counter_ns() - handler_start)
+            if loop_stats.dump_due(now):
+                EchoStats.dump_snapshot(broker_snapshot(), loop_stats.dump_file)
+    except KeyboardInterrupt:
+        print('Caught user keyboard interrupt, exiting')
+    finally:
+        EchoStats.dump_snapshot(broker_snapshot(), loop_stats.dump_file)
+        for key in list(selector.get_map().values()):
+            if key.data is None:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+            else:
+                close_session(selector, key.data)
+        selector.close()
+
+# Turn the termination signal into a KeyboardInterrupt, so that the final statistics are written
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Local pub/sub broker standing in for PubNub')
+    parser.add_argument('host', help='IP address the server socket binds to')
+    parser.add_argument('port', type=int, help='port number the server socket binds to')
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE,
+                        help=f'output bytes a client can fall behind before it is disconnected (default: {MAX_QUEUE})')
+    parser.add_argument('--announce-max', type=int, default=ANNOUNCE_MAX,
+                        help=f'largest occupancy with join and leave events sent one by one (default: {ANNOUNCE_MAX})')
+    parser.add_argument('--presence-interval', type=float, default=PRESENCE_INTERVAL,
+                        help=f'seconds between "interval" presence events above --announce-max (default: {PRESENCE_INTERVAL:g})')
+    parser.add_argument('--copy-per-subscriber', action='store_true',
+                        help='encode every published message once per subscriber instead of once (for comparison)')
+    parser.add_argument('--backlog', type=int, default=socket.SOMAXCONN,
+                        help=f'length of the queue of connections waiting to be accepted (default: {socket.SOMAXCONN})')
+    parser.add_argument('--accept-batch', type=int, default=ACCEPT_BATCH,
+                        help=f'maximum connections accepted per wakeup (default: {ACCEPT_BATCH})')
+    # Logging and statistics, see EchoStats.py
+    EchoStats.add_logging_arguments(parser)
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='seconds between statistics dumps as JSON lines, 0 for none (default: 0)')
+    parser.add_argument('--stats-file', help='file statistics are appended to, at every interval and on exit (default: standard error)')
+    return parser.parse_args()
+
+# Run this program in a process of its own on (host, port), for the benchmarks and simulator.py, and wait until it
+#   accepts connections; its final statistics go to stats_path, and extra_args are added to its commands
+def spawn_broker(host, port, stats_path=os.devnull, extra_args=()):
+    broker = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), host, str(port), '--log-level', 'warning', '--stats-file', stats_path]
+        + list(extra_args),
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and broker.poll() is None:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return broker
+        except OSError:
+            time.sleep(0.1)
+    broker.kill()
+    raise RuntimeError(f'broker did not start listening on {(host, port)}')
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    EchoStats.setup_logging(args.log_level, args.log_sample)
+    broker.max_queue = args.max_queue
+    broker.announce_max = args.announce_max
+    broker.presence_interval = args.presence_interval
+    broker.accept_batch = args.accept_batch
+    broker.copy_per_subscriber = args.copy_per_subscriber
+
+    serverSocket = setup_serverSocket(args.host, args.port, backlog=args.backlog)
+    selector = selectors.DefaultSelector()
+    selector.register(serverSocket, selectors.EVENT_READ, data=None)
+    stats_file = open(args.stats_file, 'a') if args.stats_file else sys.stderr
+    loop_stats.start_dumps(args.stats_interval, stats_file, time.monotonic())
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    start_broker(selector)
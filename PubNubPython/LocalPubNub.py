@@ -0,0 +1,319 @@
+# LocalPubNub.py
+
+# Example commands to run the clients with it: python3 client.py --broker 127.0.0.1:65440
+# *Note: LocalBroker.py has to run first
+
+# Adapter giving the clients the part of the PubNub SDK they use, backed by LocalBroker.py instead of the hosted service,
+#   so that client.py runs unchanged (apart from its imports) in a sealed environment:
+#   PNConfiguration, SubscribeCallback, PNStatusCategory, and PubNub with add_listener(), subscribe(), unsubscribe(),
+#   publish(), here_now() and stop(), in the same builder style as the SDK:
+#     pubnub.subscribe().channels('chan-1').with_presence().execute()
+#     pubnub.publish().channel('chan-1').message('hello').pn_async(callback)
+# As with the SDK, listener callbacks run in a background thread (the one receiving from the broker), while
+#   publish() can be called from any thread
+# Two extensions of the SDK let a client publish thousands of messages a second (see Publisher.py):
+#   - PubNub.publish_batch() publishes several messages with one request and one acknowledgement
+#   - PNConfiguration.suppress_self_messages asks the broker not to send the client's own messages back to it, instead
+#     of the client receiving them only to drop them in its listener (the SDK ignores this attribute)
+# The broker address is PNConfiguration.broker_host and broker_port, by default taken from the PUBNUB_LOCAL_BROKER
+#   environment variable (host:port), or 127.0.0.1:65440
+
+import os
+import sys
+import json
+import enum
+import socket
+import itertools
+import threading
+
+# The adapter speaks the framing of the echo server of ../Echo, like the broker
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Echo'))
+
+from EchoFraming import FrameParser, encode_frame
+
+# Default address of the broker
+BROKER_ADDRESS = '127.0.0.1:65440'
+
+class PNStatusCategory(enum.Enum):
+    PNConnectedCategory = 1
+    PNAcknowledgmentCategory = 2
+    PNDisconnectedCategory = 3
+    PNUnexpectedDisconnectCategory = 4
+    PNBadRequestCategory = 5
+
+# Configuration, with the fields of the SDK's PNConfiguration used by the clients (the keys are not checked),
+#   and the address of the broker
+class PNConfiguration:
+    def __init__(self):
+        self.publish_key = None
+        self.subscribe_key = None
+        self.user_id = None
+        self.ssl = False
+        self.suppress_self_messages = False
+        host, port = os.environ.get('PUBNUB_LOCAL_BROKER', BROKER_ADDRESS).rsplit(':', 1)
+        self.broker_host = host
+        self.broker_port = int(port)
+
+    # Older name of user_id in the SDK
+    @property
+    def uuid(self):
+        return self.user_id
+
+    @uuid.setter
+    def uuid(self, value):
+        self.user_id = value
+
+# Base class of the listeners given to PubNub.add_listener()
+class SubscribeCallback:
+    def status(self, pubnub, status):
+        pass
+
+    def message(self, pubnub, message):
+        pass
+
+    def presence(self, pubnub, presence):
+        pass
+
+# Results, with the attributes of the SDK's result objects
+class PNStatus:
+    def __init__(self, category, error=None, affected_channels=()):
+        self.category = category
+        self.error = error
+        self.affected_channels = list(affected_channels)
+
+    def is_error(self):
+        return self.error is not None
+
+class PNMessageResult:
+    def __init__(self, event):
+        self.channel = event['channel']
+        self.subscription = None
+        self.message = event['message']
+        self.publisher = event['publisher']
+        self.timetoken = event['timetoken']
+
+class PNPresenceEventResult:
+    def __init__(self, event):
+        self.channel = event['channel']
+        self.event = event['event']
+        self.uuid = event.get('uuid')
+        self.occupancy = event['occupancy']
+        self.timetoken = event['timetoken']
+
+class PNPublishResult:
+    def __init__(self, reply):
+        self.timetoken = reply['timetoken']
+
+class PNPublishBatchResult:
+    def __init__(self, reply):
+        self.timetokens = reply['timetokens']
+
+class PNOccupantData:
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+class PNHereNowChannelData:
+    def __init__(self, reply):
+        self.channel_name = reply['channel']
+        self.occupancy = reply['occupancy']
+        self.occupants = [PNOccupantData(uuid) for uuid in reply['uuids']]
+
+class PNHereNowResult:
+    def __init__(self, reply):
+        self.channels = [PNHereNowChannelData(reply)]
+        self.total_channels = 1
+        self.total_occupancy = reply['occupancy']
+
+# What sync() returns, as in the SDK
+class Envelope:
+    def __init__(self, result, status):
+        self.result = result
+        self.status = status
+
+# A request waiting for the broker's reply: either its callback is called with (result, status),
+#   or the thread calling sync() waits on done
+class PendingRequest:
+    def __init__(self, make_result, callback=None):
+        self.make_result = make_result
+        self.callback = callback
+        self.done = threading.Event()
+        self.envelope = None
+
+    def complete(self, reply):
+        if reply.get('op') == 'error':
+            result, status = None, PNStatus(PNStatusCategory.PNBadRequestCategory, reply['error'])
+        else:
+            result, status = self.make_result(reply), PNStatus(PNStatusCategory.PNAcknowledgmentCategory)
+        self.envelope = Envelope(result, status)
+        self.done.set()
+        if self.callback is not None:
+            self.callback(result, status)
+
+# Builders, used like the SDK's: every option returns the builder, and execute(), pn_async() or sync() sends the request
+class SubscribeBuilder:
+    def __init__(self, pubnub):
+        self.pubnub = pubnub
+        self.channel_names = []
+        self.presence = False
+
+    def channels(self, channels):
+        self.channel_names = [channels] if isinstance(channels, str) else list(channels)
+        return self
+
+    def with_presence(self):
+        self.presence = True
+        return self
+
+    def execute(self):
+        self.pubnub.send_request({'op': 'subscribe', 'channels': self.channel_names, 'with_presence': self.presence})
+
+class UnsubscribeBuilder(SubscribeBuilder):
+    def execute(self):
+        self.pubnub.send_request({'op': 'unsubscribe', 'channels': self.channel_names})
+
+class PublishBuilder:
+    # Class of the result made from the broker's reply
+    result_class = PNPublishResult
+
+    def __init__(self, pubnub):
+        self.pubnub = pubnub
+        self.channel_name = None
+        self.payload = None
+
+    def channel(self, channel):
+        self.channel_name = channel
+        return self
+
+    def message(self, message):
+        self.payload = message
+        return self
+
+    # Metadata of the message, used by the filter expressions of the hosted service; the broker has none, so it is
+    #   not sent (PNConfiguration.suppress_self_messages is what keeps a client's own messages from it)
+    def meta(self, meta):
+        return self
+
+    def request(self):
+        return {'op': 'publish', 'channel': self.channel_name, 'message': self.payload}
+
+    # Send the request, and call callback(result, status) from the receiving thread once the broker answers
+    def pn_async(self, callback):
+        self.pubnub.send_request(self.request(), PendingRequest(self.result_class, callback))
+
+    # Send the request, and wait for the broker to answer (at most timeout seconds); returns an Envelope
+    def sync(self, timeout=10):
+        pending = PendingRequest(self.result_class)
+        self.pubnub.send_request(self.request(), pending)
+        if not pending.done.wait(timeout):
+            return Envelope(None, PNStatus(PNStatusCategory.PNUnexpectedDisconnectCategory, 'no answer from the broker'))
+        return pending.envelope
+
+class HereNowBuilder(PublishBuilder):
+    result_class = PNHereNowResult
+
+    def channels(self, channels):
+        self.channel_name = channels if isinstance(channels, str) else channels[0]
+        return self
+
+    # UUIDs are always included
+    def include_uuids(self, include_uuids):
+        return self
+
+    def request(self):
+        return {'op': 'here_now', 'channel': self.channel_name}
+
+# Client of LocalBroker.py with the interface of the SDK's PubNub class
+# The connection is opened right away; a background thread receives from it and calls the listeners
+class PubNub:
+    def __init__(self, config):
+        self.config = config
+        self.listeners = []
+        self.pending = {}
+        self.seqs = itertools.count(1)
+        self.send_lock = threading.Lock()
+        self.stopped = False
+        self.sock = socket.create_connection((config.broker_host, config.broker_port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send_request({'op': 'hello', 'user_id': config.user_id, 'skip_self': config.suppress_self_messages})
+        self.receiver = threading.Thread(target=self.receive, name='LocalPubNub receiver', daemon=True)
+        self.receiver.start()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def subscribe(self):
+        return SubscribeBuilder(self)
+
+    def unsubscribe(self):
+        return UnsubscribeBuilder(self)
+
+    def publish(self):
+        return PublishBuilder(self)
+
+    def here_now(self):
+        return HereNowBuilder(self)
+
+    # Publish messages, a list of (channel, message), with one request; callback(result, status) is called from the
+    #   receiving thread once the broker answers, with a PNPublishBatchResult holding their timetokens
+    def publish_batch(self, messages, callback):
+        request = {'op': 'publish_batch', 'messages': [[channel, message] for channel, message in messages]}
+        self.send_request(request, PendingRequest(PNPublishBatchResult, callback))
+
+    # Close the connection to the broker
+    def stop(self):
+        self.stopped = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    # Send one request to the broker; if pending is given, it is completed with the broker's reply
+    def send_request(self, request, pending=None):
+        with self.send_lock:
+            if pending is not None:
+                request['seq'] = next(self.seqs)
+                self.pending[request['seq']] = pending
+            self.sock.sendall(encode_frame(json.dumps(request, separators=(',', ':')).encode()))
+
+    # Body of the receiving thread: hand every message, presence event and reply of the broker to whoever waits for it
+    def receive(self):
+        parser = FrameParser()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                parser.feed(data)
+                for payload in parser.frames():
+                    self.dispatch(json.loads(payload))
+        except OSError:
+            pass
+        if not self.stopped:
+            self.notify_status(PNStatus(PNStatusCategory.PNUnexpectedDisconnectCategory, 'connection to the broker lost'))
+
+    def dispatch(self, event):
+        op = event.get('op')
+        if op == 'message':
+            message = PNMessageResult(event)
+            for listener in self.listeners:
+                listener.message(self, message)
+        elif op == 'presence':
+            presence = PNPresenceEventResult(event)
+            for listener in self.listeners:
+                listener.presence(self, presence)
+        elif op == 'subscribed':
+            self.notify_status(PNStatus(PNStatusCategory.PNConnectedCategory, affected_channels=event['channels']))
+        elif op == 'unsubscribed':
+            self.notify_status(PNStatus(PNStatusCategory.PNDisconnectedCategory, affected_channels=event['channels']))
+        else:
+            pending = self.pending.pop(event.get('seq'), None)
+            if pending is not None:
+                pending.complete(event)
+
+    def notify_status(self, status):
+        for listener in self.listeners:
+            listener.status(self, status)
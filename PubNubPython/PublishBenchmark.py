@@ -0,0 +1,132 @@
+# PublishBenchmark.py
+
+# Example commands to run this program: python3 PublishBenchmark.py
+# Example commands to run this program with more messages: python3 PublishBenchmark.py --messages 100000 --subscribers 20
+
+# Publishing benchmark of the PubNub clients against LocalBroker.py: one client publishes --messages messages as fast as
+#   it can to a channel it is subscribed to itself (like client.py), and --subscribers other clients receive them
+# Each mode publishes the same messages in a different way:
+#   - unbatched: one pubnub.publish()...pn_async() call per message, with no limit on the requests in flight,
+#     and the publisher receiving its own messages back (what client1.py and client2.py did before Publisher.py)
+#   - pipelined: Publisher.py with one message per request, at most --max-in-flight requests in flight
+#   - batched: Publisher.py with --batch-size messages per request
+#   - batched-self: like batched, but without suppress_self_messages, so the publisher receives its own messages back
+# Reported: messages per second (until every subscriber received every message), requests sent, and the number of
+#   its own messages the publisher received
+
+import time
+import argparse
+
+from LocalPubNub import PNConfiguration, PubNub, SubscribeCallback
+from Publisher import Publisher, BATCH_SIZE, MAX_IN_FLIGHT
+from LocalBroker import spawn_broker
+
+# Channel the benchmark publishes to
+CHANNEL = 'bench'
+
+# Modes: (how messages are published, suppress_self_messages), where messages are published either with one
+#   pn_async() call each ('direct'), or with Publisher.py, one message per request ('single') or --batch-size ('batch')
+MODES = {
+    'unbatched': ('direct', False),
+    'pipelined': ('single', True),
+    'batched': ('batch', True),
+    'batched-self': ('batch', False),
+}
+
+# Listener counting the messages received
+class CountingListener(SubscribeCallback):
+    def __init__(self):
+        self.received = 0
+        self.subscribed = False
+
+    def status(self, pubnub, status):
+        if status.category.name == 'PNConnectedCategory':
+            self.subscribed = True
+
+    def message(self, pubnub, message):
+        self.received += 1
+
+# Connect a client named user_id to the broker, subscribed to CHANNEL, and return it with its listener
+def connect_client(host, port, user_id, suppress_self=False):
+    config = PNConfiguration()
+    config.user_id = user_id
+    config.broker_host = host
+    config.broker_port = port
+    config.suppress_self_messages = suppress_self
+    pubnub = PubNub(config)
+    listener = CountingListener()
+    pubnub.add_listener(listener)
+    pubnub.subscribe().channels(CHANNEL).execute()
+    while not listener.subscribed:
+        time.sleep(0.01)
+    return pubnub, listener
+
+# Publish num_messages messages in the given mode, and return the results as a dictionary
+# subscribers are the listeners of the receiving clients
+def run_mode(host, port, mode, subscribers, num_messages, payload_size, batch_size, max_in_flight, timeout=60):
+    publishing, suppress_self = MODES[mode]
+    pubnub, own = connect_client(host, port, f'publisher-{mode}', suppress_self)
+    for listener in subscribers:
+        listener.received = 0
+    acks = []
+    message = 'x' * payload_size
+
+    start = time.perf_counter()
+    if publishing == 'direct':
+        for i in range(num_messages):
+            pubnub.publish().channel(CHANNEL).message(message).pn_async(lambda result, status: acks.append(status))
+        requests = num_messages
+    else:
+        publisher = Publisher(pubnub, batch_size=batch_size if publishing == 'batch' else 1, max_in_flight=max_in_flight)
+        for i in range(num_messages):
+            publisher.publish(CHANNEL, message)
+        publisher.close(timeout)
+        requests = publisher.requests
+    deadline = start + timeout
+    while any(listener.received < num_messages for listener in subscribers) and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    # Give the publisher's own messages, if any are coming, time to arrive
+    time.sleep(0.2)
+    pubnub.stop()
+
+    received = min(listener.received for listener in subscribers)
+    return {
+        'mode': mode,
+        'messages': num_messages,
+        'requests': requests,
+        'msgs_per_sec': round(received / elapsed, 1),
+        'lost': num_messages - received,
+        'own_received': own.received,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publishing benchmark of the PubNub clients against LocalBroker.py')
+    parser.add_argument('--host', default='127.0.0.1', help='IP address the broker binds to (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=65450, help='port number the broker binds to (default: 65450)')
+    parser.add_argument('--modes', nargs='+', choices=tuple(MODES), default=list(MODES), help='modes to compare (default: all)')
+    parser.add_argument('--messages', type=int, default=20000, help='messages published per mode (default: 20000)')
+    parser.add_argument('--subscribers', type=int, default=10, help='clients receiving the messages (default: 10)')
+    parser.add_argument('--payload-size', type=int, default=64, help='characters per message (default: 64)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'messages per request in the batched modes (default: {BATCH_SIZE})')
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT,
+                        help=f'requests in flight with Publisher.py (default: {MAX_IN_FLIGHT})')
+    # Any unknown option is passed on to the broker, e.g. --max-queue 4194304
+    args, broker_args = parser.parse_known_args()
+
+    broker = spawn_broker(args.host, args.port, extra_args=broker_args)
+    try:
+        clients = [connect_client(args.host, args.port, f'subscriber-{i}') for i in range(args.subscribers)]
+        subscribers = [listener for pubnub, listener in clients]
+        print(f'{"mode":<14} {"messages":>9} {"requests":>9} {"msgs/s":>10} {"lost":>6} {"own received":>13}')
+        for mode in args.modes:
+            results = run_mode(args.host, args.port, mode, subscribers, args.messages, args.payload_size,
+                               args.batch_size, args.max_in_flight)
+            print(f'{mode:<14} {results["messages"]:>9} {results["requests"]:>9} {results["msgs_per_sec"]:>10} '
+                  f'{results["lost"]:>6} {results["own_received"]:>13}')
+        for pubnub, listener in clients:
+            pubnub.stop()
+    finally:
+        broker.terminate()
+        broker.wait()
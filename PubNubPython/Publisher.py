@@ -0,0 +1,263 @@
+# Publisher.py
+
+# Example commands to use it: see client.py
+#   publisher = Publisher(pubnub, batch_size=32, flush_interval=0.005, max_in_flight=4)
+#   publisher.publish('chan-1', 'hello')
+#   publisher.close()
+
+# Publishing pipeline of the PubNub clients, replacing one pubnub.publish()...pn_async() call per message with no limit
+#   on the requests in flight:
+#   - publish() only queues the message and returns; when the queue holds max_queue messages, it blocks until there is
+#     room again, so that a fast producer is slowed down instead of queueing without bound
+#   - a background thread sends the queued messages in batches of up to batch_size messages, as soon as a batch is full
+#     or flush_interval seconds after its first message was queued, whichever comes first
+#   - at most max_in_flight requests wait for their acknowledgement at any time
+#   - a request that fails (an error status other than a bad request, or no answer within request_timeout seconds)
+#     is sent again after an exponential backoff with jitter: backoff_base * 2 ** attempt seconds (at most backoff_max),
+#     up to max_retries times; after that its messages are counted as failed and passed to on_error
+# Retried requests can publish a message twice (if only the acknowledgement was lost): delivery is at least once
+# Batches need PubNub.publish_batch() (LocalPubNub.py); with the hosted service's SDK, which has no such call,
+#   every request holds a single message, but the queue, the in-flight cap and the retries still apply
+# meta, if given, is published with every message of a single-message request (publish().meta()), e.g. for the
+#   filter expressions of the hosted service (see client.py)
+
+import time
+import heapq
+import random
+import itertools
+import threading
+import collections
+
+# Status categories of the hosted service's SDK, where they are plain int constants rather than the enum members of
+#   LocalPubNub.py (see is_bad_request())
+try:
+    from pubnub.enums import PNStatusCategory as SDKStatusCategory
+except ImportError:
+    SDKStatusCategory = None
+
+# Default maximum number of messages per request
+BATCH_SIZE = 32
+
+# Default number of seconds a message waits for its batch to fill before being sent anyway
+FLUSH_INTERVAL = 0.005
+
+# Default maximum number of requests waiting for their acknowledgement
+MAX_IN_FLIGHT = 4
+
+# Default maximum number of messages queued but not sent yet
+MAX_QUEUE = 10000
+
+# Default retries of a failed request, and the backoff before them in seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 2.0
+
+# Default number of seconds after which a request without an answer counts as failed
+REQUEST_TIMEOUT = 5.0
+
+# One request: messages is a list of (channel, message), attempt the number of times it was already sent,
+#   and sent_at the time.monotonic() it was last sent
+class Request:
+    __slots__ = ('id', 'messages', 'attempt', 'sent_at')
+
+    def __init__(self, request_id, messages):
+        self.id = request_id
+        self.messages = messages
+        self.attempt = 0
+        self.sent_at = None
+
+# Return True if status tells that the request was refused as invalid, with either the SDK or LocalPubNub.py
+def is_bad_request(status):
+    category = status.category
+    if SDKStatusCategory is not None and category == SDKStatusCategory.PNBadRequestCategory:
+        return True
+    return getattr(category, 'name', None) == 'PNBadRequestCategory'
+
+class Publisher:
+    def __init__(self, pubnub, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_in_flight=MAX_IN_FLIGHT,
+                 max_queue=MAX_QUEUE, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 request_timeout=REQUEST_TIMEOUT, on_error=None, meta=None):
+        self.pubnub = pubnub
+        self.batched = hasattr(pubnub, 'publish_batch')
+        self.batch_size = batch_size if self.batched else 1
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+        self.on_error = on_error
+        self.meta = meta
+
+        # Everything below is shared with the receiving thread of pubnub, and guarded by condition
+        self.condition = threading.Condition()
+        # Messages not sent yet, oldest first, and the time.monotonic() the oldest one was queued
+        self.queue = collections.deque()
+        self.queued_at = None
+        # Requests waiting for their acknowledgement, as {id: Request}, and failed requests waiting to be sent again,
+        #   as a heap of (time they are due, id, Request)
+        self.in_flight = {}
+        self.retries = []
+        self.request_ids = itertools.count(1)
+        # Number of flush() calls waiting: while there is any, queued messages are sent without waiting for batches to fill
+        self.flushing = 0
+        self.closing = False
+
+        # Statistics: messages published (queued), acknowledged and failed, requests sent and sent again
+        self.published = 0
+        self.acked = 0
+        self.failed = 0
+        self.requests = 0
+        self.retried = 0
+
+        self.thread = threading.Thread(target=self.run, name='Publisher', daemon=True)
+        self.thread.start()
+
+    # Queue message to be published on channel, waiting while the queue is full
+    def publish(self, channel, message):
+        with self.condition:
+            while len(self.queue) >= self.max_queue and not self.closing:
+                self.condition.wait()
+            if self.closing:
+                raise RuntimeError('publisher is closed')
+            if not self.queue:
+                self.queued_at = time.monotonic()
+            self.queue.append((channel, message))
+            self.published += 1
+            # Wake up the background thread when a batch is full, or to start the flush interval of a new batch
+            if len(self.queue) == 1 or len(self.queue) >= self.batch_size:
+                self.condition.notify_all()
+
+    # Wait until every message published so far was acknowledged or failed (at most timeout seconds, if given)
+    # Returns True if nothing is left to send
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            try:
+                while self.queue or self.in_flight or self.retries:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                return True
+            finally:
+                self.flushing -= 1
+
+    # Flush, then stop the background thread; publish() cannot be called anymore
+    def close(self, timeout=None):
+        flushed = self.flush(timeout)
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        return flushed
+
+    # Body of the background thread: send requests whenever one is ready and fewer than max_in_flight are in flight
+    def run(self):
+        while True:
+            with self.condition:
+                request = self.next_request()
+                if request is None:
+                    return
+            self.send(request)
+
+    # Wait until a request can be sent and return it, or return None once closing
+    # A failed request that is due goes before new messages, so that messages keep their order as far as possible
+    def next_request(self):
+        while not self.closing:
+            now = time.monotonic()
+            self.expire_requests(now)
+            wake = None
+            if self.in_flight:
+                wake = min(request.sent_at for request in self.in_flight.values()) + self.request_timeout
+            if len(self.in_flight) < self.max_in_flight:
+                if self.retries and self.retries[0][0] <= now:
+                    return self.start(heapq.heappop(self.retries)[2], now)
+                if self.queue and (len(self.queue) >= self.batch_size or self.flushing
+                                   or now >= self.queued_at + self.flush_interval):
+                    count = min(self.batch_size, len(self.queue))
+                    messages = [self.queue.popleft() for i in range(count)]
+                    self.queued_at = now if self.queue else None
+                    # Room in the queue again: wake up publish() calls waiting for it
+                    self.condition.notify_all()
+                    return self.start(Request(next(self.request_ids), messages), now)
+                if self.retries:
+                    wake = self.retries[0][0] if wake is None else min(wake, self.retries[0][0])
+                if self.queue:
+                    flush_at = self.queued_at + self.flush_interval
+                    wake = flush_at if wake is None else min(wake, flush_at)
+            self.condition.wait(None if wake is None else max(0, wake - now))
+        return None
+
+    # Count request as in flight from now, and return it
+    # This is done before it is actually sent, since its answer can come back before send() returns
+    def start(self, request, now):
+        request.sent_at = now
+        self.in_flight[request.id] = request
+        self.requests += 1
+        return request
+
+    # Send request, outside of the lock, since sending can block
+    def send(self, request):
+        callback = lambda result, status: self.complete(request, status)
+        try:
+            if self.batched:
+                self.pubnub.publish_batch(request.messages, callback)
+            else:
+                channel, message = request.messages[0]
+                builder = self.pubnub.publish().channel(channel).message(message)
+                if self.meta is not None:
+                    builder = builder.meta(self.meta)
+                builder.pn_async(callback)
+        except OSError:
+            # The connection is gone: retry as if the request had failed
+            with self.condition:
+                if self.in_flight.pop(request.id, None) is not None:
+                    self.retry(request)
+
+    # Called with the answer to request (from the receiving thread of pubnub)
+    # flush() waits on the condition, so it is notified whatever happens here
+    def complete(self, request, status):
+        with self.condition:
+            try:
+                if self.in_flight.pop(request.id, None) is None:
+                    # It already timed out, and was sent again
+                    return
+                if not status.is_error():
+                    self.acked += len(request.messages)
+                elif is_bad_request(status):
+                    # Sending it again would fail again
+                    self.give_up(request, status)
+                else:
+                    self.retry(request)
+            finally:
+                self.condition.notify_all()
+
+    # Count every request in flight for longer than request_timeout as failed
+    def expire_requests(self, now):
+        for request in list(self.in_flight.values()):
+            if now - request.sent_at >= self.request_timeout:
+                del self.in_flight[request.id]
+                self.retry(request)
+
+    # Schedule request to be sent again after its backoff, unless it already was max_retries times
+    def retry(self, request):
+        if request.attempt >= self.max_retries:
+            self.give_up(request, None)
+            return
+        delay = min(self.backoff_max, self.backoff_base * 2 ** request.attempt) * random.uniform(0.5, 1.0)
+        request.attempt += 1
+        self.retried += 1
+        heapq.heappush(self.retries, (time.monotonic() + delay, request.id, request))
+        self.condition.notify_all()
+
+    # Give up on request: its messages are counted as failed, and passed to on_error with the last status
+    #   (None if the request timed out); on_error is called with the lock held, so it must not call the publisher
+    def give_up(self, request, status):
+        self.failed += len(request.messages)
+        if self.on_error is not None:
+            self.on_error(request.messages, status)
+        self.condition.notify_all()
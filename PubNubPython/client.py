@@ -0,0 +1,79 @@
+# client.py
+
+# Example commands to run this program: python3 client.py --user-id alice
+# Example commands to run this program against LocalBroker.py: python3 client.py --user-id alice --broker 127.0.0.1:65440
+# Example commands to run this program on several channels: python3 client.py --user-id bob --channels chan-1 chan-2
+# *Note: lines typed are published to the first channel; "exit" quits
+# *Note: to simulate many users at once, see simulator.py
+
+import os
+import argparse
+
+parser = argparse.ArgumentParser(description='Chat client of the PubNub channels')
+# The user ID has to differ between clients, since each one drops the messages published under its own ID
+parser.add_argument('--user-id', default=f'client-{os.getpid()}', help='user ID of this client (default: client-<pid>)')
+parser.add_argument('--channels', nargs='+', default=['chan-1'],
+                    help='channels to subscribe to; messages are published to the first one (default: chan-1)')
+# --broker host:port (or PUBNUB_LOCAL_BROKER=host:port) runs this client against LocalBroker.py (see LocalPubNub.py)
+#   instead of the hosted PubNub service
+parser.add_argument('--broker', default=os.environ.get('PUBNUB_LOCAL_BROKER'),
+                    help='host:port of LocalBroker.py to use instead of the hosted service')
+args = parser.parse_args()
+
+if args.broker:
+    from LocalPubNub import SubscribeCallback, PNStatusCategory, PNConfiguration, PubNub
+else:
+    from pubnub.callbacks import SubscribeCallback
+    from pubnub.enums import PNStatusCategory
+    from pubnub.pnconfiguration import PNConfiguration
+    from pubnub.pubnub import PubNub
+from Publisher import Publisher
+
+pnconfig = PNConfiguration()
+
+userId = args.user_id
+
+pnconfig.publish_key = 'pub'
+pnconfig.subscribe_key = 'sub'
+
+pnconfig.user_id = userId
+pnconfig.ssl = True
+# Our own messages are not even sent back to us: the local broker skips them with suppress_self_messages, and
+#   the hosted service with a filter expression on the metadata every message is published with (see Publisher.py)
+if args.broker:
+    pnconfig.suppress_self_messages = True
+    host, port = args.broker.rsplit(':', 1)
+    pnconfig.broker_host = host
+    pnconfig.broker_port = int(port)
+    meta = None
+else:
+    pnconfig.filter_expression = f"uuid != '{userId}'"
+    meta = {'uuid': userId}
+
+pubnub = PubNub(pnconfig)
+
+# Called with the messages that could not be published, even after retrying
+def my_publish_error(messages, status):
+    print(f"Could not publish {len(messages)} messages")
+
+class MySubscribeCallback(SubscribeCallback):
+    def presence(self, pubnub, presence):
+        pass
+    def status(self, pubnub, status):
+        pass
+    def message(self, pubnub, message):
+        if message.publisher == userId : return
+        print (f"From device {message.publisher} on {message.channel}: {message.message}")
+
+pubnub.add_listener(MySubscribeCallback())
+pubnub.subscribe().channels(args.channels).execute()
+
+# Messages are queued, and sent in batches with a bounded number of requests in flight (see Publisher.py)
+publisher = Publisher(pubnub, on_error=my_publish_error, meta=meta)
+
+while True:
+    msg = input("")
+    if msg == 'exit':
+        publisher.close(timeout=5)
+        os._exit(1)
+    publisher.publish(args.channels[0], str(msg))
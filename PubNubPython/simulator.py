@@ -0,0 +1,276 @@
+# simulator.py
+
+# Example commands to run this program: python3 simulator.py --users 300 --start-broker
+# Example commands to run this program against a running broker: python3 simulator.py --broker 127.0.0.1:65440 --users 500
+# Example commands to run this program with a scripted load: python3 simulator.py --users 500 --script 10:0.5 10:2 10:0.5
+# Example commands to run this program with a CSV report: python3 simulator.py --users 300 --format csv --output sim.csv
+# *Note: every virtual user is a connection (a file descriptor on both sides), so the open files limit (ulimit -n)
+#   has to be above the number of users
+
+# Virtual-user simulator of the chat clients (see client.py), against LocalBroker.py: --users virtual users run in
+#   this single process, on one asyncio event loop, instead of one client process per user
+# Each virtual user has its own connection to the broker, its own user ID (user-0, user-1, ...), and its own set of
+#   --channels-per-user channels, drawn at random (--seed) out of --channels channels, and it:
+#   - publishes messages to one of its channels at random, as a Poisson process at the rate of the current phase
+#     of --script: DURATION:RATE phases, played one after the other, RATE being messages per second per user
+#   - receives the messages of everyone else on its channels (its own are not sent back to it, as with client.py)
+# Every message carries the time.time_ns() it was published and the phase it belongs to, so that the receiving user
+#   measures its publish-to-delivery latency; since the channels of every user are known, so is the number of
+#   deliveries each publish should cause, and whatever did not arrive --drain seconds after the end of the script
+#   is reported as lost
+# The latency of each phase is printed to standard error as the script ends, and the report over the whole script is
+#   written like the one of ../Echo/MultiConnEchoClient.py
+# The same message arrives on every subscriber connection, so it is only decoded once (see receive_messages()),
+#   to keep the cost of this process out of the results as far as possible
+# Virtual users speak the protocol of LocalBroker.py directly, with asyncio streams, rather than going through
+#   LocalPubNub.py and Publisher.py like client.py: those run threads for every client, which would not fit hundreds
+#   of users on one event loop; so this load-tests the broker, not the adapter or Publisher.py (see PublishBenchmark.py)
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import asyncio
+import argparse
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Echo'))
+
+from EchoFraming import FrameParser, encode_frame
+from LatencyHistogram import LatencyHistogram
+from MultiConnEchoClient import write_report
+from LocalPubNub import BROKER_ADDRESS
+from LocalBroker import spawn_broker
+
+# Number of virtual users connecting at the same time
+CONNECT_BATCH = 200
+
+# One virtual user: its connection, and the channels it is subscribed to
+class VirtualUser:
+    __slots__ = ('user_id', 'channels', 'reader', 'writer', 'subscribed', 'receiver')
+
+    def __init__(self, user_id, channels):
+        self.user_id = user_id
+        self.channels = channels
+        self.reader = None
+        self.writer = None
+        self.subscribed = None
+        self.receiver = None
+
+# Return request (a dictionary) as one frame
+def encode(request):
+    return encode_frame(json.dumps(request, separators=(',', ':')).encode())
+
+# Parse the --script phases, "DURATION:RATE" each, into SimpleNamespaces also holding the statistics of the phase
+def parse_script(script):
+    phases = []
+    for step in script:
+        try:
+            duration, rate = (float(value) for value in step.split(':'))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid phase {step!r}, expected DURATION:RATE')
+        phases.append(types.SimpleNamespace(duration=duration, rate=rate, start=None, end=None, published=0,
+                                            expected=0, delivered=0, histogram=LatencyHistogram()))
+    return phases
+
+# Receive the frames of one user until its connection closes, and account for every one of them
+def receive_messages(user, sim):
+    async def receive():
+        parser = FrameParser()
+        while True:
+            data = await user.reader.read(65536)
+            if not data:
+                break
+            now = time.time_ns()
+            parser.feed(data)
+            for payload in parser.frames():
+                # The same message arrives on every subscriber: only decode it when it differs from the last one
+                if payload != sim.last_payload:
+                    sim.last_payload = payload
+                    sim.last_event = json.loads(payload)
+                event = sim.last_event
+                op = event['op']
+                if op == 'message':
+                    message = event['message']
+                    phase = sim.phases[message['phase']]
+                    latency = (now - message['sent_ns']) // 1000
+                    phase.delivered += 1
+                    phase.histogram.record(latency)
+                    sim.delivered += 1
+                    sim.histogram.record(latency)
+                elif op == 'published':
+                    sim.acked += 1
+                elif op == 'subscribed':
+                    user.subscribed.set()
+                elif op == 'error':
+                    sim.errors += 1
+    return asyncio.ensure_future(receive())
+
+# Connect user to the broker at (host, port), and wait until it is subscribed to its channels
+async def connect_user(user, host, port, sim):
+    user.reader, user.writer = await asyncio.open_connection(host, port)
+    user.subscribed = asyncio.Event()
+    user.receiver = receive_messages(user, sim)
+    user.writer.write(encode({'op': 'hello', 'user_id': user.user_id, 'skip_self': True})
+                      + encode({'op': 'subscribe', 'channels': user.channels}))
+    await user.writer.drain()
+    await asyncio.wait_for(user.subscribed.wait(), timeout=10)
+
+# Publish the messages of user, phase after phase of the script; rng draws its arrival times and channels
+async def publish_messages(user, sim, rng, pad):
+    loop = asyncio.get_running_loop()
+    for index, phase in enumerate(sim.phases):
+        if phase.rate > 0:
+            # Poisson arrivals: exponential gaps between messages, with the phase rate as mean rate
+            at = phase.start + rng.expovariate(phase.rate)
+            while at < phase.end:
+                await asyncio.sleep(at - loop.time())
+                channel = rng.choice(user.channels)
+                user.writer.write(encode({'op': 'publish', 'channel': channel,
+                                          'message': {'sent_ns': time.time_ns(), 'phase': index, 'pad': pad}}))
+                # Every subscriber of the channel but the publisher itself should receive it
+                expected = sim.audience[channel] - 1
+                phase.published += 1
+                phase.expected += expected
+                sim.published += 1
+                sim.expected += expected
+                await user.writer.drain()
+                at += rng.expovariate(phase.rate)
+        await asyncio.sleep(max(0, phase.end - loop.time()))
+
+# Run the simulation against the broker at (host, port), and return its results as a dictionary
+async def simulate(host, port, num_users, num_channels, channels_per_user, phases, payload_size=64, drain=5, seed=1):
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    channels = [f'chan-{i}' for i in range(num_channels)]
+    users = [VirtualUser(f'user-{i}', rng.sample(channels, channels_per_user)) for i in range(num_users)]
+    sim = types.SimpleNamespace(
+        phases=phases,
+        # Number of subscribers of each channel
+        audience={name: 0 for name in channels},
+        published=0,
+        acked=0,
+        expected=0,
+        delivered=0,
+        errors=0,
+        last_payload=None,
+        last_event=None,
+        histogram=LatencyHistogram(),
+    )
+    for user in users:
+        for name in user.channels:
+            sim.audience[name] += 1
+
+    start = time.perf_counter()
+    try:
+        for first in range(0, num_users, CONNECT_BATCH):
+            await asyncio.gather(*(connect_user(user, host, port, sim) for user in users[first:first + CONNECT_BATCH]))
+        connect_seconds = time.perf_counter() - start
+
+        # Every phase starts where the previous one ends, whatever the users are doing
+        at = loop.time() + 0.1
+        for phase in phases:
+            phase.start = at
+            phase.end = at = at + phase.duration
+        start = time.perf_counter()
+        await asyncio.gather(*(publish_messages(user, sim, random.Random(rng.random()), 'x' * payload_size)
+                               for user in users))
+        elapsed = time.perf_counter() - start
+
+        # Wait for the messages in flight to reach every subscriber
+        deadline = loop.time() + drain
+        while (sim.delivered < sim.expected or sim.acked < sim.published) and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        for user in users:
+            if user.writer is not None:
+                user.writer.close()
+            if user.receiver is not None:
+                user.receiver.cancel()
+        await asyncio.gather(*(user.receiver for user in users if user.receiver is not None), return_exceptions=True)
+
+    return {
+        'users': num_users,
+        'channels': num_channels,
+        'channels_per_user': channels_per_user,
+        'connect_seconds': round(connect_seconds, 3),
+        'duration': round(elapsed, 3),
+        'published': sim.published,
+        'acked': sim.acked,
+        'errors': sim.errors,
+        'publishes_per_sec': round(sim.published / elapsed, 1),
+        'expected_deliveries': sim.expected,
+        'delivered': sim.delivered,
+        'lost': sim.expected - sim.delivered,
+        'deliveries_per_sec': round(sim.delivered / elapsed, 1),
+        'latency_us': sim.histogram.summary(),
+    }
+
+# Print the deliveries and latency of every phase of the script to standard error
+def print_phases(phases):
+    print(f'{"phase":>5} {"seconds":>8} {"rate/user":>10} {"published":>10} {"delivered":>10} {"lost":>7} '
+          f'{"p50 ms":>8} {"p99 ms":>8} {"p99.9 ms":>9}', file=sys.stderr)
+    for index, phase in enumerate(phases):
+        latency = phase.histogram.summary()
+        print(f'{index:>5} {phase.duration:>8g} {phase.rate:>10g} {phase.published:>10} {phase.delivered:>10} '
+              f'{phase.expected - phase.delivered:>7} {latency["p50"] / 1000:>8.1f} {latency["p99"] / 1000:>8.1f} '
+              f'{latency["p99.9"] / 1000:>9.1f}', file=sys.stderr)
+
+# Parse the commands used to run this program
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Virtual-user simulator of the chat clients, against LocalBroker.py')
+    parser.add_argument('--broker', default=os.environ.get('PUBNUB_LOCAL_BROKER', BROKER_ADDRESS),
+                        help=f'host:port of the broker (default: $PUBNUB_LOCAL_BROKER or {BROKER_ADDRESS})')
+    # --start-broker runs LocalBroker.py on the --broker address for the time of the simulation
+    parser.add_argument('--start-broker', action='store_true', help='start the broker, instead of using a running one')
+    parser.add_argument('--users', type=int, default=100, help='number of virtual users (default: 100)')
+    parser.add_argument('--channels', type=int, default=10, help='number of channels (default: 10)')
+    parser.add_argument('--channels-per-user', type=int, default=2, help='channels each user subscribes to (default: 2)')
+    parser.add_argument('--script', nargs='+', default=['10:1'],
+                        help='phases of the load, as DURATION:RATE with RATE in messages per second per user (default: 10:1)')
+    parser.add_argument('--payload-size', type=int, default=64, help='bytes of padding per message (default: 64)')
+    parser.add_argument('--drain', type=float, default=5,
+                        help='seconds to wait for the last messages after the script (default: 5)')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the channels and arrival times drawn (default: 1)')
+    parser.add_argument('--format', choices=('json', 'csv'), default='json', help='report format (default: json)')
+    parser.add_argument('--output', help='file the report is written to (default: standard output)')
+    args, broker_args = parser.parse_known_args()
+    if not 1 <= args.channels_per_user <= args.channels:
+        parser.error('--channels-per-user has to be between 1 and --channels')
+    try:
+        args.phases = parse_script(args.script)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+    # Any unknown option is passed on to the broker started with --start-broker, e.g. --max-queue 4194304
+    if broker_args and not args.start_broker:
+        parser.error(f'unrecognized arguments: {" ".join(broker_args)}')
+    args.broker_args = broker_args
+    return args
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    host, port = args.broker.rsplit(':', 1)
+    port = int(port)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.users + 16 > hard:
+        sys.exit(f'--users is too high for the limit of {hard} open files')
+
+    broker = spawn_broker(host, port, extra_args=args.broker_args) if args.start_broker else None
+    try:
+        results = asyncio.run(simulate(host, port, args.users, args.channels, args.channels_per_user, args.phases,
+                                       args.payload_size, args.drain, args.seed))
+    finally:
+        if broker is not None:
+            broker.terminate()
+            broker.wait()
+
+    print_phases(args.phases)
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_report(results, output, args.format)
+    else:
+        write_report(results, sys.stdout, args.format)